@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import importlib
+import cPickle as pickle
+from itertools import izip
+from weakref import WeakKeyDictionary
+
+import numpy as np
+from scipy.sparse import issparse, csr_matrix
+
+
+_fingerprints = WeakKeyDictionary()
+
+
+def _mix(x):
+    """splitmix64 finalizer (on uint64 arrays)"""
+    with np.errstate(over='ignore'):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+        return x ^ (x >> np.uint64(31))
+
+def _hash_node(node):
+    # repr (unlike hash) gives the same digest in every process
+    return np.frombuffer(hashlib.md5(repr(node)).digest()[:8], dtype=np.uint64)[0]
+
+def get_graph_fingerprint(graph):
+    """return a digest of the nodes (in order) and edges of a graph
+    (edge attributes are not included)
+
+    nodes are hashed by their repr so the digest is the same in every
+    process; it is memoized for each graph object, so graphs must not be
+    changed after they are used
+    """
+    size = (graph.number_of_nodes(), graph.number_of_edges())
+    memo = _fingerprints.get(graph)
+    if memo is not None and memo[0] == size:
+        return memo[1]
+
+    hashes = dict((n, _hash_node(n)) for n in graph)
+    nodes = np.fromiter((hashes[n] for n in graph), dtype=np.uint64, count=len(hashes))
+    digest = hashlib.sha1(nodes.tobytes())
+    digest.update(str(graph.is_directed()))
+    # edges are summed so that the digest does not depend on their order
+    total = np.uint64(0)
+    with np.errstate(over='ignore'):
+        for h, (_, neighbors) in izip(nodes, graph.adjacency_iter()):
+            if neighbors:
+                neighbor_hashes = np.fromiter((hashes[n] for n in neighbors),
+                    dtype=np.uint64, count=len(neighbors))
+                total += _mix(neighbor_hashes + _mix(h)).sum(dtype=np.uint64)
+    digest.update(str(total))
+    fingerprint = digest.hexdigest()
+    _fingerprints[graph] = (size, fingerprint)
+    return fingerprint
+
+
+def _is_object(value):
+    """whether a value is an instance of a class saved through its attributes"""
+    return hasattr(value, '__dict__') and not callable(value) and \
+        type(value).__module__ != '__builtin__' and not hasattr(value, '__slots__')
+
+def _is_items(value):
+    return isinstance(value, tuple) or (isinstance(value, dict) and
+        all(isinstance(k, basestring) for k in value))
+
+def _get_size(value):
+    """return the approximate bytes of a value in memory"""
+    if isinstance(value, np.memmap):
+        return 0  # already on disk
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if issparse(value):
+        value = value.tocsr()
+        return value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+    if _is_items(value):
+        values = value.values() if isinstance(value, dict) else value
+        return sum(_get_size(x) for x in values)
+    if _is_object(value):
+        return _get_size(vars(value))
+    return sys.getsizeof(value)
+
+def _save_value(path, value):
+    """save a value as .npy files that can be memory-mapped
+
+    objects are saved through their attributes, and values other than
+    arrays, sparse matrices, tuples, dicts and objects are pickled
+    """
+    os.makedirs(path)
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        meta = {'type': 'array'}
+        np.save(os.path.join(path, 'array.npy'), value)
+    elif issparse(value):
+        value = value.tocsr()
+        meta = {'type': 'csr', 'shape': value.shape}
+        for k in ('data', 'indices', 'indptr'):
+            np.save(os.path.join(path, k + '.npy'), getattr(value, k))
+    elif _is_items(value) or _is_object(value):
+        if _is_object(value):
+            cls = type(value)
+            meta = {'type': 'object', 'module': cls.__module__, 'class': cls.__name__}
+            items = vars(value).items()
+        else:
+            meta = {'type': type(value).__name__}
+            items = value.items() if isinstance(value, dict) else enumerate(value)
+        meta['keys'] = []
+        for i, (k, x) in enumerate(items):
+            _save_value(os.path.join(path, str(i)), x)
+            meta['keys'].append(k)
+    else:
+        meta = {'type': 'pickle'}
+        with open(os.path.join(path, 'value.pickle'), 'wb') as output:
+            pickle.dump(value, output, pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(path, 'meta.json'), 'w') as output:
+        json.dump(meta, output)
+
+def _load_value(path):
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    def _load(name):
+        return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+    if meta['type'] == 'array':
+        return _load('array')
+    if meta['type'] == 'csr':
+        return csr_matrix((_load('data'), _load('indices'), _load('indptr')),
+            shape=meta['shape'], copy=False)
+    if meta['type'] == 'pickle':
+        with open(os.path.join(path, 'value.pickle'), 'rb') as f:
+            return pickle.load(f)
+    values = [_load_value(os.path.join(path, str(i))) for i in xrange(len(meta['keys']))]
+    if meta['type'] == 'object':
+        cls = getattr(importlib.import_module(meta['module']), meta['class'])
+        value = cls.__new__(cls)
+        value.__dict__.update(zip(meta['keys'], values))
+        return value
+    if meta['type'] == 'dict':
+        return dict(zip(meta['keys'], values))
+    return tuple(values)
+
+
+class ArtifactRegistry(object):
+    """cache of trained artifacts (bigraph matrices, feature matrices,
+    similarities...) keyed by (graph fingerprint, kind, parameters)
+
+    at most max_count artifacts are kept, and the least recently used ones
+    are dropped beyond it. If the artifacts held in memory exceed
+    memory_limit (in MB), the least recently used ones are dropped too, or
+    replaced by their memory-mapped files if spill_path is given
+
+    if spill_path is given, artifacts are also saved in a directory of
+    spill_path named after a digest of their key (arrays and sparse
+    matrices as .npy files, objects through their attributes and other
+    values pickled), and later processes load them instead of building
+    them again (artifacts read from data files are keyed by the file
+    paths, so spill_path must be emptied when the data changes)
+    """
+
+    def __init__(self, spill_path=None, memory_limit=None, max_count=None):
+        self.spill_path = spill_path
+        self.memory_limit = memory_limit
+        self.max_count = max_count
+        self.artifacts = {}
+        self.sizes = {}  # bytes of artifacts in memory
+        self.order = []  # keys from least to most recently used
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, graph, kind, parameters, build):
+        """return the artifact of a graph, calling build() to create it
+        if it is neither in the registry nor under spill_path
+        """
+        key = (get_graph_fingerprint(graph), kind, parameters)
+        if key in self.artifacts:
+            self.hits += 1
+            self.order.remove(key)
+            self.order.append(key)
+            return self.artifacts[key]
+        value = self._load(key)
+        if value is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            value = build()
+            self._save(key, value)
+            self.sizes[key] = _get_size(value)
+        self.artifacts[key] = value
+        self.order.append(key)
+        self._evict()
+        return value
+
+    def _get_path(self, key):
+        # the repr of keys only holds strings, numbers and tuples of them
+        return os.path.join(self.spill_path, hashlib.sha1(repr(key)).hexdigest())
+
+    def _load(self, key):
+        """return the artifact of a key saved under spill_path (with
+        memory-mapped arrays), or None
+        """
+        if self.spill_path is None:
+            return None
+        path = self._get_path(key)
+        try:
+            with open(os.path.join(path, 'key')) as f:
+                if f.read() != repr(key):
+                    return None
+            return _load_value(path)
+        except (IOError, ImportError, AttributeError):  # missing or stale
+            return None
+
+    def _save(self, key, value):
+        if self.spill_path is None:
+            return
+        path = self._get_path(key)
+        if os.path.isdir(path):
+            return
+        # write a temporary directory first so that other processes never
+        # read a partial artifact
+        temporary = '%s.tmp-%d' % (path, os.getpid())
+        shutil.rmtree(temporary, True)
+        try:
+            _save_value(temporary, value)
+        except (pickle.PicklingError, TypeError):  # kept in memory only
+            shutil.rmtree(temporary, True)
+            return
+        with open(os.path.join(temporary, 'key'), 'w') as output:
+            output.write(repr(key))
+        try:
+            os.rename(temporary, path)
+        except OSError:  # saved by another process meanwhile
+            shutil.rmtree(temporary, True)
+
+    def _evict(self):
+        limit = None if self.memory_limit is None else self.memory_limit * 2**20
+        for key in list(self.order):
+            if self.max_count is not None and len(self.order) > self.max_count:
+                self._drop(key)
+            elif limit is not None and key in self.sizes and \
+                    sum(self.sizes.itervalues()) > limit:
+                path = None if self.spill_path is None else self._get_path(key)
+                if path is not None and os.path.isdir(path):
+                    self.artifacts[key] = _load_value(path)
+                    del self.sizes[key]
+                else:
+                    self._drop(key)
+
+    def _drop(self, key):
+        del self.artifacts[key]
+        self.sizes.pop(key, None)
+        self.order.remove(key)
+
+    def clear(self):
+        """drop the artifacts in memory (the files under spill_path are kept)"""
+        self.artifacts.clear()
+        self.sizes.clear()
+        del self.order[:]
+
+
+# artifacts are shared by the recommenders of a process, so a few of them
+# are enough (see configure_registry to keep more)
+DEFAULT_MAX_COUNT = 16
+
+_registry = ArtifactRegistry(max_count=DEFAULT_MAX_COUNT)
+
+
+def get_registry():
+    return _registry
+
+def configure_registry(spill_path=None, memory_limit=None, max_count=DEFAULT_MAX_COUNT):
+    """replace the registry of the process (dropping its artifacts)"""
+    global _registry
+    _registry.clear()
+    _registry = ArtifactRegistry(spill_path=spill_path, memory_limit=memory_limit,
+        max_count=max_count)
+    return _registry
+
+def get_artifact(graph, kind, parameters, build):
+    return _registry.get(graph, kind, parameters, build)
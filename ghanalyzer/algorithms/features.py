@@ -82,8 +82,8 @@ class DescriptionNMF(DescriptionVector):
         return words[indices]
 
 
-def load_language_features(data_path, repos):
-    languages = load_repository_languages(data_path)
+def load_language_features(data_path, repos, workers=1):
+    languages = load_repository_languages(data_path, workers=workers)
     languages[None] = {}  # add dummy data item
     languages = LanguageVector(languages, normalize=False)
     default_index = languages.sample_indices[None]
@@ -91,8 +91,8 @@ def load_language_features(data_path, repos):
     return languages.features[indices, :]
 
 
-def load_description_features(data_path, repos):
-    descriptions = load_repository_descriptions(data_path)
+def load_description_features(data_path, repos, workers=1):
+    descriptions = load_repository_descriptions(data_path, workers=workers)
     descriptions[None] = ''  # add dummy data item
     descriptions = DescriptionVector(descriptions, tfidf=True)
     default_index = descriptions.sample_indices[None]
@@ -100,11 +100,13 @@ def load_description_features(data_path, repos):
     return descriptions.features[indices, :]
 
 
-def load_follow_features(data_path, users):
+def load_follow_features(data_path, users, workers=1):
     followers = defaultdict(set)
     followees = defaultdict(set)
     path = os.path.join(data_path, 'Follow.jsonl')
-    with JsonLineData(path) as data:
+    # the order of items does not matter when collecting sets
+    with JsonLineData(path, keys=('follower', 'followee'), workers=workers,
+            ordered=False) as data:
         for item in data:
             s, t = item.get('follower'), item.get('followee')
             if s is None or t is None:
@@ -1,4 +1,4 @@
-from collections import defaultdict
+from itertools import chain
 
 import numpy as np
 import networkx as nx
@@ -8,7 +8,8 @@ from sklearn.preprocessing import StandardScaler
 from ghanalyzer.algorithms.graphs import AdjacencyMatrix, BigraphSimilarity
 from ghanalyzer.algorithms.features import LanguageVector
 from ghanalyzer.algorithms.recommenders import UserCFRecommender, ItemCFRecommender
-from ghanalyzer.io import load_accounts, load_repositories, load_repository_languages
+from ghanalyzer.io import load_repository_languages
+from ghanalyzer.io.attributes import NodeAttributes, load_node_attribute_columns
 from ghanalyzer.models import Entity, User, Repository
 
 
@@ -81,30 +82,45 @@ class ConstantFeature(EdgeFeature):
 
 
 class NodeFeature(EdgeFeature):
+    """numeric attributes of the node of class node_cls on each edge
+
+    attributes are gathered from a NodeAttributes column store, built from
+    the crawled data (if data_path is given) updated with the attributes
+    of the graph nodes, unless a store is given as `attributes`
+    """
     node_cls = Entity
     keys = []
 
-    def __init__(self, adj, data_path=None, standardize=True):
+    def __init__(self, adj, data_path=None, standardize=True, attributes=None):
         super(NodeFeature, self).__init__(adj)
         self.feature_count = len(self.keys)
+        if attributes is None:
+            attributes = self._load_attributes(data_path)
+        self.attributes = attributes
+        self.features = self._create_node_feature_matrix(standardize)
+
+    def _load_attributes(self, data_path):
+        nodes = [n for n in self.nodes if isinstance(n, self.node_cls)]
+        items = ((n, {k: self.graph.node[n][k] for k in self.keys if k in self.graph.node[n]})
+            for n in nodes)
         if data_path is not None:
-            self.entities = self._load_entities(data_path)
-        else:
-            self.entities = defaultdict(dict)
-        self.features = self._create_feature_matrix(self._get_feature, standardize)
-
-    def _load_entities(self, path):
-        raise NotImplementedError()
-
-    def _get_feature(self, u, v, root=None):
-        target = self._find_node((u, v), self.node_cls)
-        if target is None:
-            return
-        item = self.entities[target.id]
-        if target in self.graph:
-            item.update(self.graph.node[target])
-        feature = [float(item.get(k) or 0) for k in self.keys]
-        return feature
+            # attributes of graph nodes take precedence over crawled data
+            loaded = load_node_attribute_columns(data_path, nodes, keys=self.keys)
+            items = chain(((n, loaded.get(n)) for n in nodes), items)
+        return NodeAttributes.from_items(nodes, items)
+
+    def _create_node_feature_matrix(self, standardize=True):
+        # the node of an edge (u, v) is u if it is of node_cls, otherwise v
+        is_node = np.array([isinstance(n, self.node_cls) for n in self.nodes], dtype=bool)
+        rows = np.repeat(np.arange(len(self.nodes)), np.diff(self.indptr))
+        columns = self.indices
+        targets = np.where(is_node[rows], rows, np.where(is_node[columns], columns, -1))
+        node_rows = self.attributes.get_rows(self.nodes)
+        edge_rows = np.where(targets >= 0, node_rows[targets], -1)
+        features = self.attributes.gather(self.keys, edge_rows)
+        if standardize:
+            features = StandardScaler().fit_transform(features)
+        return features
 
     def get_feature_matrix(self, root=None):
         return self.features
@@ -114,18 +130,12 @@ class UserFeature(NodeFeature):
     node_cls = User
     keys = ['public_repos', 'public_gists', 'followers', 'following', 'hireable']
 
-    def _load_entities(self, path):
-        return load_accounts(path)
-
 
 class RepositoryFeature(NodeFeature):
     node_cls = Repository
     keys = ['fork', 'open_issues_count', 'has_wiki', 'has_downloads', 'forks_count',
         'has_issues', 'stargazers_count', 'size']
 
-    def _load_entities(self, path):
-        return load_repositories(path)
-
 
 class LanguageFeature(EdgeFeature):
     def __init__(self, adj, data_path, standardize=True):
@@ -177,6 +187,9 @@ class CombinedFeature(EdgeFeature):
 
 
 class SimilarityFeature(EdgeFeature):
+    """similarities between the root node and the node of each edge
+    (only the similarity rows of the root are computed)
+    """
     feature_count = 2
 
     def __init__(self, adj, similarity, standardize=True):
@@ -184,6 +197,14 @@ class SimilarityFeature(EdgeFeature):
         assert isinstance(similarity, BigraphSimilarity)
         self.similarity = similarity
         self.standardize = standardize
+        # positions of the bigraph sources and targets among the graph nodes
+        self.source_positions = self._get_positions(similarity.bigraph.sources)
+        self.target_positions = self._get_positions(similarity.bigraph.targets)
+
+    def _get_positions(self, nodes):
+        positions = np.array([self.node_indices.get(n, -1) for n in nodes], dtype=np.int64)
+        found = np.flatnonzero(positions >= 0)
+        return found, positions[found]
 
     def get_feature_matrix(self, root=None):
         root = self.nodes[root]
@@ -199,14 +220,10 @@ class SimilarityFeature(EdgeFeature):
             raise ValueError('unable to measure similarities between the root node and other nodes')
 
         node_features = np.zeros((len(self.nodes), 2))
-        for s, node in enumerate(self.similarity.bigraph.sources):
-            index = self.node_indices.get(node, None)
-            if index is not None:
-                node_features[index, 0] = source_similarity[r, s]
-        for t, node in enumerate(self.similarity.bigraph.targets):
-            index = self.node_indices.get(node, None)
-            if index is not None:
-                node_features[index, 1] = target_similarity[r, t]
+        found, positions = self.source_positions
+        node_features[positions, 0] = source_similarity.get_row(r)[found]
+        found, positions = self.target_positions
+        node_features[positions, 1] = target_similarity.get_row(r)[found]
 
         # treat the feature of node v as the feature of edge (u, v)
         features = node_features[self.indices, :]
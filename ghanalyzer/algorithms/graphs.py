@@ -1,9 +1,15 @@
+import os
+import tempfile
+
+import numpy as np
 import networkx as nx
-from scipy.sparse import dok_matrix
+from scipy.sparse import issparse, coo_matrix, csr_matrix
 from sklearn.preprocessing import normalize
 from sklearn.metrics.pairwise import linear_kernel
 
 import ghanalyzer.models
+from ghanalyzer.algorithms.artifacts import get_artifact
+from ghanalyzer.models import Entity
 
 
 def filter_edges(graph, edge_filter):
@@ -21,6 +27,32 @@ def get_nodes(graph, node_class):
     return [n for n in graph if isinstance(n, node_class)]
 
 
+def get_entity_positions(nodes):
+    """return an array mapping entity indices (Entity._index) to positions
+    in nodes (-1 for other entities), or None if some nodes are not entities
+
+    the array only goes up to the largest index of the nodes, so indices
+    of other entities should be looked up with lookup_entity_positions
+    """
+    if not all(isinstance(n, Entity) for n in nodes):
+        return None
+    indices = np.fromiter((n._index for n in nodes), dtype=np.int64, count=len(nodes))
+    positions = np.empty((indices.max() + 1 if indices.size else 0,), dtype=np.int64)
+    positions.fill(-1)
+    positions[indices] = np.arange(len(nodes))
+    return positions
+
+def lookup_entity_positions(positions, indices):
+    """return the positions of entity indices (-1 for negative indices and
+    indices beyond the positions array)
+    """
+    result = np.empty(indices.shape, dtype=np.int64)
+    result.fill(-1)
+    valid = (indices >= 0) & (indices < positions.size)
+    result[valid] = positions[indices[valid]]
+    return result
+
+
 class Bigraph(object):
     def __init__(self, graph, source_cls, target_cls, weight=None, dtype=float):
         self.graph = graph
@@ -30,65 +62,302 @@ class Bigraph(object):
         self.targets = list(get_nodes(graph, target_cls))
         self.source_indices = {x: i for i, x in enumerate(self.sources)}
         self.target_indices = {x: i for i, x in enumerate(self.targets)}
+        self.key = (getattr(source_cls, '__name__', source_cls),
+            getattr(target_cls, '__name__', target_cls), weight, np.dtype(dtype).str)
+
+    def get_artifact(self, kind, parameters, build):
+        """return an artifact derived from this bigraph from the artifact
+        registry (build() is called only if it is not there yet)
+        """
+        return get_artifact(self.graph, kind, self.key + tuple(parameters), build)
+
+    def _get_edges(self):
+        """return (source, target, data) of the edges from sources to targets
+        as arrays of source positions and target positions and a list of data
+        """
+        edges = [(s, t, d) for s in self.sources for t, d in self.graph[s].iteritems()]
+        source_positions = get_entity_positions(self.sources)
+        target_positions = get_entity_positions(self.targets)
+        if source_positions is None or target_positions is None:
+            target_indices = self.target_indices
+            rows = np.array([self.source_indices[s] for s, _, _ in edges], dtype=np.int64)
+            cols = np.array([target_indices.get(t, -1) for _, t, _ in edges], dtype=np.int64)
+        else:
+            # other neighbors (non-targets) get -1
+            count = len(edges)
+            rows = source_positions[np.fromiter((s._index for s, _, _ in edges),
+                dtype=np.int64, count=count)]
+            cols = np.fromiter((getattr(t, '_index', -1) for _, t, _ in edges),
+                dtype=np.int64, count=count)
+            cols = lookup_entity_positions(target_positions, cols)
+        return rows, cols, [d for _, _, d in edges]
 
     def _build_matrix(self):
-        a = len(self.sources)
-        b = len(self.targets)
-        m = dok_matrix((a, b), dtype=self.dtype)
-        for source, i in self.source_indices.iteritems():
-            for target, data in self.graph[source].iteritems():
-                j = self.target_indices.get(target, None)
-                if j is None:
-                    continue
-                m[i, j] = data.get(self.weight, 1)
+        rows, cols, data = self._get_edges()
+        selected = cols >= 0
+        weights = np.array([d.get(self.weight, 1) for d in data], dtype=self.dtype)
+        shape = (len(self.sources), len(self.targets))
+        m = coo_matrix((weights[selected], (rows[selected], cols[selected])),
+            shape=shape, dtype=self.dtype).tocsr()
+        m.eliminate_zeros()
         return m
 
     @property
     def matrix(self):
+        """(source, target) matrix in CSR format"""
         if not hasattr(self, '_matrix'):
-            self._matrix = self._build_matrix()
+            self._matrix = self.get_artifact('bigraph', (), self._build_matrix)
         return self._matrix
 
+    @property
+    def transpose_matrix(self):
+        """(target, source) matrix in CSR format (the transpose of matrix)"""
+        if not hasattr(self, '_transpose_matrix'):
+            self._transpose_matrix = self.get_artifact('bigraph-transpose', (),
+                lambda: self.matrix.T.tocsr())
+        return self._transpose_matrix
+
 
 class AdjacencyMatrix(object):
     def __init__(self, graph, format='csr', weight=None, dtype=None):
         self.graph = graph
         self.nodes = self.graph.nodes()
         self.node_indices = {n: i for i, n in enumerate(self.nodes)}
-        self.matrix = nx.to_scipy_sparse_matrix(self.graph, nodelist=self.nodes,
-            dtype=dtype, weight=weight, format=format)
+        positions = get_entity_positions(self.nodes)
+        if positions is None:
+            self.matrix = nx.to_scipy_sparse_matrix(self.graph, nodelist=self.nodes,
+                dtype=dtype, weight=weight, format=format)
+        else:
+            self.matrix = self._build_matrix(positions, weight, dtype).asformat(format)
+
+    def _build_matrix(self, positions, weight, dtype):
+        """same as nx.to_scipy_sparse_matrix for graphs of entities, but
+        looking nodes up by their entity indices
+        """
+        edges = self.graph.edges(data=True)
+        count = len(edges)
+        row = positions[np.fromiter((u._index for u, _, _ in edges), dtype=np.int64, count=count)]
+        col = positions[np.fromiter((v._index for _, v, _ in edges), dtype=np.int64, count=count)]
+        data = np.array([d.get(weight, 1) for _, _, d in edges])
+        if not self.graph.is_directed():
+            # symmetrize (self loops only once)
+            other = row != col
+            row, col = np.concatenate((row, col[other])), np.concatenate((col, row[other]))
+            data = np.concatenate((data, data[other]))
+        size = len(self.nodes)
+        return coo_matrix((data, (row, col)), shape=(size, size), dtype=dtype)
+
+
+class SimilarityKernel(object):
+    """cosine similarities between the rows of two L2-normalized feature
+    matrices (dense or sparse), computed on demand block_size rows at a time
+    """
+
+    def __init__(self, left, right, block_size=1024):
+        self.left = left
+        self.right = right
+        self.block_size = block_size
+        self.shape = (left.shape[0], right.shape[0])
+
+    @property
+    def T(self):
+        return SimilarityKernel(self.right, self.left, self.block_size)
+
+    def get_rows(self, rows):
+        """return the dense similarity rows of the given row indices"""
+        rows = np.asarray(rows, dtype=np.int64)
+        result = np.empty((rows.size, self.shape[1]))
+        for start in xrange(0, rows.size, self.block_size):
+            block = rows[start:start + self.block_size]
+            result[start:start + block.size] = linear_kernel(self._take(block), self.right)
+        return result
+
+    def _take(self, rows):
+        # slicing keeps the order of stored entries of sparse rows (fancy
+        # indexing may not), so the products match those of whole matrices
+        if rows.size and np.all(np.diff(rows) == 1):
+            return self.left[rows[0]:rows[-1] + 1]
+        return self.left[rows]
+
+    def get_row(self, row):
+        return self.get_rows([row])[0]
+
+    def iter_blocks(self):
+        """generate (start, dense rows) blocks covering all the rows"""
+        for start in xrange(0, self.shape[0], self.block_size):
+            end = min(start + self.block_size, self.shape[0])
+            yield start, linear_kernel(self.left[start:end], self.right)
+
+    def get_top_k(self, k):
+        """keep the k largest similarities of each row in a CSR matrix"""
+        k = min(k, self.shape[1])
+        indptr = np.arange(self.shape[0] + 1, dtype=np.int64) * k
+        indices = np.empty((self.shape[0] * k,), dtype=np.int64)
+        data = np.empty((self.shape[0] * k,))
+        for start, block in self.iter_blocks():
+            if k:
+                top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            else:
+                top = np.empty((block.shape[0], 0), dtype=np.int64)
+            offset = slice(start * k, (start + block.shape[0]) * k)
+            indices[offset] = top.ravel()
+            data[offset] = block[np.arange(block.shape[0])[:, np.newaxis], top].ravel()
+        matrix = csr_matrix((data, indices, indptr), shape=self.shape)
+        matrix.sort_indices()
+        matrix.eliminate_zeros()
+        return matrix
+
+    def get_memmap(self, path):
+        """write all the similarities into an .npy file under the directory
+        path block by block and return the memory-mapped array
+
+        the file is removed once it is mapped, so its space is freed with
+        the array
+        """
+        handle, filename = tempfile.mkstemp(suffix='.npy', dir=path)
+        os.close(handle)
+        matrix = np.lib.format.open_memmap(filename, mode='w+', shape=self.shape)
+        for start, block in self.iter_blocks():
+            matrix[start:start + block.shape[0]] = block
+        matrix.flush()
+        del matrix
+        try:
+            return np.load(filename, mmap_mode='r')
+        finally:
+            os.remove(filename)
+
+    def __getitem__(self, key):
+        row, columns = key
+        return self.get_row(row)[columns]
+
+
+class StoredSimilarity(object):
+    """similarity rows read from a dense, memory-mapped or sparse matrix"""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.shape = matrix.shape
+
+    @property
+    def T(self):
+        return StoredSimilarity(self.matrix.T.tocsr() if issparse(self.matrix)
+            else self.matrix.T)
+
+    def get_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if issparse(self.matrix):
+            return self.matrix[rows].toarray()
+        return np.asarray(self.matrix[rows], dtype=np.float)
+
+    def get_row(self, row):
+        return self.get_rows([row])[0]
+
+    def __getitem__(self, key):
+        row, columns = key
+        return self.get_row(row)[columns]
 
 
 class BigraphSimilarity(object):
-    def __init__(self, bigraph, features, feature_type):
+    """cosine similarities between the nodes of a bigraph given features of
+    its sources or targets
+
+    partitioned similarity matrix ('s' for source nodes and 't' for target nodes)
+    S = [[S_ss, S_st],
+         [S_ts, S_tt]]
+
+    each part is created when it is first used, and by default it is never
+    computed as a whole: its rows are computed when they are asked for
+    (see SimilarityKernel.get_rows).
+    If n_neighbors is given, only the n_neighbors largest similarities of
+    each row are kept in sparse matrices; otherwise if memmap_path is given,
+    the parts are written into memory-mapped files under that directory
+
+    if the features are named, the normalized features and the stored parts
+    are kept in the artifact registry so that they are computed once for the
+    same graph and name
+    """
+
+    def __init__(self, bigraph, features, feature_type, name=None, n_neighbors=None,
+            memmap_path=None, block_size=1024):
         self.bigraph = bigraph
-        if feature_type == 'source':
-            self._from_source_features(features)
-        elif feature_type == 'target':
-            self._from_target_features(features)
-        else:
+        if feature_type not in ('source', 'target'):
             raise ValueError('feature type must be "source" or "target"')
-        self._build_similarity_matrix()
+        self.name = name
+        self.feature_type = feature_type
+        self.n_neighbors = n_neighbors
+        self.memmap_path = memmap_path
+        self.block_size = block_size
+
+        def _build():
+            if feature_type == 'source':
+                self._from_source_features(features)
+            else:
+                self._from_target_features(features)
+            return self._normalize_features()
+
+        if name is None:
+            matrices = _build()
+        else:
+            matrices = bigraph.get_artifact('similarity-features', (name, feature_type), _build)
+        self.source_features, self.target_features = matrices
+        self._parts = {}
+
+    def _get_part(self, part):
+        if part not in self._parts:
+            if part == 'ts' and self.n_neighbors is None:
+                self._parts[part] = self.st.T
+            else:
+                # with n_neighbors, the largest similarities of target rows
+                # are not those of st columns, so ts is built like the others
+                features = {'s': self.source_features, 't': self.target_features}
+                self._parts[part] = self._create_part(part, features[part[0]],
+                    features[part[1]])
+        return self._parts[part]
+
+    @property
+    def ss(self):
+        return self._get_part('ss')
+
+    @property
+    def st(self):
+        return self._get_part('st')
+
+    @property
+    def ts(self):
+        return self._get_part('ts')
+
+    @property
+    def tt(self):
+        return self._get_part('tt')
 
     def _from_source_features(self, features):
         assert features.shape[0] == self.bigraph.matrix.shape[0]
         self.source_features = features.copy()
-        self.target_features = self.bigraph.matrix.T.dot(features)
+        self.target_features = self.bigraph.transpose_matrix.dot(features)
 
     def _from_target_features(self, features):
         assert features.shape[0] == self.bigraph.matrix.shape[1]
         self.target_features = features.copy()
         self.source_features = self.bigraph.matrix.dot(features)
 
-    def _build_similarity_matrix(self):
-        """
-        partitioned similarity matrix ('s' for source nodes and 't' for target nodes)
-        S = [[S_ss, S_st],
-             [S_ts, S_tt]]
-        """
+    def _normalize_features(self):
         normalize(self.source_features, norm='l2', copy=False)
         normalize(self.target_features, norm='l2', copy=False)
-        self.ss = linear_kernel(self.source_features)
-        self.st = linear_kernel(self.source_features, self.target_features)
-        self.ts = self.st.T
-        self.tt = linear_kernel(self.target_features)
+        return self.source_features, self.target_features
+
+    def _create_part(self, part, left, right):
+        kernel = SimilarityKernel(left, right, self.block_size)
+        if self.n_neighbors is not None:
+            kind, parameters = 'similarity-top-k', (self.n_neighbors,)
+            build = lambda: kernel.get_top_k(self.n_neighbors)
+        elif self.memmap_path is not None:
+            kind, parameters = 'similarity-memmap', (self.memmap_path,)
+            build = lambda: kernel.get_memmap(self.memmap_path)
+        else:
+            return kernel
+        if self.name is None:
+            matrix = build()
+        else:
+            matrix = self.bigraph.get_artifact(kind,
+                (self.name, self.feature_type, part) + parameters, build)
+        return StoredSimilarity(matrix)
@@ -1,3 +1,4 @@
+from ghanalyzer.utils.recommendation import recommend_by_scores
 
 
 class Recommender(object):
@@ -9,3 +10,31 @@ class Recommender(object):
 
     def recommend(self, user, n=None):
         raise NotImplementedError()
+
+    def recommend_many(self, users, n=None):
+        return [self.recommend(user, n) for user in users]
+
+
+class ScoreRecommender(Recommender):
+    """base class for recommenders ranking a fixed item array by score vectors
+
+    `items` (an object array) and `candidates` (a boolean mask of the items
+    that can be recommended at all) are set when training
+    """
+
+    def get_scores(self, user):
+        """return the score vector of the user (aligned with `items`)"""
+        raise NotImplementedError()
+
+    def get_excluded(self, user):
+        """return the indices of items that must not be recommended to the user"""
+        return []
+
+    def get_candidates(self, user):
+        candidates = self.candidates.copy()
+        candidates[self.get_excluded(user)] = False
+        return candidates
+
+    def recommend(self, user, n=None):
+        scores = self.get_scores(user)
+        return recommend_by_scores(self.items, scores, n, self.get_candidates(user))
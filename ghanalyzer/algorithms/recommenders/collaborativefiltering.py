@@ -1,26 +1,78 @@
 from collections import defaultdict
 
+import numpy as np
+
 from ghanalyzer.algorithms.graphs import Bigraph
-from ghanalyzer.algorithms.similarities import JaccardSimilarity
+from ghanalyzer.algorithms.similarities import JaccardSimilarity, MinHashSimilarity
 from ghanalyzer.algorithms.recommenders.base import Recommender
 from ghanalyzer.models import User, Repository
-from ghanalyzer.utils.recommendation import recommend_by_rank
+from ghanalyzer.utils.recommendation import top_k_rows
 
 
 class CFRecommender(Recommender):
-    parameters = ['n_neighbors']
+    """base class of collaborative filtering recommenders
+
+    similarity 'jaccard' finds neighbors by exact Jaccard similarity and
+    'minhash' by MinHash LSH with n_bands bands of n_rows hashes
+    (see MinHashSimilarity)
+    """
+    parameters = ['n_neighbors', 'similarity_type', 'n_bands', 'n_rows']
+    similarity_types = ('jaccard', 'minhash')
 
-    def __init__(self, n_neighbors=None):
+    def __init__(self, n_neighbors=None, similarity_type='jaccard', n_bands=20, n_rows=5,
+            random_seed=None):
+        if similarity_type not in self.similarity_types:
+            raise ValueError('similarity type must be one of %s' %
+                ', '.join(self.similarity_types))
         self.n_neighbors = n_neighbors
+        self.similarity_type = similarity_type
+        self.n_bands = n_bands
+        self.n_rows = n_rows
+        self.random_seed = random_seed
 
     def get_rank(self, user):
         raise NotImplementedError()
 
+    def _get_user_indices(self, users):
+        raise NotImplementedError()
+
+    def _get_score_matrix(self, u):
+        """return the sparse (user, repository) score matrix of users u"""
+        raise NotImplementedError()
+
+    def _get_similarity(self):
+        if self.similarity_type == 'minhash':
+            return self.bigraph.get_artifact('minhash',
+                (self.n_neighbors, self.n_bands, self.n_rows, self.random_seed),
+                lambda: MinHashSimilarity(self.bigraph.matrix, n_neighbors=self.n_neighbors,
+                    n_bands=self.n_bands, n_rows=self.n_rows, random_seed=self.random_seed))
+        return self.bigraph.get_artifact('jaccard', (self.n_neighbors,),
+            lambda: JaccardSimilarity(self.bigraph.matrix, n_neighbors=self.n_neighbors))
+
     def recommend(self, user, n=None):
-        rank = self.get_rank(user)
-        for repo in self.bigraph.graph[user]:
-            rank.pop(repo, None)
-        return recommend_by_rank(rank, n)
+        return self.recommend_many([user], n)[0]
+
+    def recommend_many(self, users, n=None):
+        indices = self.recommend_indices(users, n)
+        return [[self.repos[r] for r in row if r >= 0] for row in indices]
+
+    def recommend_indices(self, users, n=None):
+        """recommend repositories for many users at once
+
+        return an integer array of shape (user count, n) holding indices of
+        `self.repos`, padded with -1 if a user has less than n candidates
+        """
+        u = self._get_user_indices(users)
+        scores = self._get_score_matrix(u).tocsr()
+        # remove the repositories each user already has, whatever their ratings
+        owned = self.ratings[u].tocsr()
+        owned.data = np.ones_like(owned.data)
+        scores = scores - scores.multiply(owned)
+        scores.eliminate_zeros()
+        if n is None:
+            n = np.diff(scores.indptr).max() if len(u) else 0
+        indices, _ = top_k_rows(scores, n)
+        return indices
 
 
 class UserCFRecommender(CFRecommender):
@@ -28,35 +80,61 @@ class UserCFRecommender(CFRecommender):
 
     def train(self, graph):
         self.bigraph = Bigraph(graph, source_cls=User, target_cls=Repository)
-        self.similarity = JaccardSimilarity(self.bigraph.matrix)
-        if self.n_neighbors is None:
-            self.n_neighbors = len(self.bigraph.sources)
+        self.similarity = self._get_similarity()
+        # all the sources are neighbors if n_neighbors is not given
+        self._k = self.n_neighbors if self.n_neighbors is not None \
+            else len(self.bigraph.sources)
+        self.repos = self.bigraph.targets
+        self.ratings = self.bigraph.matrix
 
     def get_rank(self, user):
         rank = defaultdict(float)
         u = self.bigraph.source_indices[user]
-        for v, weight in self.similarity.nearest(u, self.n_neighbors):
+        for v, weight in self.similarity.nearest(u, self._k):
             friend = self.bigraph.sources[v]
             for repo in self.bigraph.graph[friend]:
                 rank[repo] += weight
         return rank
 
+    def _get_user_indices(self, users):
+        return np.array([self.bigraph.source_indices[x] for x in users], dtype=int)
+
+    def _get_score_matrix(self, u):
+        neighbors = self.similarity.nearest_matrix(u, self._k)
+        return neighbors.dot(self.ratings)
+
 
 class ItemCFRecommender(CFRecommender):
     """recommender using item-based collaborative filtering"""
 
     def train(self, graph):
         self.bigraph = Bigraph(graph, source_cls=Repository, target_cls=User)
-        self.similarity = JaccardSimilarity(self.bigraph.matrix)
-        if self.n_neighbors is None:
-            self.n_neighbors = len(self.bigraph.sources)
+        self.similarity = self._get_similarity()
+        # all the sources are neighbors if n_neighbors is not given
+        self._k = self.n_neighbors if self.n_neighbors is not None \
+            else len(self.bigraph.sources)
+        self.repos = self.bigraph.sources
+        self.ratings = self.bigraph.transpose_matrix
+        self._neighbor_matrix = None
 
     def get_rank(self, user):
         rank = defaultdict(float)
         u = self.bigraph.target_indices[user]
         for repo in self.bigraph.graph[user]:
             r = self.bigraph.source_indices[repo]
-            for s, weight in self.similarity.nearest(r, self.n_neighbors):
+            for s, weight in self.similarity.nearest(r, self._k):
                 similar = self.bigraph.sources[s]
                 rank[similar] += weight
         return rank
+
+    def _get_user_indices(self, users):
+        return np.array([self.bigraph.target_indices[x] for x in users], dtype=int)
+
+    def _get_neighbor_matrix(self):
+        if self._neighbor_matrix is None:
+            repos = np.arange(len(self.bigraph.sources))
+            self._neighbor_matrix = self.similarity.nearest_matrix(repos, self._k)
+        return self._neighbor_matrix
+
+    def _get_score_matrix(self, u):
+        return self.ratings[u].dot(self._get_neighbor_matrix())
@@ -1,74 +1,144 @@
-from collections import defaultdict
-from itertools import izip
+import os
+import hashlib
 
 import numpy as np
 
 from ghanalyzer.algorithms.graphs import Bigraph, BigraphSimilarity
+from ghanalyzer.algorithms.similarities.hyperplane import CosineLSHIndex, load_cosine_index
 from ghanalyzer.algorithms.features import (
     load_language_features,
     load_description_features,
     load_follow_features,
 )
-from ghanalyzer.algorithms.recommenders.base import Recommender
+from ghanalyzer.algorithms.recommenders.base import ScoreRecommender
 from ghanalyzer.models import User, Repository
-from ghanalyzer.utils.recommendation import recommend_by_rank
+from ghanalyzer.utils.recommendation import object_array
 
 
-class ContentBasedRecommender(Recommender):
-    def __init__(self, data_path):
+class ContentBasedRecommender(ScoreRecommender):
+    """recommender ranking repositories by their similarities to the user
+
+    n_neighbors and memmap_path choose how the similarities are stored
+    (see BigraphSimilarity). If n_tables is given, the top repositories are
+    found with a CosineLSHIndex of n_tables tables of n_bits bits over the
+    repository features (with hyperplanes drawn from random_seed) instead
+    of scoring every repository; the index is saved under index_path (if
+    given) in a file named after the similarity and the index parameters
+    and reused while the features are the same
+
+    data files are parsed by `workers` processes
+    """
+    parameters = ['n_neighbors', 'n_tables', 'n_bits']
+
+    def __init__(self, data_path, n_neighbors=None, memmap_path=None, n_tables=None,
+            n_bits=16, index_path=None, random_seed=None, workers=1):
         self.data_path = data_path
+        self.workers = workers
+        self.n_neighbors = n_neighbors
+        self.memmap_path = memmap_path
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.index_path = index_path
+        self.random_seed = random_seed
 
     def train(self, graph):
         self.bigraph = Bigraph(graph, source_cls=User, target_cls=Repository)
+        self.items = object_array(self.bigraph.targets)
+        self.candidates = np.ones((len(self.items),), dtype=bool)
         self._calculate_similarities()
+        self.index = None if self.n_tables is None else self._create_index()
 
     def _calculate_similarities(self):
         raise NotImplementedError()
 
-    def get_rank(self, user):
+    def _create_index(self):
+        features = self.similarity.target_features
+        parameters = (self.similarity.name, self.similarity.feature_type,
+            self.n_tables, self.n_bits, self.random_seed)
+        if self.index_path is None:
+            build = lambda: CosineLSHIndex(features, n_tables=self.n_tables,
+                n_bits=self.n_bits, random_seed=self.random_seed)
+        else:
+            if not os.path.isdir(self.index_path):
+                os.makedirs(self.index_path)
+            filename = '%s-%s.npz' % (type(self).__name__,
+                hashlib.sha1(repr(parameters)).hexdigest()[:16])
+            path = os.path.join(self.index_path, filename)
+            build = lambda: load_cosine_index(path, features, n_tables=self.n_tables,
+                n_bits=self.n_bits, random_seed=self.random_seed)
+        parameters += (self.index_path,)
+        return self.bigraph.get_artifact('cosine-index', parameters, build)
+
+    def _create_similarity(self, features, feature_type, name):
+        return BigraphSimilarity(self.bigraph, features, feature_type, name=name,
+            n_neighbors=self.n_neighbors, memmap_path=self.memmap_path)
+
+    def get_scores(self, user):
         u = self.bigraph.source_indices[user]
-        rank = self.similarity.st[u, :]
-        rank = {k: v for k, v in izip(self.bigraph.targets, rank)}
-        return rank
+        return self.similarity.st.get_row(u)
+
+    def get_excluded(self, user):
+        indices = self.bigraph.target_indices
+        return [indices[r] for r in self.bigraph.graph[user] if r in indices]
 
     def recommend(self, user, n=None):
-        rank = self.get_rank(user)
-        for repo in self.bigraph.graph[user]:
-            rank.pop(repo, None)
-        return recommend_by_rank(rank, n)
+        if self.index is None or n is None:
+            return super(ContentBasedRecommender, self).recommend(user, n)
+        u = self.bigraph.source_indices[user]
+        rows, _ = self.index.query(self.similarity.source_features[u], n,
+            excluded=self.get_excluded(user))
+        if rows.size < n:
+            # too few candidates share buckets with the user
+            return super(ContentBasedRecommender, self).recommend(user, n)
+        return list(self.items[rows])
 
 
 class LanguageBasedRecommender(ContentBasedRecommender):
     def _calculate_similarities(self):
-        features = load_language_features(self.data_path, self.bigraph.targets)
-        self.similarity = BigraphSimilarity(self.bigraph, features, 'target')
+        features = self.bigraph.get_artifact('language', (self.data_path,),
+            lambda: load_language_features(self.data_path, self.bigraph.targets,
+                workers=self.workers))
+        self.similarity = self._create_similarity(features, 'target',
+            ('language', self.data_path))
 
 
 class DescriptionBasedRecommender(ContentBasedRecommender):
     def _calculate_similarities(self):
-        features = load_description_features(self.data_path, self.bigraph.targets)
-        self.similarity = BigraphSimilarity(self.bigraph, features, 'target')
+        features = self.bigraph.get_artifact('description', (self.data_path,),
+            lambda: load_description_features(self.data_path, self.bigraph.targets,
+                workers=self.workers))
+        self.similarity = self._create_similarity(features, 'target',
+            ('description', self.data_path))
 
 
 class QuasiUserCFRecommender(ContentBasedRecommender):
     def _calculate_similarities(self):
-        features = self.bigraph.matrix.copy()
-        self.similarity = BigraphSimilarity(self.bigraph, features, 'source')
+        features = self.bigraph.matrix
+        self.similarity = self._create_similarity(features, 'source', ('bigraph',))
 
 
 class QuasiItemCFRecommender(ContentBasedRecommender):
     def _calculate_similarities(self):
-        features = self.bigraph.matrix.T.tocsr().copy()
-        self.similarity = BigraphSimilarity(self.bigraph, features, 'target')
+        features = self.bigraph.transpose_matrix
+        self.similarity = self._create_similarity(features, 'target', ('bigraph',))
+
+
+class FollowBasedRecommender(ContentBasedRecommender):
+    def _get_follow_features(self):
+        return self.bigraph.get_artifact('follow', (self.data_path,),
+            lambda: load_follow_features(self.data_path, self.bigraph.sources,
+                workers=self.workers))
 
 
-class FollowerBasedRecommender(ContentBasedRecommender):
+class FollowerBasedRecommender(FollowBasedRecommender):
     def _calculate_similarities(self):
-        followers, _ = load_follow_features(self.data_path, self.bigraph.sources)
-        self.similarity = BigraphSimilarity(self.bigraph, followers, 'source')
+        followers, _ = self._get_follow_features()
+        self.similarity = self._create_similarity(followers, 'source',
+            ('follower', self.data_path))
 
 
-class FolloweeBasedRecommender(ContentBasedRecommender):
+class FolloweeBasedRecommender(FollowBasedRecommender):
     def _calculate_similarities(self):
-        _, followees = load_follow_features(self.data_path, self.bigraph.sources)
-        self.similarity = BigraphSimilarity(self.bigraph, followees, 'source')
+        _, followees = self._get_follow_features()
+        self.similarity = self._create_similarity(followees, 'source',
+            ('followee', self.data_path))
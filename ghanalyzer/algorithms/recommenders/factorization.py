@@ -1,12 +1,13 @@
+import numpy as np
 from sklearn.decomposition import NMF
 
 from ghanalyzer.algorithms.graphs import Bigraph
-from ghanalyzer.algorithms.recommenders.base import Recommender
+from ghanalyzer.algorithms.recommenders.base import ScoreRecommender
 from ghanalyzer.models import User, Repository
-from ghanalyzer.utils.recommendation import recommend_by_rank
+from ghanalyzer.utils.recommendation import object_array
 
 
-class FactorizationRecommender(Recommender):
+class FactorizationRecommender(ScoreRecommender):
     parameters = ['n_components']
 
     def __init__(self, n_components):
@@ -16,6 +17,8 @@ class FactorizationRecommender(Recommender):
         self.bigraph = Bigraph(graph, source_cls=User, target_cls=Repository)
         self.user_count = len(self.bigraph.sources)
         self.repo_count = len(self.bigraph.targets)
+        self.items = object_array(self.bigraph.targets)
+        self.candidates = np.ones((self.repo_count,), dtype=bool)
         self._train_model()
 
     def _train_model(self):
@@ -24,18 +27,21 @@ class FactorizationRecommender(Recommender):
     def _predict(self, u, r):
         return self.user_features[u, :].dot(self.repo_features[r, :].T)
 
-    def recommend(self, user, n=None):
+    def get_scores(self, user):
         u = self.bigraph.source_indices[user]
-        rank = {}
-        candidates = set(self.bigraph.targets) - set(self.bigraph.graph.neighbors_iter(user))
-        for repo in candidates:
-            r = self.bigraph.target_indices[repo]
-            rank[repo] = self._predict(u, r)
-        return recommend_by_rank(rank, n)
+        return self.repo_features.dot(self.user_features[u, :])
+
+    def get_excluded(self, user):
+        indices = self.bigraph.target_indices
+        return [indices[r] for r in self.bigraph.graph.neighbors_iter(user) if r in indices]
 
 
 class NMFRecommender(FactorizationRecommender):
     def _train_model(self):
+        self.user_features, self.repo_features = self.bigraph.get_artifact('nmf',
+            (self.n_components,), self._factorize)
+
+    def _factorize(self):
         factorizer = NMF(n_components=self.n_components)
-        self.user_features = factorizer.fit_transform(self.bigraph.matrix)
-        self.repo_features = factorizer.components_.T
+        user_features = factorizer.fit_transform(self.bigraph.matrix)
+        return user_features, factorizer.components_.T
@@ -1,26 +1,39 @@
-from collections import defaultdict
-from itertools import izip
-
 import numpy as np
 import networkx as nx
+from scipy.sparse import csr_matrix
 
 import pyximport
 pyximport.install()
 
-from ghanalyzer.algorithms.recommenders.base import Recommender
+from ghanalyzer.algorithms.recommenders.base import ScoreRecommender
 import ghanalyzer.utils.randomwalk as randomwalk
 from ghanalyzer.models import Repository
-from ghanalyzer.utils.recommendation import recommend_by_rank
+from ghanalyzer.utils.linalg import SOLVERS, RestartSolver
+from ghanalyzer.utils.recommendation import object_array, recommend_by_scores
+
 
+class PersonalRankRecommender(ScoreRecommender):
+    parameters = ['alpha', 'max_steps', 'epsilon', 'memory_limit', 'engine', 'tolerance']
 
-class PersonalRankRecommender(Recommender):
-    parameters = ['alpha', 'max_steps', 'epsilon']
+    """recommender based on Topic-Sensitive PageRank (WWW 2002)
 
-    """recommender based on Topic-Sensitive PageRank (WWW 2002)"""
-    def __init__(self, alpha, max_steps, epsilon):
+    engine 'power' runs the power iteration over the whole graph,
+    engine 'push' approximates the rank vector by local forward push
+    with the given residual tolerance, and engines 'direct', 'gmres' and
+    'bicgstab' solve the linear system of the random walk exactly
+    """
+    engines = ('power', 'push') + SOLVERS
+
+    def __init__(self, alpha, max_steps, epsilon, memory_limit=256, engine='power',
+            tolerance=1e-4):
+        if engine not in self.engines:
+            raise ValueError('engine must be one of %s' % ', '.join(self.engines))
         self.alpha = float(alpha)  # restart probability
         self.max_steps = max_steps
         self.epsilon = epsilon
+        self.memory_limit = memory_limit  # memory (in MB) used by block iteration
+        self.engine = engine
+        self.tolerance = float(tolerance)
         self.other_graphs = []
 
     def add_other_graphs(self, *graphs):
@@ -35,12 +48,46 @@ class PersonalRankRecommender(Recommender):
         self.nodes = self.graph.nodes()
         self.size = len(self.nodes)
         self.node_indices = {n: i for i, n in enumerate(self.nodes)}
+        self.items = object_array(self.nodes)
+        self.candidates = np.array([isinstance(n, Repository) for n in self.nodes], dtype=bool)
         self.adjacency = nx.to_scipy_sparse_matrix(self.graph, nodelist=self.nodes,
             weight=None, format='coo')
         self.degrees = np.array([self.graph.out_degree(n, weight=None) for n in self.nodes], dtype=np.int)
         self.row = self.adjacency.row.astype(np.int)
         self.col = self.adjacency.col.astype(np.int)
         self.edge_weights = self.adjacency.data.astype(np.float)
+        # transposed transition matrix (rank vectors are columns)
+        self.transition = csr_matrix((self.edge_weights / self.degrees[self.row],
+            (self.col, self.row)), shape=(self.size, self.size))
+        if self.engine == 'push':
+            probabilities = self.transition.T.tocsr()
+            self.push_indptr = probabilities.indptr.astype(np.int)
+            self.push_indices = probabilities.indices.astype(np.int)
+            self.push_probabilities = probabilities.data.astype(np.float)
+        elif self.engine in SOLVERS:
+            self.solver = RestartSolver(self.transition, self.alpha, method=self.engine)
+
+    def _get_push_rank(self, user):
+        """return the approximate rank vector of the user as a sparse row vector"""
+        u = self.node_indices[user]
+        nodes, scores = randomwalk.forward_push(u, self.push_indptr, self.push_indices,
+            self.push_probabilities, self.alpha, self.tolerance)
+        return csr_matrix((scores, nodes, [0, nodes.size]), shape=(1, self.size))
+
+    def get_push_error(self, user, n=None):
+        """measure the forward push approximation against the power iteration
+
+        return the L1 and maximum absolute errors of the rank vector and
+        the fraction of the top n recommendations that both engines agree on
+        """
+        exact = self._get_rank(user)
+        approximate = self._get_push_rank(user).toarray().ravel()
+        error = np.abs(exact - approximate)
+        candidates = self.get_candidates(user)
+        expected = recommend_by_scores(self.items, exact, n, candidates)
+        actual = recommend_by_scores(self.items, approximate, n, candidates)
+        overlap = float(len(set(expected) & set(actual))) / max(len(expected), 1)
+        return {'l1': error.sum(), 'max': error.max(), 'overlap': overlap}
 
     def _get_rank(self, user):
         u = self.node_indices[user]
@@ -55,8 +102,71 @@ class PersonalRankRecommender(Recommender):
             rank = rank1
         return rank
 
+    def _get_block_size(self):
+        # current, updated and finished rank vectors plus temporaries
+        column_size = 5 * self.size * np.dtype(np.float).itemsize
+        return max(1, int(self.memory_limit * 2**20 // column_size))
+
+    def _get_ranks(self, users):
+        """calculate rank vectors for a block of users at once
+
+        return an array whose i-th column is the rank vector of users[i]
+        """
+        u = np.array([self.node_indices[x] for x in users], dtype=int)
+        if self.engine in SOLVERS:
+            restart = np.zeros((self.size, len(u)))
+            restart[u, np.arange(len(u))] = self.alpha
+            return self.solver.solve(restart)
+        return self._iterate_ranks(u)
+
+    def _iterate_ranks(self, u):
+        """run the power iteration for many users at once
+        (converged columns are retired from the iteration)
+        """
+        ranks = np.zeros((self.size, len(u)))
+        active = np.arange(len(u))
+        rank = np.zeros((self.size, len(u)))
+        rank[u, active] = 1.0
+        for _ in xrange(self.max_steps):
+            rank1 = self.transition.dot(rank)
+            rank1 *= 1 - self.alpha
+            rank1[u[active], np.arange(active.size)] += self.alpha
+            converged = np.abs(rank1 - rank).max(axis=0) < self.epsilon
+            ranks[:, active[converged]] = rank[:, converged]
+            active = active[~converged]
+            rank = rank1[:, ~converged]
+            if not active.size:
+                break
+        ranks[:, active] = rank
+        return ranks
+
     def recommend(self, user, n=None):
-        rank = self._get_rank(user)
-        rank = {k: v for k, v in izip(self.nodes, rank) \
-            if isinstance(k, Repository) and k not in self.graph[user]}
-        return recommend_by_rank(rank, n)
+        if self.engine != 'push':
+            return super(PersonalRankRecommender, self).recommend(user, n)
+        rank = self._get_push_rank(user)
+        candidates = self.candidates[rank.indices]
+        candidates &= ~np.in1d(rank.indices, self.get_excluded(user))
+        return recommend_by_scores(self.items[rank.indices], rank.data, n, candidates)
+
+    def recommend_many(self, users, n=None):
+        if self.engine == 'push':
+            return super(PersonalRankRecommender, self).recommend_many(users, n)
+        recommendations = []
+        block_size = self._get_block_size()
+        for start in xrange(0, len(users), block_size):
+            block = users[start:start+block_size]
+            ranks = self._get_ranks(block)
+            for i, user in enumerate(block):
+                recommendations.append(recommend_by_scores(self.items, ranks[:, i], n,
+                    self.get_candidates(user)))
+        return recommendations
+
+    def get_scores(self, user):
+        if self.engine == 'push':
+            return self._get_push_rank(user).toarray().ravel()
+        elif self.engine in SOLVERS:
+            return self._get_ranks([user])[:, 0]
+        return self._get_rank(user)
+
+    def get_excluded(self, user):
+        return [self.node_indices[x] for x in self.graph[user]]
@@ -1,6 +1,5 @@
 import gc
 import random
-from itertools import izip
 
 import numpy as np
 import networkx as nx
@@ -15,24 +14,38 @@ from ghanalyzer.algorithms.features import (
 )
 from ghanalyzer.algorithms.graphs import Bigraph, AdjacencyMatrix, BigraphSimilarity
 from ghanalyzer.algorithms.graphfeatures import *
-from ghanalyzer.algorithms.recommenders.base import Recommender
+from ghanalyzer.algorithms.recommenders.base import ScoreRecommender
 from ghanalyzer.models import User, Repository
+from ghanalyzer.utils.linalg import SOLVERS, RestartSolver
 from ghanalyzer.utils.randomwalk import check_converged
-from ghanalyzer.utils.recommendation import recommend_by_rank
+from ghanalyzer.utils.recommendation import object_array
 from ghanalyzer.utils import sparsetools
 
 
 def sigmoid(x):
     return 1 / (1 + np.exp(-x))
 
-class SupervisedRWRecommender(Recommender):
+class SupervisedRWRecommender(ScoreRecommender):
     parameters = ['alpha', 'max_steps', 'lambda_', 'epsilon', 'loss_width',
-        'weight_key', 'feature_types']
+        'weight_key', 'feature_types', 'engine']
+
+    """recommender based on Supervised Random Walk (WSDM 2011)
+
+    engine 'power' finds stationary distributions (and their derivatives) by
+    fixed-point iteration while engines 'direct', 'gmres' and 'bicgstab'
+    solve the linear systems exactly; data files are parsed by `workers`
+    processes
+    """
+    engines = ('power',) + SOLVERS
 
-    """recommender based on Supervised Random Walk (WSDM 2011)"""
     def __init__(self, data_path, max_steps=100, alpha=0.85, lambda_=0.01,
-            epsilon=0.01, loss_width=1.0, weight_key=(), feature_types=()):
+            epsilon=0.01, loss_width=1.0, weight_key=(), feature_types=(), engine='power',
+            workers=1):
+        if engine not in self.engines:
+            raise ValueError('engine must be one of %s' % ', '.join(self.engines))
+        self.engine = engine
         self.data_path = data_path
+        self.workers = workers
         self.max_steps = max_steps
         self.alpha = float(alpha)
         self.lambda_ = float(lambda_)
@@ -43,9 +56,9 @@ class SupervisedRWRecommender(Recommender):
 
     def train(self, graph):
         self.graph = graph.to_directed()
-        self.candidates = [n for n in self.graph if isinstance(n, Repository)]
+        self.repos = [n for n in self.graph if isinstance(n, Repository)]
         self.adj = AdjacencyMatrix(self.graph, format='csr')
-        self.feature_extractor = self._create_feature_extractor()
+        self.feature_extractor = self._create_feature_extractor(graph)
         self.nodes = self.feature_extractor.nodes
         self.node_indices = self.feature_extractor.node_indices
         self.indices = self.feature_extractor.indices
@@ -53,30 +66,44 @@ class SupervisedRWRecommender(Recommender):
         self.N = len(self.nodes)
         self.E = self.feature_extractor.edge_count
         self.M = self.feature_extractor.feature_count
+        self.edge_rows = np.repeat(np.arange(self.N), np.diff(self.indptr))
+        # maps edge data to the target nodes of the edges
+        self.edge_targets = csr_matrix((np.ones((self.E,)), (self.indices, np.arange(self.E))),
+            shape=(self.N, self.E))
+        self.items = object_array(self.nodes)
+        self.candidates = np.array([isinstance(n, Repository) for n in self.nodes], dtype=bool)
+
+    def get_scores(self, user):
+        return self._get_rank(user)
 
-    def recommend(self, user, n=None):
-        rank = self._get_rank(user)
-        rank = {k: v for k, v in izip(self.nodes, rank) \
-            if isinstance(k, Repository) and k not in self.graph[user]}
-        return recommend_by_rank(rank, n)
+    def get_excluded(self, user):
+        return [self.node_indices[x] for x in self.graph[user]]
 
-    def _create_feature_extractor(self):
-        bigraph = Bigraph(self.graph, source_cls=User, target_cls=Repository)
+    def _create_feature_extractor(self, graph):
+        # the bigraph is built from the training graph (not its directed
+        # copy) so that it shares its artifacts with the other recommenders
+        bigraph = Bigraph(graph, source_cls=User, target_cls=Repository)
         features = []
         if 'behavior' in self.feature_types:
             features.extend([
-                (bigraph.matrix.copy(), 'source', 'contributed repository'),
-                (bigraph.matrix.T.tocsr().copy(), 'target', 'contributor'),
+                (bigraph.matrix, 'source', 'contributed repository'),
+                (bigraph.transpose_matrix, 'target', 'contributor'),
             ])
         if 'content' in self.feature_types:
-            languages = load_language_features(self.data_path, bigraph.targets)
-            descriptions = load_description_features(self.data_path, bigraph.targets)
+            languages = bigraph.get_artifact('language', (self.data_path,),
+                lambda: load_language_features(self.data_path, bigraph.targets,
+                    workers=self.workers))
+            descriptions = bigraph.get_artifact('description', (self.data_path,),
+                lambda: load_description_features(self.data_path, bigraph.targets,
+                    workers=self.workers))
             features.extend([
                 (languages, 'target', 'language'),
                 (descriptions, 'target', 'description'),
             ])
         if 'relation' in self.feature_types:
-            followers, followees = load_follow_features(self.data_path, bigraph.sources)
+            followers, followees = bigraph.get_artifact('follow', (self.data_path,),
+                lambda: load_follow_features(self.data_path, bigraph.sources,
+                    workers=self.workers))
             features.extend([
                 (followers, 'source', 'follower'),
                 (followees, 'source', 'followee'),
@@ -90,7 +117,7 @@ class SupervisedRWRecommender(Recommender):
         for feature, type_, name in features:
             print 'Creating node similarity matrix from %s feature (%s count: %d, ' \
                 'dimension: %d)...' % (name, type_map[type_], feature.shape[0], feature.shape[1])
-            similarity = BigraphSimilarity(bigraph, feature, type_)
+            similarity = BigraphSimilarity(bigraph, feature, type_, name=(name, self.data_path))
             extractor = SimilarityFeature(self.adj, similarity)
             extractors.append(extractor)
         return CombinedFeature(self.adj, *extractors)
@@ -119,21 +146,33 @@ class SupervisedRWRecommender(Recommender):
         Q0 = normalize(Q0, norm='l1')
         return Q0
 
+    def _sum_edge_rows(self, data):
+        """sum edge data (of shape E or E x M) over the out-edges of each node"""
+        result = np.zeros((self.N,) + data.shape[1:])
+        starts = self.indptr[:-1]
+        nonempty = starts < self.indptr[1:]
+        result[nonempty] = np.add.reduceat(data, starts[nonempty], axis=0)
+        return result
+
+    def _multiply_edge_data(self, P, data):
+        """calculate P * D for each column of edge data (of shape E x M),
+        where D is the matrix with that column in the sparsity pattern of Q0
+        """
+        return self.edge_targets.dot(P[self.edge_rows, np.newaxis] * data)
+
     def _get_transition_probability_derivative(self, A, dA):
-        F = self._csr_from_data(A)
-        norm_F = sparsetools.sum_csr_matrix_column(F)
+        """calculate the derivative dQ of the biased transition probability
+        as an E x M block, whose column m holds the data of dQ/dw_m in the
+        sparsity pattern of Q0
+        """
+        rows = self.edge_rows
+        norm_F = self._sum_edge_rows(A)[rows]
+        norm_dF = self._sum_edge_rows(dA)[rows, :]
         denominator = (1.0 - self.alpha) / np.power(norm_F, 2)
 
-        dQ = np.empty((self.M,), dtype=object)
-        for m in xrange(self.M):
-            dFm = self._csr_from_data(dA[:, m])
-            norm_dFm = sparsetools.sum_csr_matrix_column(dFm)
-            
-            X = sparsetools.csr_matrix_scale_row(dFm, norm_F).data
-            Y = sparsetools.csr_matrix_scale_row(F, norm_dFm).data
-            dQ[m] = self._csr_from_data(X - Y)
-            sparsetools.csr_matrix_scale_row(dQ[m], denominator, inplace=True)
-
+        dQ = dA * norm_F[:, np.newaxis]
+        dQ -= A[:, np.newaxis] * norm_dF
+        dQ *= denominator[:, np.newaxis]
         return dQ
 
     def _get_stationary_distribution(self, Q0, root):
@@ -154,31 +193,67 @@ class SupervisedRWRecommender(Recommender):
         return P
 
     def _get_stationary_distribution_derivative(self, P, Q0, dQ, root):
-        shape = (self.N, self.N)
+        """iterate all M derivative columns at once
+        (converged columns are retired from the iteration)
+        """
+        Q0T = Q0.T.tocsr()
+        PdQ = self._multiply_edge_data(P, dQ)
         dP = np.zeros((self.N, self.M), order='F')
-        for m in xrange(self.M):
-            PdQ = sparsetools.vector_csr_matrix_multiply(P, dQ[m])
-            converged, delta = False, 0.0
-            for _ in xrange(self.max_steps):
-                dPQ = sparsetools.vector_csr_matrix_multiply(dP[:, m], Q0)
-                dPQ *= 1 - self.alpha
-                dPQ[root] += self.alpha * dP[:, m].sum()
-                dPm = dPQ + PdQ
-                converged, delta = check_converged(dP[:, m], dPm, self.epsilon)
-                if converged:
-                    break
-                dP[:, m] = dPm
-            if not converged:
-                print 'Warning: stationary distribution derivative does not converge ' \
-                    'in %d iteration(s) (delta=%f, m=%d)' % (self.max_steps, delta, m)
+        delta = np.zeros((self.M,))
+        active = np.arange(self.M)
+        dPa = dP[:, active]
+        for _ in xrange(self.max_steps):
+            if not active.size:
+                break
+            dPQ = Q0T.dot(dPa)
+            dPQ *= 1 - self.alpha
+            dPQ[root, :] += self.alpha * dPa.sum(axis=0)
+            dPQ += PdQ[:, active]
+            delta[active] = np.abs(dPQ - dPa).max(axis=0)
+            converged = delta[active] < self.epsilon
+            dP[:, active[converged]] = dPa[:, converged]
+            active = active[~converged]
+            dPa = dPQ[:, ~converged]
+        dP[:, active] = dPa
+        for m in active:
+            print 'Warning: stationary distribution derivative does not converge ' \
+                'in %d iteration(s) (delta=%f, m=%d)' % (self.max_steps, delta[m], m)
+        return dP
+
+    def _solve_stationary_distribution(self, solver, root):
+        restart = np.zeros((self.N,))
+        restart[root] = self.alpha
+        return solver.solve(restart)
+
+    def _solve_stationary_distribution_derivative(self, solver, P, dQ, root):
+        """solve the fixed point of the derivative iteration
+        dP = (1 - alpha) * Q0^T dP + alpha * e_root * sum(dP) + dQ^T P
+        (the rank-one term is handled by the Sherman-Morrison formula)
+        """
+        dP = solver.solve(self._multiply_edge_data(P, dQ))
+        leak = 1.0 - P.sum()  # probability lost at dangling nodes
+        if leak > 1e-10:
+            dP += np.outer(P, dP.sum(axis=0) / leak)
         return dP
 
+    def _get_stationary(self, Q0, root, dQ=None):
+        """return the stationary distribution P (and its derivative dP if dQ is given)"""
+        if self.engine == 'power':
+            P = self._get_stationary_distribution(Q0, root)
+            if dQ is None:
+                return P
+            return P, self._get_stationary_distribution_derivative(P, Q0, dQ, root)
+        solver = RestartSolver(Q0.T, self.alpha, method=self.engine)
+        P = self._solve_stationary_distribution(solver, root)
+        if dQ is None:
+            return P
+        return P, self._solve_stationary_distribution_derivative(solver, P, dQ, root)
+
     def _loss_function(self, w, psi, root, pairs):
         A, dA = self._get_edge_strength(psi, w)
         Q0 = self._get_transition_probability(A)
         dQ = self._get_transition_probability_derivative(A, dA)
-        P = self._get_stationary_distribution(Q0, root)
-        dP = self._get_stationary_distribution_derivative(P, Q0, dQ, root)
+        P, dP = self._get_stationary(Q0, root, dQ)
 
         diff = np.array([P[u] - P[v] for u, v in pairs])
         loss = sigmoid(diff / self.loss_width)
@@ -192,7 +267,7 @@ class SupervisedRWRecommender(Recommender):
 
     def _select_samples(self, user):
         positive = self.graph.neighbors(user)
-        others = set(self.candidates) - set(positive)
+        others = set(self.repos) - set(positive)
         negative = random.sample(others, min(len(positive), len(others)))
         positive = [self.node_indices[x] for x in positive]
         negative = [self.node_indices[x] for x in negative]
@@ -208,5 +283,4 @@ class SupervisedRWRecommender(Recommender):
         w, _, _ = fmin_l_bfgs_b(self._loss_function, w0, args=(psi, u, pairs), iprint=0)
         A, _ = self._get_edge_strength(psi, w)
         Q0 = self._get_transition_probability(A)
-        P = self._get_stationary_distribution(Q0, u)
-        return P
+        return self._get_stationary(Q0, u)
@@ -1,3 +1,5 @@
 from ghanalyzer.algorithms.similarities.jaccard import JaccardSimilarity
+from ghanalyzer.algorithms.similarities.minhash import MinHashSimilarity
 from ghanalyzer.algorithms.similarities.cosine import CosineSimilarity
 from ghanalyzer.algorithms.similarities.linear import LinearSimilarity
+from ghanalyzer.algorithms.similarities.hyperplane import CosineLSHIndex
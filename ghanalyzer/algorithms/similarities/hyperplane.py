@@ -0,0 +1,163 @@
+import os
+import hashlib
+
+import numpy as np
+from scipy.sparse import issparse, csr_matrix
+from sklearn.utils.extmath import safe_sparse_dot
+
+from ghanalyzer.utils.recommendation import top_indices
+
+
+def get_features_checksum(features):
+    """sha1 digest of a dense or sparse feature matrix"""
+    digest = hashlib.sha1(str(features.shape))
+    if issparse(features):
+        features = features.tocsr()
+        arrays = (features.data, features.indices, features.indptr)
+    else:
+        arrays = (features,)
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+class CosineLSHIndex(object):
+    """approximate nearest neighbor index of L2-normalized feature rows
+    by cosine similarity (random hyperplane LSH)
+
+    each of the n_tables tables hashes a row to the signs of its
+    projections on n_bits random hyperplanes, so rows with an angle theta
+    share a bucket with probability (1 - theta / pi)^n_bits. A query scores
+    the rows in its buckets (and, with probe=True, in the buckets differing
+    by one bit) exactly and returns the best of them
+    """
+
+    def __init__(self, features, n_tables=10, n_bits=16, random_seed=None,
+            block_size=10000):
+        if n_bits > 62:
+            raise ValueError('bit count must be at most 62')
+        self.features = features.tocsr() if issparse(features) else np.asarray(features)
+        self.size, dimension = self.features.shape
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.random_seed = random_seed
+        random = np.random.RandomState(random_seed)
+        self.planes = random.normal(size=(n_tables * n_bits, dimension))
+        self.checksum = get_features_checksum(self.features)
+        self.block_size = block_size
+        self._build_tables()
+
+    def _get_codes(self, features):
+        """return the bucket codes of feature rows, of shape (row count, n_tables)"""
+        projections = safe_sparse_dot(features, self.planes.T, dense_output=True)
+        bits = np.asarray(projections).reshape((-1, self.n_tables, self.n_bits)) > 0
+        return bits.dot(np.int64(1) << np.arange(self.n_bits, dtype=np.int64))
+
+    def _build_tables(self):
+        codes = np.empty((self.size, self.n_tables), dtype=np.int64)
+        for start in xrange(0, self.size, self.block_size):
+            end = min(start + self.block_size, self.size)
+            codes[start:end] = self._get_codes(self.features[start:end])
+        # rows sorted by code in each table, so that buckets are contiguous
+        self.orders = np.argsort(codes, axis=0, kind='mergesort').T.copy()
+        self.codes = codes.T[np.arange(self.n_tables)[:, np.newaxis], self.orders]
+
+    def get_candidates(self, vector, probe=True):
+        """return the sorted rows sharing a bucket with a query vector
+        (a 1-row matrix or 1-d array)
+        """
+        codes = self._get_codes(vector)[0]
+        if probe:
+            flips = np.concatenate(([0], np.int64(1) << np.arange(self.n_bits, dtype=np.int64)))
+            probes = codes[:, np.newaxis] ^ flips
+        else:
+            probes = codes[:, np.newaxis]
+        candidates = []
+        for t in xrange(self.n_tables):
+            starts = np.searchsorted(self.codes[t], probes[t], side='left')
+            ends = np.searchsorted(self.codes[t], probes[t], side='right')
+            candidates.extend(self.orders[t, s:e] for s, e in zip(starts, ends) if e > s)
+        if not candidates:
+            return np.empty((0,), dtype=np.int64)
+        return np.unique(np.concatenate(candidates))
+
+    def query(self, vector, k, excluded=None, probe=True):
+        """return (rows, scores) of the k rows most similar to a query
+        vector among its candidates, by descending score
+
+        rows in `excluded` are skipped; fewer than k rows are returned if
+        there are not enough candidates
+        """
+        candidates = self.get_candidates(vector, probe=probe)
+        if excluded is not None and len(excluded):
+            candidates = candidates[~np.in1d(candidates, excluded)]
+        if not candidates.size:
+            return candidates, np.empty((0,))
+        vector = vector.T if issparse(vector) else np.ravel(vector)
+        scores = safe_sparse_dot(self.features[candidates], vector, dense_output=True)
+        scores = np.ravel(np.asarray(scores))
+        top = top_indices(scores, k)
+        return candidates[top], scores[top]
+
+    def save(self, path):
+        arrays = {
+            'meta': np.array([self.n_tables, self.n_bits, self.block_size], dtype=np.int64),
+            'random_seed': np.array(-1 if self.random_seed is None else self.random_seed),
+            'checksum': np.array(self.checksum),
+            'planes': self.planes,
+            'codes': self.codes,
+            'orders': self.orders,
+        }
+        if issparse(self.features):
+            arrays.update({
+                'shape': np.array(self.features.shape),
+                'data': self.features.data,
+                'indices': self.features.indices,
+                'indptr': self.features.indptr,
+            })
+        else:
+            arrays['features'] = self.features
+        # write a temporary file first so that readers never see a partial index
+        with open(path + '.tmp', 'wb') as output:
+            np.savez(output, **arrays)
+        os.rename(path + '.tmp', path)
+
+
+def read_cosine_index(path):
+    with np.load(path) as data:
+        if 'features' in data:
+            features = data['features']
+        else:
+            features = csr_matrix((data['data'], data['indices'], data['indptr']),
+                shape=tuple(data['shape']))
+        n_tables, n_bits, block_size = data['meta'].tolist()
+        random_seed = data['random_seed'].item()
+        index = CosineLSHIndex.__new__(CosineLSHIndex)
+        index.features = features
+        index.size = features.shape[0]
+        index.n_tables = n_tables
+        index.n_bits = n_bits
+        index.random_seed = None if random_seed < 0 else random_seed
+        index.block_size = block_size
+        index.planes = data['planes']
+        index.checksum = data['checksum'].item()
+        index.codes = data['codes']
+        index.orders = data['orders']
+    return index
+
+def load_cosine_index(path, features, n_tables=10, n_bits=16, random_seed=None):
+    """read the index of features from path if it was built from the same
+    features and parameters (any seed if random_seed is None), otherwise
+    build it and save it to path
+    """
+    try:
+        index = read_cosine_index(path)
+    except (IOError, KeyError, ValueError):
+        index = None
+    if index is not None and index.checksum == get_features_checksum(features) and \
+            (index.n_tables, index.n_bits) == (n_tables, n_bits) and \
+            random_seed in (None, index.random_seed):
+        return index
+    index = CosineLSHIndex(features, n_tables=n_tables, n_bits=n_bits, random_seed=random_seed)
+    index.save(path)
+    return index
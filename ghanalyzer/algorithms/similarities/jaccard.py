@@ -2,61 +2,121 @@ from itertools import izip
 from operator import itemgetter
 
 import numpy as np
-from scipy.sparse import csr_matrix
+from scipy.sparse import csr_matrix, vstack
 
-from ghanalyzer.utils.datatools import slide
+from ghanalyzer.algorithms.similarities.neighbors import NeighborTable, neighbor_matrix
+from ghanalyzer.utils.recommendation import top_k_rows
 
 
 class JaccardSimilarity(object):
-    def __init__(self, features):
+    """Jaccard similarity between the rows of a feature matrix
+
+    If `n_neighbors` is given, the nearest neighbors of every object are kept
+    in a NeighborTable and the full similarity matrix is only kept
+    if `keep_matrix` is true.
+    """
+
+    def __init__(self, features, min_overlap=None, n_neighbors=None, keep_matrix=None,
+            block_size=1000):
         self.features = features.tocsr()
         self.size, _ = self.features.shape
+        self.min_overlap = min_overlap
+        self.n_neighbors = n_neighbors
+        if keep_matrix is None:
+            keep_matrix = n_neighbors is None
+        self.keep_matrix = keep_matrix
+        self.block_size = block_size
         self._initialize_similarity()
 
+    def _binarize(self, features):
+        features = features.copy()
+        features.sum_duplicates()
+        features.data = np.ones(features.data.shape)
+        return features
+
+    def _iter_blocks(self):
+        """yield (start, block) where block holds the similarities of objects
+        [start, start + block_size) to all objects
+
+        |u & v| comes from the sparse product X * X^T and
+        |u | v| = |u| + |v| - |u & v| from the feature counts
+        """
+        features = self._binarize(self.features)
+        transposed = features.T.tocsr()
+        counts = np.diff(features.indptr)
+        for start in xrange(0, self.size, self.block_size):
+            end = min(start + self.block_size, self.size)
+            block = features[start:end].dot(transposed).tocsr()
+            if self.min_overlap is not None:
+                block.data[block.data < self.min_overlap] = 0
+                block.eliminate_zeros()
+            row = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr)) + start
+            block.data /= counts[row] + counts[block.indices] - block.data
+            yield start, block
+
+    def _exclude_self(self, block, rows):
+        block = block.copy()
+        row = np.repeat(rows, np.diff(block.indptr))
+        block.data[block.indices == row] = 0
+        block.eliminate_zeros()
+        return block
+
     def _initialize_similarity(self):
-        features = self.features.tocsc()
-        
-        # count the number of object pairs sharing a certain feature
-        pair_count = sum((end-start)**2 for start, end in slide(features.indptr, 2))
-
-        row = np.zeros((pair_count,), dtype=int)
-        col = np.zeros((pair_count,), dtype=int)
-        s = 0
-        for start, end in slide(features.indptr, 2):
-            object_ids = features.indices[start:end]
-            step = len(object_ids)
-            # store all object pairs sharing the feature
-            for x in object_ids:
-                row[s:s+step] = x
-                col[s:s+step] = object_ids
-                s += step
-        data = np.ones((pair_count,))
-        
-        similarities = csr_matrix((data, (row, col)), shape=(self.size, self.size))
-        del row, col, data
-
-        features = self.features.tocsr()
-        indptr = features.indptr
-        indices = features.indices
-        coo = similarities.tocoo(copy=False)
-        for i, (u, v) in enumerate(izip(coo.row, coo.col)):
-            u_start, u_end = indptr[u], indptr[u+1]
-            v_start, v_end = indptr[v], indptr[v+1]
-            uv = set(indices[u_start:u_end]) | set(indices[v_start:v_end])
-            coo.data[i] /= float(len(uv))
+        if self.n_neighbors is not None:
+            self.neighbors = NeighborTable(self.size, self.n_neighbors)
+        else:
+            self.neighbors = None
+        blocks = []
+        for start, block in self._iter_blocks():
+            if self.neighbors is not None:
+                rows = np.arange(start, start + block.shape[0])
+                self.neighbors.update(start, self._exclude_self(block, rows))
+            if self.keep_matrix:
+                blocks.append(block)
 
+        if not self.keep_matrix:
+            self.matrix = None
+            return
+        if blocks:
+            similarities = vstack(blocks, format='csr')
+        else:
+            similarities = csr_matrix((self.size, self.size))
+        similarities.sort_indices()
         self.matrix = similarities
 
+    def _check_matrix(self):
+        if self.matrix is None:
+            raise ValueError('similarity matrix is not kept (use keep_matrix=True)')
+
     def __getitem__(self, pair):
+        self._check_matrix()
         return self.matrix[pair]
 
     def measure(self, u):
+        self._check_matrix()
         start, end = self.matrix.indptr[u:u+2]
         return list(izip(self.matrix.indices[start:end],
             self.matrix.data[start:end]))
 
     def nearest(self, u, k):
+        if self.neighbors is not None and \
+                (k <= self.neighbors.n_neighbors or self.matrix is None):
+            return self.neighbors.nearest(u, k)
         neighbors = sorted(self.measure(u), key=itemgetter(1), reverse=True)
         neighbors = list((v, s) for v, s in neighbors if v != u)
         k = min(k, len(neighbors))
         return neighbors[:k]
+
+    def nearest_matrix(self, rows, k):
+        """return the k nearest neighbors of the given objects as a sparse matrix
+        (one row for each object)
+        """
+        rows = np.asarray(rows, dtype=int)
+        if self.neighbors is not None and \
+                (k <= self.neighbors.n_neighbors or self.matrix is None):
+            return self.neighbors.to_matrix(rows, k)
+        neighbors = self._exclude_self(self.matrix[rows], rows)
+        if k < self.size - 1:
+            indices, scores = top_k_rows(neighbors, k)
+            neighbors = neighbor_matrix(indices, scores, self.size)
+        return neighbors
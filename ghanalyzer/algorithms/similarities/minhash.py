@@ -0,0 +1,140 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from ghanalyzer.algorithms.similarities.jaccard import JaccardSimilarity
+
+
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+def get_minhash_signatures(features, n_hashes, random_seed=None, block_size=1000):
+    """MinHash signatures of the rows of a binary CSR matrix
+
+    the hash functions are h(c) = (a * c + b) mod p with random a and b,
+    applied to the column indices of all the entries of a block of rows at
+    once; return an int64 array of shape (row count, n_hashes) where empty
+    rows hold p (larger than any hash value)
+    """
+    random = np.random.RandomState(random_seed)
+    a = random.randint(1, MERSENNE_PRIME, size=n_hashes).astype(np.int64)
+    b = random.randint(0, MERSENNE_PRIME, size=n_hashes).astype(np.int64)
+    size = features.shape[0]
+    signatures = np.empty((size, n_hashes), dtype=np.int64)
+    signatures.fill(MERSENNE_PRIME)
+    for start in xrange(0, size, block_size):
+        block = features[start:min(start + block_size, size)]
+        counts = np.diff(block.indptr)
+        rows = np.flatnonzero(counts)
+        if not rows.size:
+            continue
+        columns = block.indices.astype(np.int64)
+        hashes = (columns[:, np.newaxis] * a + b) % MERSENNE_PRIME
+        signatures[start + rows] = np.minimum.reduceat(hashes, block.indptr[rows], axis=0)
+    return signatures
+
+def _iter_bucket_pairs(buckets, block_size):
+    """yield (i, j) pairs with i < j of the rows sharing a bucket, in chunks
+    of at most block_size pairs (or of the pairs of a single row)
+    """
+    order = np.argsort(buckets, kind='mergesort')
+    sorted_buckets = buckets[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_buckets[1:] != sorted_buckets[:-1])))
+    ends = np.append(starts[1:], buckets.size)
+    # pair the row at each sorted position with the rows after it in its bucket
+    position = np.arange(buckets.size)
+    counts = np.repeat(ends, ends - starts) - position - 1
+    bounds = np.cumsum(counts)
+    start = 0
+    while start < buckets.size:
+        limit = bounds[start] - counts[start] + block_size
+        end = max(np.searchsorted(bounds, limit, side='right'), start + 1)
+        chunk_counts = counts[start:end]
+        total = chunk_counts.sum()
+        if total:
+            first = np.repeat(position[start:end], chunk_counts)
+            second = first + 1 + np.arange(total) - \
+                np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+            yield order[first], order[second]
+        start = end
+
+
+class MinHashSimilarity(JaccardSimilarity):
+    """approximate Jaccard similarity between the rows of a feature matrix
+
+    rows are compared only if their MinHash signatures (n_bands * n_rows
+    hashes) agree on all the hashes of at least one band, which happens with
+    probability 1 - (1 - s^n_rows)^n_bands for rows of Jaccard similarity s.
+    The similarities of these candidate pairs are exact, but the neighbors
+    of a row are only the best of its candidates, so they may differ from
+    its exact neighbors
+    """
+
+    def __init__(self, features, min_overlap=None, n_neighbors=None, keep_matrix=None,
+            block_size=1000, n_bands=20, n_rows=5, random_seed=None, pair_block_size=100000):
+        self.n_bands = n_bands
+        self.n_rows = n_rows
+        self.random_seed = random_seed
+        self.pair_block_size = pair_block_size
+        super(MinHashSimilarity, self).__init__(features, min_overlap=min_overlap,
+            n_neighbors=n_neighbors, keep_matrix=keep_matrix, block_size=block_size)
+
+    def _get_candidates(self, features):
+        """return the sorted unique keys (i * size + j, i < j) of candidate pairs"""
+        signatures = get_minhash_signatures(features, self.n_bands * self.n_rows,
+            random_seed=self.random_seed, block_size=self.block_size)
+        nonempty = np.flatnonzero(np.diff(features.indptr))
+        keys = np.empty((0,), dtype=np.int64)
+        # chunks of keys are merged once they are as large as the merged keys
+        # so that at most about twice the candidate keys are held at once
+        pending, pending_size = [], 0
+        for band in xrange(self.n_bands):
+            columns = slice(band * self.n_rows, (band + 1) * self.n_rows)
+            band_signatures = np.ascontiguousarray(signatures[nonempty, columns])
+            _, buckets = np.unique(band_signatures.view(
+                np.dtype((np.void, band_signatures.dtype.itemsize * self.n_rows))),
+                return_inverse=True)
+            for first, second in _iter_bucket_pairs(buckets.ravel(), self.pair_block_size):
+                first, second = nonempty[first], nonempty[second]
+                low, high = np.minimum(first, second), np.maximum(first, second)
+                pending.append(np.unique(low * self.size + high))
+                pending_size += pending[-1].size
+                if pending_size >= max(keys.size, self.pair_block_size):
+                    keys = np.union1d(keys, np.concatenate(pending))
+                    pending, pending_size = [], 0
+        if pending:
+            keys = np.union1d(keys, np.concatenate(pending))
+        self.candidate_count = keys.size
+        return keys
+
+    def _get_overlaps(self, features, first, second):
+        overlaps = np.empty(first.shape)
+        for start in xrange(0, first.size, self.pair_block_size):
+            end = start + self.pair_block_size
+            both = features[first[start:end]].multiply(features[second[start:end]])
+            overlaps[start:end] = np.asarray(both.sum(axis=1)).ravel()
+        return overlaps
+
+    def _iter_blocks(self):
+        """yield (start, block) like JaccardSimilarity._iter_blocks but with
+        only the similarities of candidate pairs (and of rows to themselves)
+        """
+        features = self._binarize(self.features)
+        counts = np.diff(features.indptr)
+        keys = self._get_candidates(features)
+        first, second = keys // self.size, keys % self.size
+        overlaps = self._get_overlaps(features, first, second)
+        if self.min_overlap is not None:
+            selected = overlaps >= self.min_overlap
+            first, second, overlaps = first[selected], second[selected], overlaps[selected]
+        similarities = overlaps / (counts[first] + counts[second] - overlaps)
+
+        nonempty = np.flatnonzero(counts)
+        if self.min_overlap is not None:
+            nonempty = nonempty[counts[nonempty] >= self.min_overlap]
+        row = np.concatenate((first, second, nonempty))
+        column = np.concatenate((second, first, nonempty))
+        data = np.concatenate((similarities, similarities, np.ones(nonempty.shape)))
+        matrix = csr_matrix((data, (row, column)), shape=(self.size, self.size))
+        matrix.eliminate_zeros()
+        for start in xrange(0, self.size, self.block_size):
+            yield start, matrix[start:min(start + self.block_size, self.size)]
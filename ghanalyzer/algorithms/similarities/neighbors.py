@@ -0,0 +1,49 @@
+from itertools import izip
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from ghanalyzer.utils.recommendation import top_k_rows
+
+
+def neighbor_matrix(indices, scores, size):
+    """build a sparse matrix from padded (indices, scores) neighbor arrays"""
+    valid = indices >= 0
+    indptr = np.concatenate(([0], np.cumsum(valid.sum(axis=1))))
+    return csr_matrix((scores[valid], indices[valid], indptr),
+        shape=(indices.shape[0], size))
+
+
+class NeighborTable(object):
+    """fixed-width table of the nearest neighbors of each object
+
+    row u of `indices` holds the neighbors of u by descending score
+    (padded with -1) and row u of `scores` holds their similarities
+    """
+
+    def __init__(self, size, n_neighbors):
+        self.size = size
+        self.n_neighbors = n_neighbors
+        self.indices = np.empty((size, n_neighbors), dtype=np.int32)
+        self.indices.fill(-1)
+        self.scores = np.zeros((size, n_neighbors))
+
+    def update(self, start, block):
+        """fill the rows [start, start + block.shape[0]) from a sparse block
+        of similarities
+        """
+        indices, scores = top_k_rows(block, self.n_neighbors)
+        end = start + block.shape[0]
+        self.indices[start:end, :] = indices
+        self.scores[start:end, :] = scores
+
+    def nearest(self, u, k):
+        indices = self.indices[u, :k]
+        count = np.count_nonzero(indices >= 0)
+        return list(izip(indices[:count], self.scores[u, :count]))
+
+    def to_matrix(self, rows=None, k=None):
+        """return the neighbors of the given rows as a sparse matrix"""
+        if rows is None:
+            rows = np.arange(self.size)
+        return neighbor_matrix(self.indices[rows, :k], self.scores[rows, :k], self.size)
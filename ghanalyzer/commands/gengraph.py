@@ -2,6 +2,7 @@ import networkx as nx
 
 from ghanalyzer.command import AnalyzerCommand
 from ghanalyzer.io import load_graph, load_node_attributes, write_json_graph
+from ghanalyzer.io.attributes import load_node_attribute_columns
 from ghanalyzer.io.graphs import GRAPH_METADATA, load_language_graph
 
 class Command(AnalyzerCommand):
@@ -12,21 +13,33 @@ class Command(AnalyzerCommand):
         parser.add_argument('type', choices=GRAPH_METADATA.keys()+['language'])
         parser.add_argument('-d', '--data-path', required=True)
         parser.add_argument('-a', '--load-attributes', action='store_true')
+        parser.add_argument('--columnar', action='store_true')
         parser.add_argument('-o', '--output')
         parser.add_argument('-f', '--format', choices=['json'], default='json')
+        parser.add_argument('--no-cache', action='store_true')
+        parser.add_argument('--workers', type=int, default=1)
     
     def run(self, args):
         if args.type in GRAPH_METADATA:
-            graph = load_graph(args.data_path, args.type)
+            graph = load_graph(args.data_path, args.type, use_cache=not args.no_cache,
+                workers=args.workers)
         elif args.type == 'language':
-            graph = load_language_graph(args.data_path)
-        if args.load_attributes:
-            load_node_attributes(args.data_path, graph)
+            graph = load_language_graph(args.data_path, workers=args.workers)
+        attributes = None
+        if args.load_attributes and args.columnar:
+            # keep attributes in columns (saved next to the graph) instead of node dicts
+            attributes = load_node_attribute_columns(args.data_path, graph.nodes(),
+                workers=args.workers)
+            print 'Node attribute count: %d' % len(attributes.columns)
+        elif args.load_attributes:
+            load_node_attributes(args.data_path, graph, workers=args.workers)
         
         print nx.info(graph)
 
         if args.output:
             if args.format == 'json':
                 write_json_graph(args.output, graph, indent=4)
+            if attributes is not None:
+                attributes.save(args.output + '.attributes.npz')
         
-        return {'graph': graph}
+        return {'graph': graph, 'attributes': attributes}
@@ -0,0 +1,69 @@
+import time
+
+import numpy as np
+
+from ghanalyzer.command import AnalyzerCommand
+from ghanalyzer.io import load_graph, read_json_graph
+from ghanalyzer.io.graphs import GRAPH_METADATA
+from ghanalyzer.algorithms.graphs import Bigraph
+from ghanalyzer.algorithms.similarities import JaccardSimilarity, MinHashSimilarity
+from ghanalyzer.evaluation.metrics import get_neighbor_recall
+from ghanalyzer.models import User, Repository
+
+
+class Command(AnalyzerCommand):
+    def description(self):
+        return 'compare approximate (MinHash LSH) neighbors with exact Jaccard neighbors'
+
+    def define_arguments(self, parser):
+        parser.add_argument('type', choices=['user', 'item'])
+        parser.add_argument('-p', '--path', required=True)
+        parser.add_argument('-f', '--format', choices=['json', 'jsonl'], default='json')
+        parser.add_argument('--graph-type', choices=GRAPH_METADATA.keys(), default='stargazer')
+        parser.add_argument('--no-cache', action='store_true')
+        parser.add_argument('-k', '--neighbor-count', type=int, default=10)
+        parser.add_argument('--bands', nargs='+', type=int, default=[10, 20, 50])
+        parser.add_argument('--rows', nargs='+', type=int, default=[2, 5])
+        parser.add_argument('--sample', type=int, default=None)
+        parser.add_argument('--random-seed', type=int, default=None)
+
+    def run(self, args):
+        if args.format == 'json':
+            graph = read_json_graph(args.path)
+        elif args.format == 'jsonl':
+            graph = load_graph(args.path, args.graph_type, use_cache=not args.no_cache)
+        if args.type == 'user':
+            bigraph = Bigraph(graph, source_cls=User, target_cls=Repository)
+        else:
+            bigraph = Bigraph(graph, source_cls=Repository, target_cls=User)
+        features = bigraph.matrix
+        k = args.neighbor_count
+
+        rows = None
+        if args.sample is not None and args.sample < features.shape[0]:
+            random = np.random.RandomState(args.random_seed)
+            rows = random.choice(features.shape[0], args.sample, replace=False)
+
+        start = time.time()
+        exact = JaccardSimilarity(features, n_neighbors=k)
+        print 'Exact: time=%.2fs' % (time.time() - start)
+
+        results = []
+        for n_bands in args.bands:
+            for n_rows in args.rows:
+                start = time.time()
+                approximate = MinHashSimilarity(features, n_neighbors=k, n_bands=n_bands,
+                    n_rows=n_rows, random_seed=args.random_seed)
+                elapsed = time.time() - start
+                recall = get_neighbor_recall(approximate, exact, k, rows)
+                print 'bands=%d, rows=%d: R@%d=%f, candidates=%d, time=%.2fs' % (
+                    n_bands, n_rows, k, recall, approximate.candidate_count, elapsed)
+                results.append({
+                    'n_bands': n_bands,
+                    'n_rows': n_rows,
+                    'recall': recall,
+                    'candidate_count': approximate.candidate_count,
+                    'time': elapsed,
+                })
+
+        return {'graph': graph, 'bigraph': bigraph, 'exact': exact, 'results': results}
@@ -1,6 +1,18 @@
+import random
+
+import numpy as np
+
 
 from ghanalyzer.command import AnalyzerCommand
-from ghanalyzer.io import read_json_graph, write_json_report, write_pickle_report
+from ghanalyzer.io import (
+    load_graph,
+    read_json_graph,
+    write_json_report,
+    write_pickle_report,
+    write_binary_report,
+    read_jsonl_report,
+    JsonLineReportWriter,
+)
 from ghanalyzer.algorithms.recommenders import (
     RandomRecommender,
     UserCFRecommender,
@@ -15,6 +27,8 @@ from ghanalyzer.algorithms.recommenders import (
     PersonalRankRecommender,
     SupervisedRWRecommender,
 )
+from ghanalyzer.algorithms.artifacts import configure_registry, DEFAULT_MAX_COUNT
+from ghanalyzer.io.graphs import GRAPH_METADATA
 from ghanalyzer.evaluation.experiments import RecommenderTest
 from ghanalyzer.evaluation.metrics import get_frequencies, precision_recall_curve
 
@@ -29,18 +43,31 @@ class Command(AnalyzerCommand):
                 'QuasiUserCF', 'QuasiItemCF', 'FollowerBased', 'FolloweeBased',
                 'NMF', 'RandomWalk', 'SupervisedRW'])
         parser.add_argument('-p', '--path', required=True)
-        parser.add_argument('-f', '--format', choices=['json'], default='json')
+        parser.add_argument('-f', '--format', choices=['json', 'jsonl'], default='json')
+        parser.add_argument('--graph-type', choices=GRAPH_METADATA.keys(), default='stargazer')
+        parser.add_argument('--no-cache', action='store_true')
         parser.add_argument('-o', '--output')
-        parser.add_argument('--output-format', choices=['json', 'pickle'], default='json')
+        parser.add_argument('--output-format', choices=['json', 'jsonl', 'pickle', 'binary'],
+            default='json')
 
         group = parser.add_argument_group('experiment options')
         group.add_argument('--train-ratio', type=float, default=0.8)
         group.add_argument('--recommendation-count', type=int, default=None)
         group.add_argument('--random-seed', type=int, default=None)
         group.add_argument('--print-every', type=int, default=None)
+        group.add_argument('--batch-size', type=int, default=100)
+        group.add_argument('--workers', type=int, default=1)
+        group.add_argument('--checkpoint', default=None)
+        group.add_argument('--artifact-path', default=None)
+        group.add_argument('--artifact-memory', type=int, default=None)
+        group.add_argument('--artifact-count', type=int, default=DEFAULT_MAX_COUNT)
 
         group = parser.add_argument_group('recommender parameters')
         group.add_argument('--neighbor-count', type=int, default=None)
+        group.add_argument('--similarity-type', choices=['jaccard', 'minhash'],
+            default='jaccard')
+        group.add_argument('--band-count', type=int, default=20)
+        group.add_argument('--row-count', type=int, default=5)
         group.add_argument('--component-count', type=int, default=10)
         group.add_argument('--alpha', type=float, default=0.15)
         group.add_argument('--lambda-w', type=float, default=0.01)
@@ -48,77 +75,151 @@ class Command(AnalyzerCommand):
         group.add_argument('--loss-width', type=float, default=1.0)
         group.add_argument('--weight-key', nargs='+', default=())
         group.add_argument('--max-steps', type=int, default=10)
+        group.add_argument('--memory-limit', type=int, default=256)
+        group.add_argument('--engine', default='power',
+            choices=['power', 'push', 'direct', 'gmres', 'bicgstab'])
+        group.add_argument('--tolerance', type=float, default=1e-4)
+        group.add_argument('--push-error-sample', type=int, default=None)
         group.add_argument('--data-path', default='')
+        group.add_argument('--similarity-path', default=None)
+        group.add_argument('--table-count', type=int, default=None)
+        group.add_argument('--bit-count', type=int, default=16)
+        group.add_argument('--index-path', default=None)
         group.add_argument('--graph-path', nargs='+', default=())
         group.add_argument('--feature-types', nargs='+', default=(),
             choices=['behavior', 'content', 'relation'])
 
     def run(self, args):
+        configure_registry(spill_path=args.artifact_path,
+            memory_limit=args.artifact_memory, max_count=args.artifact_count)
         recommender = self._create_recommender(args)
         graph = self._load_dataset(args)
         
         test = RecommenderTest(recommender, graph,
             train_ratio=args.train_ratio, n_recommendations=args.recommendation_count,
-            random_seed=args.random_seed)
-        test.run(print_every=args.print_every)
+            random_seed=args.random_seed, batch_size=args.batch_size,
+            workers=args.workers)
+        if args.output and args.output_format == 'jsonl':
+            # stream records to the output instead of keeping them in memory
+            with JsonLineReportWriter(args.output) as writer:
+                test.run(print_every=args.print_every, writer=writer,
+                    checkpoint=args.checkpoint)
+                self._update_report(test.report, test.recommender, args)
+                writer.write_header(test.report)
+            report = read_jsonl_report(args.output)
+        else:
+            test.run(print_every=args.print_every, checkpoint=args.checkpoint)
+            self._update_report(test.report, test.recommender, args)
+            self._write_report(test.report, args)
+            report = test.report
         
-        test.report['name'] = args.recommender
-        test.report['experiment_parameters'] = {
+        frequencies = get_frequencies(report)
+        precision, recall = precision_recall_curve(frequencies)
+        print 'Precision: %f' % precision
+        print 'Recall: %f' % recall
+
+        return {'graph': graph, 'recommender': test.recommender, 'test': test}
+
+    def _update_report(self, report, recommender, args):
+        report['name'] = args.recommender
+        report['experiment_parameters'] = {
             'train_ratio': args.train_ratio,
             'random_seed': args.random_seed,
             'recommendation_count': args.recommendation_count,
         }
-        test.report['recommender_parameters'] = recommender.get_parameters()
-        self._write_report(test.report, args)
-        
-        frequencies = get_frequencies(test.report)
-        precision, recall = precision_recall_curve(frequencies)
-        print 'Precision: %f' % precision
-        print 'Recall: %f' % recall
+        report['recommender_parameters'] = recommender.get_parameters()
+        if args.push_error_sample and isinstance(recommender, PersonalRankRecommender) \
+                and recommender.engine == 'push':
+            report['push_error'] = self._measure_push_error(recommender, report['users'],
+                args.push_error_sample, args)
 
-        return {'graph': graph, 'recommender': recommender, 'test': test}
+    def _measure_push_error(self, recommender, users, sample_size, args):
+        """average the push errors (see PersonalRankRecommender.get_push_error)
+        over a sample of the test users
+        """
+        users = [x for x in users if x in recommender.node_indices]
+        users = random.Random(args.random_seed).sample(users, min(sample_size, len(users)))
+        errors = [recommender.get_push_error(x, args.recommendation_count) for x in users]
+        result = {k: float(np.mean([e[k] for e in errors])) if errors else None
+            for k in ('l1', 'max', 'overlap')}
+        result['sample_size'] = len(users)
+        print 'Push error on %d user(s): L1=%s, max=%s, overlap=%s' % (len(users),
+            result['l1'], result['max'], result['overlap'])
+        return result
 
     def _create_recommender(self, args):
         if args.recommender == 'Random':
             recommender = RandomRecommender()
         elif args.recommender == 'UserCF':
-            recommender = UserCFRecommender(n_neighbors=args.neighbor_count)
+            recommender = UserCFRecommender(n_neighbors=args.neighbor_count,
+                similarity_type=args.similarity_type, n_bands=args.band_count,
+                n_rows=args.row_count, random_seed=args.random_seed)
         elif args.recommender == 'ItemCF':
-            recommender = ItemCFRecommender(n_neighbors=args.neighbor_count)
+            recommender = ItemCFRecommender(n_neighbors=args.neighbor_count,
+                similarity_type=args.similarity_type, n_bands=args.band_count,
+                n_rows=args.row_count, random_seed=args.random_seed)
         elif args.recommender == 'LanguageBased':
-            recommender = LanguageBasedRecommender(data_path=args.data_path)
+            recommender = LanguageBasedRecommender(data_path=args.data_path,
+                n_neighbors=args.neighbor_count, memmap_path=args.similarity_path,
+                n_tables=args.table_count, n_bits=args.bit_count, index_path=args.index_path,
+                random_seed=args.random_seed, workers=args.workers)
         elif args.recommender == 'DescriptionBased':
-            recommender = DescriptionBasedRecommender(data_path=args.data_path)
+            recommender = DescriptionBasedRecommender(data_path=args.data_path,
+                n_neighbors=args.neighbor_count, memmap_path=args.similarity_path,
+                n_tables=args.table_count, n_bits=args.bit_count, index_path=args.index_path,
+                random_seed=args.random_seed, workers=args.workers)
         elif args.recommender == 'QuasiUserCF':
-            recommender = QuasiUserCFRecommender(data_path=args.data_path)
+            recommender = QuasiUserCFRecommender(data_path=args.data_path,
+                n_neighbors=args.neighbor_count, memmap_path=args.similarity_path,
+                n_tables=args.table_count, n_bits=args.bit_count, index_path=args.index_path,
+                random_seed=args.random_seed, workers=args.workers)
         elif args.recommender == 'QuasiItemCF':
-            recommender = QuasiItemCFRecommender(data_path=args.data_path)
+            recommender = QuasiItemCFRecommender(data_path=args.data_path,
+                n_neighbors=args.neighbor_count, memmap_path=args.similarity_path,
+                n_tables=args.table_count, n_bits=args.bit_count, index_path=args.index_path,
+                random_seed=args.random_seed, workers=args.workers)
         elif args.recommender == 'FollowerBased':
-            recommender = FollowerBasedRecommender(data_path=args.data_path)
+            recommender = FollowerBasedRecommender(data_path=args.data_path,
+                n_neighbors=args.neighbor_count, memmap_path=args.similarity_path,
+                n_tables=args.table_count, n_bits=args.bit_count, index_path=args.index_path,
+                random_seed=args.random_seed, workers=args.workers)
         elif args.recommender == 'FolloweeBased':
-            recommender = FolloweeBasedRecommender(data_path=args.data_path)
+            recommender = FolloweeBasedRecommender(data_path=args.data_path,
+                n_neighbors=args.neighbor_count, memmap_path=args.similarity_path,
+                n_tables=args.table_count, n_bits=args.bit_count, index_path=args.index_path,
+                random_seed=args.random_seed, workers=args.workers)
         elif args.recommender == 'NMF':
             recommender = NMFRecommender(n_components=args.component_count)
         elif args.recommender == 'RandomWalk':
             recommender = PersonalRankRecommender(alpha=args.alpha, max_steps=args.max_steps,
-                epsilon=args.epsilon)
+                epsilon=args.epsilon, memory_limit=args.memory_limit,
+                engine=args.engine, tolerance=args.tolerance)
             recommender.add_other_graphs(*self._load_graphs(args))
         elif args.recommender == 'SupervisedRW':
             recommender = SupervisedRWRecommender(data_path=args.data_path,
                 alpha=args.alpha, max_steps=args.max_steps, lambda_=args.lambda_w,
                 epsilon=args.epsilon, loss_width=args.loss_width,
-                weight_key=args.weight_key, feature_types=args.feature_types)
+                weight_key=args.weight_key, feature_types=args.feature_types,
+                engine=args.engine, workers=args.workers)
         return recommender
 
     def _load_dataset(self, args):
         if args.format == 'json':
             return read_json_graph(args.path)
+        elif args.format == 'jsonl':
+            # path is the crawled data directory
+            return load_graph(args.path, args.graph_type, use_cache=not args.no_cache,
+                workers=args.workers)
 
     def _load_graphs(self, args):
         if not args.graph_path:
             return []
         if args.format == 'json':
             return [read_json_graph(path) for path in args.graph_path]
+        elif args.format == 'jsonl':
+            # graph paths are graph types in the crawled data directory
+            return [load_graph(args.path, graph_type, use_cache=not args.no_cache,
+                workers=args.workers) for graph_type in args.graph_path]
 
     def _write_report(self, report, args):
         if not args.output:
@@ -127,3 +228,5 @@ class Command(AnalyzerCommand):
             write_json_report(args.output, report, indent=4)
         elif args.output_format == 'pickle':
             write_pickle_report(args.output, report)
+        elif args.output_format == 'binary':
+            write_binary_report(args.output, report)
@@ -4,12 +4,20 @@ import numpy as np
 from matplotlib import pyplot
 
 from ghanalyzer.command import AnalyzerCommand
-from ghanalyzer.io import read_json_report, read_pickle_report
+from ghanalyzer.io import (
+    read_json_report,
+    read_jsonl_report,
+    read_pickle_report,
+    read_binary_report,
+)
 from ghanalyzer.evaluation.metrics import (
+    get_report_matrices,
     get_frequencies,
     get_precision,
     get_recall,
     get_mean_average_precision,
+    get_mean_ndcg,
+    get_mean_reciprocal_rank,
     get_roc_auc,
 )
 from ghanalyzer.visualization.reports import plot_precision_recall, plot_roc
@@ -22,10 +30,12 @@ class Command(AnalyzerCommand):
     def define_arguments(self, parser):
         parser.add_argument('type', choices=['pr', 'roc', 'metric'])
         parser.add_argument('-p', '--path', nargs='+', required=True)
-        parser.add_argument('-f', '--format', choices=['json', 'pickle'], default='json')
+        parser.add_argument('-f', '--format', choices=['json', 'jsonl', 'pickle', 'binary'],
+            default='json')
         parser.add_argument('-r', '--ranks', nargs='+', type=int, default=())
         parser.add_argument('--show-precision', action='store_true')
         parser.add_argument('--show-recall', action='store_true')
+        parser.add_argument('--show-ndcg', action='store_true')
     
     def run(self, args):
         reports = self._iter_reports(args)
@@ -37,16 +47,20 @@ class Command(AnalyzerCommand):
         elif args.type == 'metric':
             self.show_metrics(reports, args.ranks,
                 show_precision=args.show_precision,
-                show_recall=args.show_recall)
+                show_recall=args.show_recall,
+                show_ndcg=args.show_ndcg)
 
         pyplot.show(block=not args.interactive)
 
-    def show_metrics(self, reports, ranks, show_precision=False, show_recall=False):
+    def show_metrics(self, reports, ranks, show_precision=False, show_recall=False,
+            show_ndcg=False):
         for i, report in enumerate(reports):
-            frequencies = get_frequencies(report, cutoff=ranks)
+            matrices = get_report_matrices(report)
+            frequencies = get_frequencies(matrices, cutoff=ranks)
             precision = np.atleast_1d(get_precision(frequencies))
             recall = np.atleast_1d(get_recall(frequencies))
-            map_ = get_mean_average_precision(report)
+            map_ = get_mean_average_precision(matrices)
+            mrr = get_mean_reciprocal_rank(matrices)
             auc = get_roc_auc(frequencies)
             name = report.get('name', '?')
             filename = report.get('filename', '?')
@@ -58,15 +72,23 @@ class Command(AnalyzerCommand):
             if show_recall:
                 for i, k in enumerate(ranks):
                     print 'R@%d=%f, ' % (k, recall[i]),
-            print 'MAP=%f, AUC=%f' % (map_, auc)
+            if show_ndcg:
+                for k in ranks:
+                    print 'nDCG@%d=%f, ' % (k, get_mean_ndcg(matrices, k)),
+            print 'MAP=%f, MRR=%f, AUC=%f' % (map_, mrr, auc)
 
     def _iter_reports(self, args):
         if args.format == 'json':
             read_report = read_json_report
+        elif args.format == 'jsonl':
+            read_report = read_jsonl_report
         elif args.format == 'pickle':
             read_report = read_pickle_report
+        elif args.format == 'binary':
+            read_report = read_binary_report
 
         for path in args.path:
             report = read_report(path)
-            report['filename'] = os.path.basename(path)
+            # binary reports are directories, which may end with a separator
+            report['filename'] = os.path.basename(os.path.normpath(path))
             yield report
@@ -1,8 +1,21 @@
+import os
+import json
 import random
+import cPickle as pickle
+from itertools import izip
+from multiprocessing import Pool
+
+import numpy as np
 
 from ghanalyzer.algorithms.graphs import *
 from ghanalyzer.models import *
 
+
+_worker_test = None  # test shared with the forked worker processes
+
+def _recommend_batch(args):
+    return _worker_test._recommend_batch(*args)
+
 def separate_graph_data(graph, train_ratio=0.8, random_seed=None):
     r = random.Random()
     r.seed(random_seed)
@@ -16,13 +29,84 @@ def separate_graph_data(graph, train_ratio=0.8, random_seed=None):
     return train, test
 
 
+class TestCheckpoint(object):
+    """directory keeping the state of a RecommenderTest so that an
+    interrupted run can be resumed
+
+    it holds the parameters of the test (a resumed test must use the same
+    ones), the train/test split, the trained recommender (if it can be
+    pickled) and the recommendations of every finished batch
+    """
+
+    def __init__(self, path, parameters):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        parameters = json.loads(json.dumps(parameters, default=repr))
+        filename = self._get_path('parameters.json')
+        if os.path.exists(filename):
+            with open(filename) as f:
+                if json.load(f) != parameters:
+                    raise ValueError('checkpoint %s was created with different parameters' % path)
+        else:
+            with open(filename, 'w') as output:
+                json.dump(parameters, output)
+
+    def _get_path(self, name):
+        return os.path.join(self.path, name)
+
+    def load(self, name):
+        filename = self._get_path(name + '.pickle')
+        if not os.path.exists(filename):
+            return None
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, name, obj):
+        filename = self._get_path(name + '.pickle')
+        try:
+            with open(filename + '.tmp', 'wb') as output:
+                pickle.dump(obj, output, pickle.HIGHEST_PROTOCOL)
+        except:
+            os.remove(filename + '.tmp')
+            raise
+        os.rename(filename + '.tmp', filename)
+
+    def load_batches(self):
+        """return the recommendations of finished batches keyed by their start"""
+        filename = self._get_path('batches.pickle')
+        batches = {}
+        if not os.path.exists(filename):
+            return batches
+        with open(filename, 'r+b') as f:
+            end = 0
+            while True:
+                try:
+                    start, recommended = pickle.load(f)
+                except Exception:  # end of file or a batch interrupted while writing
+                    break
+                batches[start] = recommended
+                end = f.tell()
+            f.truncate(end)
+        return batches
+
+    def save_batch(self, start, recommended):
+        with open(self._get_path('batches.pickle'), 'ab') as output:
+            pickle.dump((start, recommended), output, pickle.HIGHEST_PROTOCOL)
+            output.flush()
+            os.fsync(output.fileno())
+
+
 class RecommenderTest(object):
     def __init__(self, recommender, graph, train_ratio, n_recommendations=None,
-            random_seed=None):
+            random_seed=None, batch_size=100, workers=1):
         self.recommender = recommender
         self.graph = graph
         self.train_ratio = train_ratio
         self.n_recommendations = n_recommendations
+        self.random_seed = random_seed
+        self.batch_size = batch_size
+        self.workers = workers
         self.train_graph, self.test_graph = separate_graph_data(self.graph,
             train_ratio=self.train_ratio, random_seed=random_seed)
 
@@ -32,41 +116,151 @@ class RecommenderTest(object):
             self._report = {}
         return self._report
 
-    def run(self, print_every=None):
+    def _recommend_batch(self, start, users):
+        # seed each batch so that the results do not depend on the worker count
+        if self.random_seed is not None:
+            seed = hash((self.random_seed, start)) & 0xffffffff
+            random.seed(seed)
+            np.random.seed(seed)
+        return self.recommender.recommend_many(users, self.n_recommendations)
+
+    def _iter_batches(self, cases, finished=None):
+        """generate (start, recommendations) of every batch in order
+        (batches in `finished` are not recommended again)
+        """
+        finished = finished or {}
+        batches = [(start, [x[0] for x in cases[start:start+self.batch_size]])
+            for start in xrange(0, len(cases), self.batch_size)]
+        pending = [x for x in batches if x[0] not in finished]
+        if self.workers <= 1 or not pending:
+            results = (self._recommend_batch(start, users) for start, users in pending)
+            for start, _ in batches:
+                yield start, finished[start] if start in finished else next(results)
+            return
+
+        # fork after training so that workers share the trained recommender
+        global _worker_test
+        _worker_test = self
+        pool = Pool(self.workers)
+        try:
+            results = pool.imap(_recommend_batch, pending)
+            for start, _ in batches:
+                yield start, finished[start] if start in finished else next(results)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            _worker_test = None
+
+    def _get_checkpoint_parameters(self):
+        return {
+            'recommender': type(self.recommender).__name__,
+            'recommender_parameters': self.recommender.get_parameters(),
+            'train_ratio': self.train_ratio,
+            'n_recommendations': self.n_recommendations,
+            'random_seed': self.random_seed,
+            'batch_size': self.batch_size,
+        }
+
+    def _restore_split(self, checkpoint):
+        split = checkpoint.load('split')
+        if split is None:
+            checkpoint.save('split', self.test_graph.edges())
+            return
+        self.train_graph = self.graph.copy()
+        self.train_graph.remove_edges_from(split)
+        self.test_graph = self.graph.copy()
+        self.test_graph.remove_edges_from(self.train_graph.edges())
+
+    def _train(self, checkpoint=None):
+        if checkpoint is not None:
+            recommender = checkpoint.load('recommender')
+            if recommender is not None:
+                print 'Restored trained recommender from checkpoint.'
+                self.recommender = recommender
+                return
+
         print 'Start training recommender...'
         self.recommender.train(self.train_graph)
         print 'Done.'
 
+        if checkpoint is not None:
+            try:
+                checkpoint.save('recommender', self.recommender)
+            except (pickle.PicklingError, TypeError) as e:
+                print 'Warning: trained recommender is not saved (%s)' % e
+
+    def run(self, print_every=None, writer=None, checkpoint=None):
+        """train the recommender and generate recommendations for test users
+
+        records are passed to `writer` as they are generated if it is given
+        (and are not kept in the report), otherwise they are collected in
+        report['recommendation']
+
+        if `checkpoint` (a directory) is given, the state of the test is
+        saved there after training and after each batch, and a test run
+        again with the same checkpoint skips the finished work
+        """
+        if checkpoint is not None:
+            checkpoint = TestCheckpoint(checkpoint, self._get_checkpoint_parameters())
+            self._restore_split(checkpoint)
+        self._train(checkpoint)
+
         users = get_nodes(self.test_graph, User)
         repos = get_nodes(self.test_graph, Repository)
 
         print 'User count: %d' % len(users)
         print 'Repository count: %d' % len(repos)
-        
-        recommendation = []
-        for i, user in enumerate(users):
-            if print_every is not None and i % print_every == 0:
-                print 'Generating recommendation for user %d...' % i
-            training = self.train_graph.neighbors(user)
-            groundtruth = self.test_graph.neighbors(user)
-            if not training or not groundtruth:
-                continue
-            recommended = self.recommender.recommend(user, self.n_recommendations)
-            recommendation.append({
-                'user': user,
-                'training': training,
-                'recommended': recommended,
-                'groundtruth': groundtruth,
-            })
 
         self.report.update({
             'users': users,
             'repos': repos,
             'user_count': len(users),
             'repo_count': len(repos),
-            'recommendation': recommendation,
             'recommendation_length': self.n_recommendations,
         })
+        if writer is not None:
+            # records streamed before an interruption can be read with this header
+            writer.write_header(self.report)
+        
+        cases = []
+        for user in users:
+            training = self.train_graph.neighbors(user)
+            groundtruth = self.test_graph.neighbors(user)
+            if not training or not groundtruth:
+                continue
+            cases.append((user, training, groundtruth))
+
+        finished = {}
+        if checkpoint is not None:
+            finished = checkpoint.load_batches()
+            if finished:
+                print 'Restored %d finished batch(es) from checkpoint.' % len(finished)
+
+        recommendation = []
+        count = 0
+        for start, recommended in self._iter_batches(cases, finished):
+            if checkpoint is not None and start not in finished:
+                checkpoint.save_batch(start, recommended)
+            batch = cases[start:start+len(recommended)]
+            end = start + len(batch)
+            if print_every is not None and (start - 1) // print_every < (end - 1) // print_every:
+                print 'Generated recommendation for user %d-%d.' % (start, end - 1)
+            for (user, training, groundtruth), r in izip(batch, recommended):
+                record = {
+                    'user': user,
+                    'training': training,
+                    'recommended': r,
+                    'groundtruth': groundtruth,
+                }
+                if writer is None:
+                    recommendation.append(record)
+                else:
+                    writer.write(record)
+                count += 1
+
+        if writer is None:
+            self.report['recommendation'] = recommendation
 
         print 'Finish generating recommendations for %d of %d user(s).' % (
-            len(recommendation), len(users))
+            count, len(users))
@@ -1,37 +1,146 @@
+from array import array
+
 import numpy as np
+from scipy.sparse import csr_matrix
 from scipy.stats import nanmean
 
+from ghanalyzer.io.experiments import REPORT_FIELDS, ReportRecords
+
+
+class ReportMatrices(object):
+    """sparse (case, repository) data of the recommendation records in a report
+
+    training and groundtruth repositories are kept as sorted unique keys
+    (row * repo_count + column), and recommended repositories as entries
+    sorted by (row, position) where position is the 1-based rank;
+    `hits` is a sparse (case, rank) matrix marking the ranks of groundtruth
+    repositories in each recommendation list
+    """
+
+    def __init__(self, report):
+        if isinstance(report['recommendation'], ReportRecords):
+            rows, columns = self._read_indices(report)
+        else:
+            rows, columns = self._read_records(report)
+
+        def _get_keys(k):
+            return np.array(rows[k], dtype=np.int64) * self.repo_count + \
+                np.array(columns[k], dtype=np.int64)
+
+        self.training = np.unique(_get_keys('training'))
+        self.groundtruth = np.unique(_get_keys('groundtruth'))
+        self._set_recommended(_get_keys('recommended'), rows['recommended'])
+
+    def _read_records(self, report):
+        repo_map = {r.id: i for i, r in enumerate(report['repos'])}
+        self.repo_count = len(repo_map)
+        # records may be a lazy iterator, so only compact index arrays are kept
+        rows = {k: array('l') for k in REPORT_FIELDS}
+        columns = {k: array('l') for k in REPORT_FIELDS}
+        case_count = 0
+        for i, x in enumerate(report['recommendation']):
+            for k in REPORT_FIELDS:
+                columns[k].extend(repo_map[r.id] for r in x[k])
+                rows[k].extend([i] * len(x[k]))
+            case_count += 1
+        self.case_count = case_count
+        return rows, columns
+
+    def _read_indices(self, report):
+        # binary reports already store entity indices, so nothing is decoded
+        records = report['recommendation']
+        repos = report['repos'].indices
+        self.repo_count = len(repos)
+        self.case_count = len(records)
+        repo_map = np.empty((len(records.table),), dtype=np.int64)
+        repo_map.fill(-1)
+        repo_map[repos] = np.arange(self.repo_count)
+        rows, columns = {}, {}
+        for k in REPORT_FIELDS:
+            offsets, values = records.fields[k]
+            rows[k] = np.repeat(np.arange(self.case_count), np.diff(offsets))
+            columns[k] = repo_map[values]
+            if np.any(columns[k] < 0):
+                raise ValueError('%s repositories must be in the report repositories' % k)
+        return rows, columns
+
+    def _set_recommended(self, keys, rows):
+        rows = np.array(rows, dtype=np.int64)
+        counts = np.bincount(rows, minlength=self.case_count)
+        position = np.arange(rows.size) - (np.cumsum(counts) - counts)[rows] + 1
+        hit = np.in1d(keys, self.groundtruth)
+        width = counts.max() if counts.size else 0
+        self.hits = csr_matrix((np.ones(np.count_nonzero(hit)), (rows[hit], position[hit] - 1)),
+            shape=(self.case_count, width))
+        self.hits.sort_indices()
+        # a repository recommended more than once keeps its last position
+        order = np.lexsort((position, keys))
+        last = np.ones(order.shape, dtype=bool)
+        last[:-1] = keys[order[:-1]] != keys[order[1:]]
+        order = np.sort(order[last])
+        self.row = rows[order]
+        self.position = position[order]
+        self.column = keys[order] - self.row * self.repo_count
+        self.in_training = np.in1d(keys[order], self.training)
+        self.in_groundtruth = np.in1d(keys[order], self.groundtruth)
+        self.max_position = self.position.max() if self.position.size else 0
+
+    def count_cases(self, keys):
+        """count keys (row * repo_count + column) for each case"""
+        return np.bincount(keys // self.repo_count, minlength=self.case_count)
+
+    def count_recommended(self, cutoff, flags=None):
+        """count the recommended repositories ranked within each cutoff for each case
+        (only counting the entries where `flags` is true)
+
+        return an array of shape (case count, cutoff count)
+        """
+        width = self.max_position + 1
+        keys = self.row * width + self.position
+        if flags is None:
+            flags = np.ones(keys.shape, dtype=bool)
+        cumulative = np.concatenate(([0], np.cumsum(flags)))
+        limits = [width - 1 if k is None else min(max(k, 0), width - 1) for k in cutoff]
+        base = np.arange(self.case_count, dtype=np.int64)[:, np.newaxis] * width
+        start = np.searchsorted(keys, base, side='left')
+        end = np.searchsorted(keys, base + np.array(limits), side='right')
+        return cumulative[end] - cumulative[start]
+
+
+def get_report_matrices(report):
+    if isinstance(report, ReportMatrices):
+        return report
+    return ReportMatrices(report)
 
 def get_frequencies(report, cutoff=None):
-    repo_map = {r.id: i for i, r in enumerate(report['repos'])}
-    repo_count = len(repo_map)
-    case_count = len(report['recommendation'])
+    matrices = get_report_matrices(report)
+    case_count = matrices.case_count
     try:
         cutoff = tuple(cutoff)
     except TypeError:  # cutoff is a single value (None or int)
         cutoff = (cutoff,)
 
-    def _get_indices(repos):
-        return [repo_map[r.id] for r in repos]
+    training = matrices.count_cases(matrices.training)[:, np.newaxis]
+    groundtruth = matrices.count_cases(matrices.groundtruth)[:, np.newaxis]
+    both = np.intersect1d(matrices.training, matrices.groundtruth, assume_unique=True)
+    both = matrices.count_cases(both)[:, np.newaxis]
+
+    positive = matrices.count_recommended(cutoff)
+    tp = matrices.count_recommended(cutoff, matrices.in_groundtruth)
+    positive_training = matrices.count_recommended(cutoff, matrices.in_training)
+    tp_training = matrices.count_recommended(cutoff,
+        matrices.in_groundtruth & matrices.in_training)
+
+    fp = positive - tp
+    fn = groundtruth - both - tp + tp_training
+    negative = matrices.repo_count - training - positive + positive_training
+    tn = negative - fn
 
     frequencies = np.empty((case_count, len(cutoff), 4))
-    for i, x in enumerate(report['recommendation']):
-        candidates = np.ones(repo_count, dtype=bool)
-        candidates[_get_indices(x['training'])] = False
-        groundtruth = np.zeros(repo_count, dtype=bool)
-        groundtruth[_get_indices(x['groundtruth'])] = True
-        recommended = np.zeros(repo_count, dtype=int)
-        recommended[_get_indices(x['recommended'])] = np.arange(len(x['recommended'])) + 1
-        for j, k in enumerate(cutoff):
-            positive = recommended > 0
-            if k is not None:
-                positive &= recommended <= k
-            negative = candidates & (~positive)
-            tp = np.count_nonzero(positive & groundtruth)
-            fp = np.count_nonzero(positive) - tp
-            fn = np.count_nonzero(negative & groundtruth)
-            tn = np.count_nonzero(negative) - fn
-            frequencies[i, j, :] = tp, tn, fp, fn
+    frequencies[:, :, 0] = tp
+    frequencies[:, :, 1] = tn
+    frequencies[:, :, 2] = fp
+    frequencies[:, :, 3] = fn
     if len(cutoff) == 1:
         frequencies = np.reshape(frequencies, (case_count, 4))
     return frequencies
@@ -63,27 +172,66 @@ def roc_curve(frequencies):
     fallout = get_fallout(frequencies)
     return sensitivity, fallout
 
+def _get_hit_ranks(matrices):
+    """return the case, 1-based rank and per-case hit count of each hit"""
+    hits = matrices.hits
+    counts = np.diff(hits.indptr)
+    rows = np.repeat(np.arange(matrices.case_count), counts)
+    ranks = hits.indices + 1
+    hit_counts = np.arange(hits.nnz) - hits.indptr[rows] + 1
+    return rows, ranks, hit_counts
+
+def _mask_empty_groundtruth(matrices, values):
+    groundtruth = matrices.count_cases(matrices.groundtruth)
+    values[groundtruth == 0] = np.nan
+    return values
+
 def get_average_precision(report):
-    case_count = len(report['recommendation'])
-    average_precision = np.empty((case_count,))
-    average_precision.fill(np.nan)
-    for i, x in enumerate(report['recommendation']):
-        groundtruth = x['groundtruth']
-        recommended = x['recommended']
-        if not groundtruth:
-            continue
-        counter, true_positive = 0.0, 0
-        for k, r in enumerate(recommended):
-            if r in groundtruth:
-                true_positive += 1
-                counter += float(true_positive) / (k + 1)
-        average_precision[i] = float(counter) / len(groundtruth)
-    return average_precision
+    matrices = get_report_matrices(report)
+    rows, ranks, hit_counts = _get_hit_ranks(matrices)
+    groundtruth = matrices.count_cases(matrices.groundtruth)
+    average_precision = np.bincount(rows, weights=hit_counts / ranks.astype(float),
+        minlength=matrices.case_count)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average_precision /= groundtruth
+    return _mask_empty_groundtruth(matrices, average_precision)
 
 def get_mean_average_precision(report):
     average_precision = get_average_precision(report)
     return nanmean(average_precision)
 
+def get_ndcg(report, cutoff=None):
+    """normalized discounted cumulative gain (with binary relevance) of each case"""
+    matrices = get_report_matrices(report)
+    rows, ranks, _ = _get_hit_ranks(matrices)
+    groundtruth = matrices.count_cases(matrices.groundtruth)
+    if cutoff is not None:
+        selected = ranks <= cutoff
+        rows, ranks = rows[selected], ranks[selected]
+        groundtruth = np.minimum(groundtruth, cutoff)
+    dcg = np.bincount(rows, weights=1.0 / np.log2(ranks + 1),
+        minlength=matrices.case_count)
+    discounts = 1.0 / np.log2(np.arange(groundtruth.max() if groundtruth.size else 0) + 2)
+    ideal = np.concatenate(([0.0], np.cumsum(discounts)))[groundtruth]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ndcg = dcg / ideal
+    return _mask_empty_groundtruth(matrices, ndcg)
+
+def get_mean_ndcg(report, cutoff=None):
+    return nanmean(get_ndcg(report, cutoff))
+
+def get_reciprocal_rank(report):
+    """reciprocal rank of the first groundtruth repository of each case"""
+    matrices = get_report_matrices(report)
+    rows, ranks, hit_counts = _get_hit_ranks(matrices)
+    first = hit_counts == 1
+    reciprocal_rank = np.zeros((matrices.case_count,))
+    reciprocal_rank[rows[first]] = 1.0 / ranks[first]
+    return _mask_empty_groundtruth(matrices, reciprocal_rank)
+
+def get_mean_reciprocal_rank(report):
+    return nanmean(get_reciprocal_rank(report))
+
 def get_roc_auc(frequencies):
     sensitivity, fallout = roc_curve(frequencies)
     y = np.atleast_1d(sensitivity)
@@ -98,3 +246,22 @@ def get_roc_auc(frequencies):
     x, y = x[order], y[order]
     auc = np.trapz(y, x)
     return auc
+
+def get_neighbor_recall(approximate, exact, k, rows=None):
+    """fraction of the exact k nearest neighbors of the given rows that an
+    approximate similarity finds (any neighbor scoring at least the k-th
+    exact score counts, since such neighbors are interchangeable)
+    """
+    rows = np.arange(exact.size) if rows is None else np.asarray(rows, dtype=int)
+    truth = exact.nearest_matrix(rows, k)
+    found = approximate.nearest_matrix(rows, k)
+    expected = np.diff(truth.indptr)
+    threshold = np.zeros((rows.size,))
+    nonempty = np.flatnonzero(expected)
+    if nonempty.size:
+        threshold[nonempty] = np.minimum.reduceat(truth.data, truth.indptr[nonempty])
+    found_rows = np.repeat(np.arange(rows.size), np.diff(found.indptr))
+    valid = found.data >= threshold[found_rows] - 1e-12
+    hits = np.minimum(np.bincount(found_rows[valid], minlength=rows.size), expected)
+    total = expected.sum()
+    return hits.sum() / float(total) if total else 1.0
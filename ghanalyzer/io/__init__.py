@@ -3,6 +3,8 @@ from ghanalyzer.io.items import (
     load_accounts,
     load_repository_languages,
     load_repository_descriptions,
+    open_repositories,
+    open_accounts,
 )
 
 from ghanalyzer.io.graphs import (
@@ -19,4 +21,14 @@ from ghanalyzer.io.experiments import (
     write_json_report,
     read_pickle_report,
     write_pickle_report,
+    read_binary_report,
+    write_binary_report,
+    read_jsonl_report,
+    JsonLineReportWriter,
+)
+
+from ghanalyzer.io.attributes import (
+    NodeAttributes,
+    load_node_attribute_columns,
+    read_node_attributes,
 )
@@ -0,0 +1,147 @@
+import os.path
+import json
+from collections import defaultdict
+
+import numpy as np
+
+import ghanalyzer.models
+from ghanalyzer.io.cache import _encode_ids, _encode_column, _decode_value
+from ghanalyzer.models import Account, Repository
+from ghanalyzer.utils.jsonline import JsonLineData
+
+
+NUMERIC_KINDS = ('bool', 'int', 'float')
+
+ITEM_FILES = [
+    (Repository, ('Repository.jsonl', 'RepositorySummary.jsonl')),
+    (Account, ('Account.jsonl', 'AccountSummary.jsonl')),
+]
+
+
+def _encode_attribute(values, mask):
+    present = [x for x, m in zip(values, mask) if m]
+    if present and not all(isinstance(x, bool) for x in present) and \
+            all(isinstance(x, (int, long, float)) for x in present):
+        # integers mixed with floats (or booleans) are stored as floats
+        return np.array([float(x or 0) for x in values]), 'float'
+    return _encode_column(values, mask)
+
+
+class NodeAttributes(object):
+    """typed columns of node attributes
+
+    row i holds the attributes of nodes[i]; each attribute is an array
+    (`columns`) with a mask of the rows having it (`masks`) and the kind of
+    its values (`kinds`, one of 'bool', 'int', 'float', 'str' and 'json')
+
+    None values are treated as missing
+    """
+
+    def __init__(self, nodes, columns, masks, kinds):
+        self.nodes = nodes
+        self.node_indices = {n: i for i, n in enumerate(nodes)}
+        self.columns = columns
+        self.masks = masks
+        self.kinds = kinds
+
+    @classmethod
+    def from_items(cls, nodes, items):
+        """build columns from (node, item) pairs in one pass
+        (items of the same node are merged in order)
+        """
+        node_indices = {n: i for i, n in enumerate(nodes)}
+        values = {}
+        for node, item in items:
+            i = node_indices.get(node)
+            if i is None:
+                continue
+            for k, v in item.iteritems():
+                # like dict.update, a null value replaces the earlier ones
+                if v is None:
+                    values.get(k, {}).pop(i, None)
+                else:
+                    values.setdefault(k, {})[i] = v
+        columns, masks, kinds = {}, {}, {}
+        for k, column in values.iteritems():
+            mask = np.zeros((len(nodes),), dtype=bool)
+            mask[column.keys()] = True
+            columns[k], kinds[k] = _encode_attribute(
+                [column.get(i) for i in xrange(len(nodes))], mask)
+            masks[k] = mask
+        return cls(nodes, columns, masks, kinds)
+
+    def get_rows(self, nodes):
+        """return the rows of nodes (-1 for unknown nodes)"""
+        return np.array([self.node_indices.get(n, -1) for n in nodes], dtype=np.int64)
+
+    def gather(self, keys, rows):
+        """return a float matrix of numeric attributes of the given rows
+        (missing attributes and rows of -1 are zeros)
+        """
+        rows = np.asarray(rows)
+        features = np.zeros((rows.size, len(keys)))
+        valid = rows >= 0
+        for j, k in enumerate(keys):
+            if k not in self.columns:
+                continue
+            if self.kinds[k] not in NUMERIC_KINDS:
+                raise ValueError('attribute %s is not numeric' % k)
+            features[valid, j] = self.columns[k][rows[valid]]
+        return features
+
+    def get(self, node):
+        """return the attributes of a node as a dict"""
+        i = self.node_indices.get(node)
+        if i is None:
+            return {}
+        return {k: _decode_value(self.columns[k][i], self.kinds[k])
+            for k in self.columns if self.masks[k][i]}
+
+    def save(self, path):
+        keys = sorted(self.columns)
+        arrays = {
+            'node_types': np.array([type(n).__name__ for n in self.nodes]),
+            'node_ids': _encode_ids([n.id for n in self.nodes]),
+            'meta': np.array(json.dumps({'keys': keys, 'kinds': self.kinds})),
+        }
+        for i, k in enumerate(keys):
+            arrays['column%d' % i] = self.columns[k]
+            arrays['mask%d' % i] = self.masks[k]
+        with open(path, 'wb') as output:
+            np.savez(output, **arrays)
+
+
+def read_node_attributes(path):
+    with np.load(path) as data:
+        meta = json.loads(data['meta'].item())
+        nodes = [getattr(ghanalyzer.models, t)(x) for t, x in
+            zip(data['node_types'].tolist(), data['node_ids'].tolist())]
+        keys = meta['keys']
+        columns = {k: data['column%d' % i] for i, k in enumerate(keys)}
+        masks = {k: data['mask%d' % i] for i, k in enumerate(keys)}
+    return NodeAttributes(nodes, columns, masks, meta['kinds'])
+
+def load_node_attribute_columns(path, nodes, keys=None, workers=1):
+    """load crawled attributes of repositories and accounts into columns
+    aligned to nodes (only `keys` are loaded if they are given)
+
+    each item file is read once, and like load_node_attributes the summary
+    files update the full item files
+    """
+    def _iter_items():
+        for cls, filenames in ITEM_FILES:
+            # users and organizations may share ids (both are accounts)
+            entities = defaultdict(list)
+            for n in nodes:
+                if isinstance(n, cls):
+                    entities[n.id].append(n)
+            if not entities:
+                continue
+            projection = None if keys is None else ('id',) + tuple(keys)
+            for filename in filenames:
+                with JsonLineData(os.path.join(path, filename), keys=projection,
+                        workers=workers) as data:
+                    for item in data:
+                        for node in entities.get(item.pop('id', None), ()):
+                            yield node, item
+    return NodeAttributes.from_items(nodes, _iter_items())
@@ -0,0 +1,220 @@
+import os
+import json
+import shutil
+from itertools import izip
+
+import numpy as np
+
+from ghanalyzer.utils.jsonline import JsonLineData
+
+
+CACHE_DIRNAME = '.cache'
+CACHE_VERSION = 1
+
+
+def _get_stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def _encode_ids(ids):
+    if all(isinstance(x, (int, long)) for x in ids):
+        return np.array(ids, dtype=np.int64)
+    if all(isinstance(x, basestring) for x in ids):
+        return np.array(ids, dtype=unicode)
+    raise ValueError('relation ids must be all integers or all strings')
+
+def _encode_column(values, mask):
+    """encode attribute values (only those where mask is true are used)
+    as an array and return it with the kind of the values
+
+    values of mixed or nested types are stored as JSON strings
+    """
+    present = [x for x, m in izip(values, mask) if m]
+    if all(isinstance(x, bool) for x in present):
+        return np.array([bool(x) for x in values], dtype=bool), 'bool'
+    if all(isinstance(x, (int, long)) and not isinstance(x, bool) for x in present):
+        return np.array([x or 0 for x in values], dtype=np.int64), 'int'
+    if all(isinstance(x, float) for x in present):
+        return np.array([x or 0.0 for x in values], dtype=np.float), 'float'
+    if all(isinstance(x, basestring) for x in present):
+        return np.array([x or u'' for x in values], dtype=unicode), 'str'
+    return np.array([json.dumps(x) for x in values], dtype=unicode), 'json'
+
+def _decode_value(value, kind):
+    if kind == 'json':
+        return json.loads(value)
+    return value.item()
+
+
+class RelationCache(object):
+    """binary cache of a relation file (such as Stargazer.jsonl)
+
+    the cache is a directory of .npy files (which can be memory-mapped):
+    head and tail id arrays, an array for each edge attribute and a mask of
+    the edges having the attribute, plus meta.json describing the source
+    file (size and mtime), the id types and the attribute kinds
+    """
+
+    def __init__(self, path, metadata):
+        self.source = os.path.join(path, metadata['filename'])
+        name = os.path.splitext(metadata['filename'])[0]
+        self.path = os.path.join(path, CACHE_DIRNAME, name)
+        self.metadata = metadata
+
+    def is_valid(self):
+        try:
+            with open(os.path.join(self.path, 'meta.json')) as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            return False
+        return meta.get('version') == CACHE_VERSION and \
+            meta.get('source') == _get_stat(self.source)
+
+    def build(self, workers=1):
+        head_name = self.metadata['head']['name']
+        tail_name = self.metadata['tail']['name']
+        heads, tails = [], []
+        columns = {}
+        count = 0
+        with JsonLineData(self.source, workers=workers) as data:
+            for item in data:
+                head = item.pop(head_name, None)
+                tail = item.pop(tail_name, None)
+                if head is None or tail is None:
+                    continue
+                heads.append(head['id'])
+                tails.append(tail['id'])
+                for k, v in item.iteritems():
+                    columns.setdefault(k, {})[count] = v
+                count += 1
+
+        arrays = {'head': _encode_ids(heads), 'tail': _encode_ids(tails)}
+        attributes = {}
+        for i, (k, values) in enumerate(sorted(columns.iteritems())):
+            mask = np.zeros((count,), dtype=bool)
+            mask[values.keys()] = True
+            array, kind = _encode_column([values.get(j) for j in xrange(count)], mask)
+            arrays['attribute%d' % i] = array
+            arrays['attribute%d_mask' % i] = mask
+            attributes[k] = {'index': i, 'kind': kind}
+
+        meta = {
+            'version': CACHE_VERSION,
+            'source': _get_stat(self.source),
+            'edge_count': count,
+            'head_class': self.metadata['head']['class'].__name__,
+            'tail_class': self.metadata['tail']['class'].__name__,
+            'attributes': attributes,
+        }
+        # write into a temporary directory so that readers never see a partial cache
+        temp = self.path + '.tmp'
+        shutil.rmtree(temp, ignore_errors=True)
+        os.makedirs(temp)
+        for k, array in arrays.iteritems():
+            np.save(os.path.join(temp, k + '.npy'), array)
+        with open(os.path.join(temp, 'meta.json'), 'w') as output:
+            json.dump(meta, output)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.rename(temp, self.path)
+
+    def load(self, mmap_mode='r', workers=1):
+        """load the cached arrays (building the cache first if it is stale)
+
+        return a dict of 'head' and 'tail' id arrays and 'attributes'
+        mapping each attribute name to a tuple of (values, mask, kind)
+        """
+        if not self.is_valid():
+            self.build(workers=workers)
+        with open(os.path.join(self.path, 'meta.json')) as f:
+            meta = json.load(f)
+        def _load(name):
+            return np.load(os.path.join(self.path, name + '.npy'), mmap_mode=mmap_mode)
+        attributes = {}
+        for k, v in meta['attributes'].iteritems():
+            i = v['index']
+            attributes[k] = (_load('attribute%d' % i), _load('attribute%d_mask' % i), v['kind'])
+        return {'head': _load('head'), 'tail': _load('tail'), 'attributes': attributes}
+
+
+def _create_entities(ids, cls):
+    """create one entity per distinct id and return the entity of each id"""
+    unique, inverse = np.unique(ids, return_inverse=True)
+    entities = [cls(x) for x in unique.tolist()]
+    return [entities[i] for i in inverse]
+
+def load_cached_edges(path, metadata, workers=1):
+    """generate the (tail, head, attributes) edges of a relation file from its cache"""
+    data = RelationCache(path, metadata).load(workers=workers)
+    heads = _create_entities(data['head'], metadata['head']['class'])
+    tails = _create_entities(data['tail'], metadata['tail']['class'])
+    attributes = [(k, np.asarray(values), np.asarray(mask), kind)
+        for k, (values, mask, kind) in data['attributes'].iteritems()]
+    for i in xrange(len(heads)):
+        attr = {k: _decode_value(values[i], kind)
+            for k, values, mask, kind in attributes if mask[i]}
+        yield tails[i], heads[i], attr
+
+
+class ItemIndex(object):
+    """on-disk index from item ids to the byte offsets of the lines of a
+    JSON lines file (an id may appear on several lines)
+
+    the index is saved as <cache>/<filename>.index.npz with the ids sorted
+    (offsets of the same id stay in file order) and is rebuilt whenever the
+    size or mtime of the file changes
+    """
+
+    def __init__(self, source):
+        self.source = source
+        path, filename = os.path.split(source)
+        self.path = os.path.join(path, CACHE_DIRNAME, filename + '.index.npz')
+        self.ids, self.offsets = self._load()
+
+    def _load(self):
+        stat = _get_stat(self.source)
+        try:
+            with np.load(self.path) as data:
+                if data['version'] == CACHE_VERSION and data['size'] == stat['size'] and \
+                        data['mtime'] == stat['mtime']:
+                    return data['ids'], data['offsets']
+        except (IOError, KeyError):
+            pass
+        return self._build(stat)
+
+    def _build(self, stat):
+        ids, offsets = [], []
+        offset = 0
+        with open(self.source, 'rb') as f:
+            for line in f:
+                id_ = json.loads(line).get('id')
+                if id_ is not None:
+                    ids.append(id_)
+                    offsets.append(offset)
+                offset += len(line)
+        ids = _encode_ids(ids)
+        order = np.argsort(ids, kind='mergesort')
+        ids, offsets = ids[order], np.array(offsets, dtype=np.int64)[order]
+
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path + '.tmp', 'wb') as output:
+            np.savez(output, version=CACHE_VERSION, ids=ids, offsets=offsets, **stat)
+        os.rename(self.path + '.tmp', self.path)
+        return ids, offsets
+
+    def find(self, id_):
+        """return the offsets of the lines of an id"""
+        if isinstance(id_, basestring) != (self.ids.dtype.kind == 'U'):
+            return self.offsets[:0]
+        start = np.searchsorted(self.ids, id_, side='left')
+        end = np.searchsorted(self.ids, id_, side='right')
+        return self.offsets[start:end]
+
+    def iter_ids(self):
+        if not self.ids.size:
+            return iter(())
+        distinct = np.ones(self.ids.shape, dtype=bool)
+        distinct[1:] = self.ids[1:] != self.ids[:-1]
+        return iter(self.ids[distinct].tolist())
@@ -1,9 +1,16 @@
+import os
 import json
 import cPickle as pickle
 
+import numpy as np
+
+import ghanalyzer.models
 from ghanalyzer.io.graphs import EntityEncoder, _model_from_json
 
 
+REPORT_FIELDS = ('training', 'recommended', 'groundtruth')
+
+
 def read_json_report(path):
     with open(path) as f:
         report = json.load(f)
@@ -24,3 +31,248 @@ def read_pickle_report(path):
 def write_pickle_report(path, report):
     with open(path, 'wb') as output:
         pickle.dump(report, output)
+
+
+class EntityTable(object):
+    """table of the entities referenced by a binary report
+    (entities are created on first access)
+    """
+
+    def __init__(self, types, type_names, ids):
+        self.types = types
+        self.type_names = type_names
+        self.ids = ids
+        self._classes = [getattr(ghanalyzer.models, x, None) for x in type_names]
+        self._entities = [None] * len(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        entity = self._entities[i]
+        if entity is None:
+            cls = self._classes[self.types[i]]
+            if cls is None:
+                return None
+            entity = cls(self.ids[i].item())
+            self._entities[i] = entity
+        return entity
+
+    def decode(self, indices):
+        return list(filter(None, (self[i] for i in indices)))
+
+
+class EntityList(object):
+    """sequence of entities stored as indices into an entity table"""
+
+    def __init__(self, table, indices):
+        self.table = table
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.table.decode(self.indices[i])
+        return self.table[self.indices[i]]
+
+    def __iter__(self):
+        for i in self.indices:
+            yield self.table[i]
+
+
+class ReportRecords(object):
+    """recommendation records of a binary report
+
+    each field is a ragged array of entity indices (values of record i are
+    values[offsets[i]:offsets[i+1]]), and records are decoded when accessed
+    """
+
+    def __init__(self, table, users, fields):
+        self.table = table
+        self.users = users
+        self.fields = fields
+
+    def __len__(self):
+        return len(self.users)
+
+    def get_indices(self, i, field):
+        offsets, values = self.fields[field]
+        return values[offsets[i]:offsets[i+1]]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('record index out of range')
+        record = {'user': self.table[self.users[i]]}
+        for k in REPORT_FIELDS:
+            record[k] = self.table.decode(self.get_indices(i, k))
+        return record
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+
+def _encode_ragged(lists, entity_indices):
+    offsets = np.zeros((len(lists) + 1,), dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in lists])
+    values = np.fromiter((entity_indices[y] for x in lists for y in x),
+        dtype=np.int32, count=offsets[-1])
+    return offsets, values
+
+def write_binary_report(path, report):
+    """write a report as a directory of .npy files (and a header.json)
+
+    entities are stored once in a table of (type, id) and every list of
+    entities in the report is stored as int32 indices into that table
+    """
+    entities = {}
+    def _index(entity):
+        if entity not in entities:
+            entities[entity] = len(entities)
+        return entities[entity]
+
+    records = report.get('recommendation', ())
+    arrays = {
+        'users': np.array([_index(x) for x in report.get('users', ())], dtype=np.int32),
+        'repos': np.array([_index(x) for x in report.get('repos', ())], dtype=np.int32),
+        'record_users': np.array([_index(x['user']) for x in records], dtype=np.int32),
+    }
+    for k in REPORT_FIELDS:
+        for x in records:
+            for y in x[k]:
+                _index(y)
+        offsets, values = _encode_ragged([x[k] for x in records], entities)
+        arrays[k + '_offsets'] = offsets
+        arrays[k + '_values'] = values
+
+    table = sorted(entities, key=entities.get)
+    type_names = sorted(set(type(x).__name__ for x in table))
+    type_indices = {x: i for i, x in enumerate(type_names)}
+    arrays['entity_types'] = np.array([type_indices[type(x).__name__] for x in table],
+        dtype=np.int8)
+    ids = [x.id for x in table]
+    if all(isinstance(x, (int, long)) for x in ids):
+        arrays['entity_ids'] = np.array(ids, dtype=np.int64)
+    elif all(isinstance(x, basestring) for x in ids):
+        arrays['entity_ids'] = np.array(ids, dtype=unicode)
+    else:
+        raise ValueError('entity ids must be all integers or all strings')
+
+    header = {k: v for k, v in report.iteritems()
+        if k not in ('users', 'repos', 'recommendation')}
+    header['type_names'] = type_names
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    for k, array in arrays.iteritems():
+        np.save(os.path.join(path, k + '.npy'), array)
+    with open(os.path.join(path, 'header.json'), 'w') as output:
+        json.dump(header, output, cls=EntityEncoder)
+
+def read_binary_report(path):
+    """read a report written by write_binary_report
+
+    the report keeps the index arrays (memory-mapped), and entities are
+    decoded lazily
+    """
+    arrays = {}
+    for filename in os.listdir(path):
+        k, ext = os.path.splitext(filename)
+        if ext == '.npy':
+            arrays[k] = np.load(os.path.join(path, filename), mmap_mode='r')
+    with open(os.path.join(path, 'header.json')) as f:
+        report = json.load(f)
+    table = EntityTable(arrays['entity_types'], report.pop('type_names'),
+        arrays['entity_ids'])
+    fields = {k: (arrays[k + '_offsets'], arrays[k + '_values']) for k in REPORT_FIELDS}
+    report['users'] = EntityList(table, arrays['users'])
+    report['repos'] = EntityList(table, arrays['repos'])
+    report['recommendation'] = ReportRecords(table, arrays['record_users'], fields)
+    return report
+
+
+def _report_from_json(report):
+    for k in ('users', 'repos'):
+        if k in report:
+            report[k] = list(filter(None, (_model_from_json(x) for x in report[k])))
+    return report
+
+def _record_from_json(record):
+    record['user'] = _model_from_json(record['user'])
+    for k in REPORT_FIELDS:
+        record[k] = list(filter(None, (_model_from_json(x) for x in record[k])))
+    return record
+
+
+class JsonLineReportWriter(object):
+    """write report records one per line as they are produced
+
+    the header (every key of the report except the records, plus
+    record_count) is kept in a separate file (path + '.header'). It is
+    written when the writer is opened, again by write_header and finally
+    when the writer is closed with the final record_count, so the records
+    written before a crash can still be read with read_jsonl_report
+    """
+
+    def __init__(self, path, flush_every=100):
+        self.path = path
+        self.flush_every = flush_every
+        self.count = 0
+        self.header = {}
+
+    def __enter__(self):
+        self.output = open(self.path, 'w')
+        self._write_header()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.output.close()
+        self._write_header()
+
+    def write(self, record):
+        json.dump(record, self.output, cls=EntityEncoder)
+        self.output.write('\n')
+        self.count += 1
+        if self.flush_every and self.count % self.flush_every == 0:
+            self.output.flush()
+
+    def write_header(self, report):
+        self.header = {k: v for k, v in report.iteritems() if k != 'recommendation'}
+        self._write_header()
+
+    def _write_header(self):
+        header = dict(self.header, record_count=self.count)
+        # replace the header at once so that readers never see a partial one
+        with open(self.path + '.header.tmp', 'w') as output:
+            json.dump(header, output, cls=EntityEncoder)
+        os.rename(self.path + '.header.tmp', self.path + '.header')
+
+
+class JsonLineRecords(object):
+    """records of a JSON lines report, parsed while iterating
+    (a last line cut off by an interrupted writer is skipped)
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        with open(self.path) as f:
+            for line in f:
+                if line.strip() and line.endswith('\n'):
+                    yield _record_from_json(json.loads(line))
+
+
+def read_jsonl_report(path):
+    """read the header of a JSON lines report
+
+    the records are not loaded: report['recommendation'] can be iterated
+    (more than once) to parse them lazily
+    """
+    with open(path + '.header') as f:
+        report = _report_from_json(json.load(f))
+    report['recommendation'] = JsonLineRecords(path)
+    return report
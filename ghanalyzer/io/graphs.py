@@ -8,7 +8,8 @@ from networkx.readwrite import json_graph
 import ghanalyzer.models
 from ghanalyzer.models import Entity, Account, User, Organization, Repository, Language
 from ghanalyzer.utils.jsonline import JsonLineData
-from ghanalyzer.io.items import load_accounts, load_repositories
+from ghanalyzer.io.items import load_accounts, load_repositories, open_accounts, open_repositories
+from ghanalyzer.io.cache import load_cached_edges
 
 
 GRAPH_METADATA = {
@@ -58,16 +59,29 @@ class EntityEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
-def load_graph(path, graph_type, item_filter=None):
+def load_graph(path, graph_type, item_filter=None, use_cache=True, workers=1):
+    """load a relation graph from the crawled data
+
+    unless items are filtered, edges are read from a binary cache of the
+    relation file (see ghanalyzer.io.cache), which is built on first use
+    and rebuilt whenever the file changes
+    """
     metadata = GRAPH_METADATA.get(graph_type)
     if not metadata:
         return
-    path = os.path.join(path, metadata['filename'])
     if metadata['directed']:
         graph = nx.DiGraph()
     else:
         graph = nx.Graph()
-    with JsonLineData(path) as data:
+    if use_cache and item_filter is None:
+        try:
+            graph.add_edges_from(load_cached_edges(path, metadata, workers=workers))
+            return graph
+        except (IOError, OSError, ValueError) as e:
+            print 'Warning: graph cache is not used (%s)' % e
+            graph.clear()
+    path = os.path.join(path, metadata['filename'])
+    with JsonLineData(path, workers=workers) as data:
         if item_filter is not None:
             data = (x for x in data if item_filter(x))
         for item in data:
@@ -80,20 +94,33 @@ def load_graph(path, graph_type, item_filter=None):
             graph.add_edge(tail, head, **item)
     return graph
 
-def load_node_attributes(path, graph):
-    repos = load_repositories(path)
-    accounts = load_accounts(path)
+def load_node_attributes(path, graph, workers=1, indexed=True):
+    """add the crawled attributes of repositories and accounts to graph nodes
+
+    if `indexed` is true, only the items of the graph nodes are parsed
+    (through the indices of the item files, see IndexedItems), otherwise
+    the item files are loaded completely
+    """
+    if indexed:
+        with open_repositories(path) as repos, open_accounts(path) as accounts:
+            _update_node_attributes(graph, repos, accounts)
+    else:
+        repos = load_repositories(path, workers=workers)
+        accounts = load_accounts(path, workers=workers)
+        _update_node_attributes(graph, repos, accounts)
+
+def _update_node_attributes(graph, repos, accounts):
     for n in graph:
         if isinstance(n, Repository):
-            graph.node[n].update(repos[n.id])
+            graph.node[n].update(repos.get(n.id, {}))
         elif isinstance(n, Account):
-            graph.node[n].update(accounts[n.id])
+            graph.node[n].update(accounts.get(n.id, {}))
         graph.node[n].pop('id', None)
 
-def load_language_co_occurrence(path):
+def load_language_co_occurrence(path, workers=1):
     path = os.path.join(path, 'Languages.jsonl')
     graph = nx.Graph()
-    with JsonLineData(path) as data:
+    with JsonLineData(path, keys=('languages',), workers=workers) as data:
         for item in data:
             languages = item['languages']
             for k, v in languages.iteritems():
@@ -105,10 +132,10 @@ def load_language_co_occurrence(path):
                 graph[m][n]['weight'] = graph[m][n].get('weight', 0) + 1
     return graph
 
-def load_language_graph(path):
+def load_language_graph(path, workers=1):
     path = os.path.join(path, 'Languages.jsonl')
     graph = nx.Graph()
-    with JsonLineData(path) as data:
+    with JsonLineData(path, keys=('repo', 'languages'), workers=workers) as data:
         for item in data:
             repo = Repository(item['repo']['id'])
             for k, v in item['languages'].iteritems():
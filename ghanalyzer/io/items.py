@@ -1,13 +1,17 @@
 import os.path
-from collections import defaultdict
+import json
+import mmap
+from collections import defaultdict, Mapping
 
+from ghanalyzer.io.cache import ItemIndex
 from ghanalyzer.utils.jsonline import JsonLineData
 
-def _load_datasets(path, *filenames):
+def _load_datasets(path, *filenames, **kwargs):
+    workers = kwargs.get('workers', 1)
     dataset = defaultdict(dict)
     for filename in filenames:
         data_path = os.path.join(path, filename)
-        with JsonLineData(data_path) as data:
+        with JsonLineData(data_path, workers=workers) as data:
             for item in data:
                 id_ = item.get('id')
                 if id_ is None:
@@ -15,32 +19,99 @@ def _load_datasets(path, *filenames):
                 dataset[id_].update(item)
     return dataset
 
-def _load_entities(path, type_, summary=None):
+def _load_entities(path, type_, summary=None, workers=1):
     filenames = (type_ + '.jsonl', type_ + 'Summary.jsonl')
     if summary is None:
-        return _load_datasets(path, *filenames)
+        return _load_datasets(path, *filenames, workers=workers)
     if summary:
-        return _load_datasets(path, filenames[1])
+        return _load_datasets(path, filenames[1], workers=workers)
     else:
-        return _load_datasets(path, filenames[0])
+        return _load_datasets(path, filenames[0], workers=workers)
 
-def load_repositories(path, summary=None):
-    return _load_entities(path, 'Repository', summary=summary)
+class IndexedItems(Mapping):
+    """read-only mapping from ids to items of JSON lines files, parsed on
+    demand through an ItemIndex of each file and a memory map of it
 
-def load_accounts(path, summary=None):
-    return _load_entities(path, 'Account', summary=summary)
+    like _load_datasets, the records of an id are merged (with update) in
+    the order of the files and of their lines
+    """
 
-def load_repository_languages(path):
+    def __init__(self, *paths):
+        self.indices = [ItemIndex(p) for p in paths]
+        self.files = [open(p, 'rb') for p in paths]
+        self.maps = [mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if os.path.getsize(f.name) else '' for f in self.files]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        for m in self.maps:
+            if m:
+                m.close()
+        for f in self.files:
+            f.close()
+
+    def __getitem__(self, id_):
+        item = None
+        for index, data in zip(self.indices, self.maps):
+            for offset in index.find(id_):
+                end = data.find('\n', offset)
+                if end < 0:
+                    end = len(data)
+                if item is None:
+                    item = {}
+                item.update(json.loads(data[offset:end]))
+        if item is None:
+            raise KeyError(id_)
+        return item
+
+    def __iter__(self):
+        seen = set()
+        for index in self.indices:
+            for id_ in index.iter_ids():
+                if id_ not in seen:
+                    seen.add(id_)
+                    yield id_
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def _open_entities(path, type_, summary=None):
+    filenames = (type_ + '.jsonl', type_ + 'Summary.jsonl')
+    if summary is not None:
+        filenames = filenames[1:] if summary else filenames[:1]
+    return IndexedItems(*[os.path.join(path, x) for x in filenames])
+
+def open_repositories(path, summary=None):
+    """lazy counterpart of load_repositories"""
+    return _open_entities(path, 'Repository', summary=summary)
+
+def open_accounts(path, summary=None):
+    """lazy counterpart of load_accounts"""
+    return _open_entities(path, 'Account', summary=summary)
+
+def load_repositories(path, summary=None, workers=1):
+    return _load_entities(path, 'Repository', summary=summary, workers=workers)
+
+def load_accounts(path, summary=None, workers=1):
+    return _load_entities(path, 'Account', summary=summary, workers=workers)
+
+def load_repository_languages(path, workers=1):
     path = os.path.join(path, 'Languages.jsonl')
-    with JsonLineData(path) as data:
+    with JsonLineData(path, keys=('repo', 'languages'), workers=workers) as data:
         return {item['repo']['id']: item['languages'] for item in data}
 
-def load_repository_descriptions(path, summary=True, show_fork=False):
+def load_repository_descriptions(path, summary=True, show_fork=False, workers=1):
     filename = 'RepositorySummary.jsonl' if summary else 'Repository.jsonl'
     path = os.path.join(path, filename)
     if show_fork:
         valid = lambda x: True
     else:
         valid = lambda x: not x.get('fork')
-    with JsonLineData(path) as data:
+    with JsonLineData(path, keys=('id', 'description', 'fork'), workers=workers) as data:
         return {item.get('id'): item.get('description') or '' for item in data if valid(item)}
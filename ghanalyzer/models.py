@@ -1,22 +1,61 @@
 
+import weakref
+
 __all__ = [
     'Account', 'Repository', 'User', 'Organization', 'Language',
 ]
 
+_entities = {}  # (class, id) -> weak reference to the interned entity
+_free_indices = []  # indices of collected entities, given to new ones
+_index_count = 0
+
+def _release_entity(key, index, ref):
+    if _entities.get(key) is ref:
+        del _entities[key]
+    _free_indices.append(index)
+
+def _allocate_index():
+    global _index_count
+    if _free_indices:
+        return _free_indices.pop()
+    _index_count += 1
+    return _index_count - 1
+
+
 class Entity(object):
     """base class for hashable entities
     (can be used as NetworkX nodes)
-    """
 
-    def __init__(self, id):
-        self._id = id
+    entities are interned: creating an entity with the class and id of an
+    existing one returns the existing object. Every entity also gets a
+    small integer index, unique among the live entities (indices of
+    collected entities are reused), that can be used to look entities up
+    in arrays instead of dicts
+    """
+    __slots__ = ('_id', '_index', '__weakref__')
+
+    def __new__(cls, id):
+        key = (cls, id)
+        ref = _entities.get(key)
+        entity = ref() if ref is not None else None
+        if entity is None:
+            entity = object.__new__(cls)
+            entity._id = id
+            entity._index = index = _allocate_index()
+            _entities[key] = weakref.ref(entity,
+                lambda ref: _release_entity(key, index, ref))
+        return entity
+
+    def __reduce__(self):
+        # unpickled entities are interned as well
+        return (type(self), (self._id,))
 
     @property
     def id(self):
         return self._id
 
     def __eq__(self, other):
-        return isinstance(other, self.__class__) and self._id == other._id
+        return self is other or (isinstance(other, self.__class__) and self._id == other._id)
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -35,19 +74,24 @@ class Entity(object):
 
 class Account(Entity):
     """account"""
+    __slots__ = ()
 
 
 class Repository(Entity):
     """repository"""
+    __slots__ = ()
 
 
 class User(Account):
     """user"""
+    __slots__ = ()
 
 
 class Organization(Account):
     """organization"""
+    __slots__ = ()
 
 
 class Language(Entity):
     """repository language"""
+    __slots__ = ()
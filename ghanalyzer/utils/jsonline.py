@@ -1,9 +1,50 @@
+import os
 import json
+from multiprocessing import Pool
+
+
+def _project(item, keys):
+    if keys is None:
+        return item
+    return {k: item[k] for k in keys if k in item}
+
+def _read_chunk(args):
+    """parse the lines in the byte range [start, end) of a file"""
+    path, start, end, keys = args
+    with open(path, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).splitlines()
+    return [_project(json.loads(line), keys) for line in lines]
+
+def get_line_chunks(path, chunk_size):
+    """split a file into byte ranges of about chunk_size bytes
+    (every range starts at the beginning of a line)
+    """
+    size = os.path.getsize(path)
+    offsets = [0]
+    with open(path, 'rb') as f:
+        while offsets[-1] < size:
+            f.seek(min(offsets[-1] + chunk_size, size))
+            f.readline()  # move to the beginning of the next line
+            offsets.append(min(f.tell(), size))
+    return zip(offsets[:-1], offsets[1:])
 
 
 class JsonLineData(object):
-    def __init__(self, path):
+    """items of a JSON lines file
+
+    `keys` projects every item to the given keys. If workers > 1, the file
+    is split into chunks of about chunk_size bytes which are parsed in a
+    process pool, and items are yielded in file order unless `ordered` is
+    false (then chunks are yielded as soon as they are parsed)
+    """
+
+    def __init__(self, path, keys=None, workers=1, ordered=True, chunk_size=2**24):
         self.path = path
+        self.keys = keys
+        self.workers = workers
+        self.ordered = ordered
+        self.chunk_size = chunk_size
 
     def __enter__(self):
         self.data = open(self.path)
@@ -13,6 +54,27 @@ class JsonLineData(object):
         self.data.close()
 
     def __iter__(self):
+        if self.workers > 1:
+            for item in self._iter_parallel():
+                yield item
+            return
         self.data.seek(0)
         for line in self.data:
-            yield json.loads(line)
+            yield _project(json.loads(line), self.keys)
+
+    def _iter_parallel(self):
+        chunks = [(self.path, start, end, self.keys)
+            for start, end in get_line_chunks(self.path, self.chunk_size)]
+        pool = Pool(self.workers)
+        try:
+            if self.ordered:
+                results = pool.imap(_read_chunk, chunks)
+            else:
+                results = pool.imap_unordered(_read_chunk, chunks)
+            for items in results:
+                for item in items:
+                    yield item
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
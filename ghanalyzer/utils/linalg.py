@@ -0,0 +1,54 @@
+import numpy as np
+from scipy.sparse import identity
+from scipy.sparse.linalg import splu, gmres, bicgstab
+
+
+SOLVERS = ('direct', 'gmres', 'bicgstab')
+
+
+class RestartSolver(object):
+    """solver for random walks with restart
+    (I - (1 - alpha) * T) x = b
+    where T is the transposed transition matrix (x(t+1) = (1 - alpha) * T x(t) + b)
+
+    'direct' factorizes the system matrix once (sparse LU) so that each
+    right-hand side only needs triangular solves, while 'gmres' and
+    'bicgstab' solve each right-hand side iteratively without factorization
+    (falling back to the factorization if they do not converge)
+    """
+
+    def __init__(self, transition, alpha, method='direct', tol=1e-8, maxiter=None):
+        if method not in SOLVERS:
+            raise ValueError('solver method must be one of %s' % ', '.join(SOLVERS))
+        size = transition.shape[0]
+        self.method = method
+        self.tol = tol
+        self.maxiter = maxiter
+        self.matrix = (identity(size, format='csc') - (1 - alpha) * transition).tocsc()
+        self.factor = None
+        if method == 'direct':
+            self.factor = splu(self.matrix)
+
+    def _get_factor(self):
+        if self.factor is None:
+            self.factor = splu(self.matrix)
+        return self.factor
+
+    def solve(self, b):
+        """solve for a right-hand side vector or for each column of a matrix"""
+        b = np.asarray(b, dtype=np.float)
+        if self.method == 'direct':
+            return self.factor.solve(b)
+        if b.ndim == 1:
+            return self._solve_iterative(b)
+        return np.column_stack([self._solve_iterative(b[:, i]) for i in xrange(b.shape[1])])
+
+    def _solve_iterative(self, b):
+        solve = gmres if self.method == 'gmres' else bicgstab
+        x, info = solve(self.matrix, b, tol=self.tol, maxiter=self.maxiter)
+        if info < 0:
+            raise ValueError('illegal input or breakdown in %s' % self.method)
+        if info > 0:
+            # not converged, so solve exactly rather than return an approximation
+            return self._get_factor().solve(b)
+        return x
@@ -1,4 +1,4 @@
-from collections import defaultdict
+from collections import defaultdict, deque
 
 import numpy as np
 cimport numpy as np
@@ -32,3 +32,39 @@ def check_converged(
     delta = np.abs(X2 - X1)
     delta = np.max(delta)
     return delta < epsilon, delta
+
+
+def forward_push(int u,
+        np.ndarray[np.int_t, ndim=1] indptr, np.ndarray[np.int_t, ndim=1] indices,
+        np.ndarray[np.float_t, ndim=1] probabilities,
+        double alpha, double tolerance):
+    """approximate personalized PageRank of node u by local forward push
+    (Andersen et al., FOCS 2006) on a row-normalized CSR transition matrix
+
+    only nodes whose residual exceeds `tolerance` times their out-degree are
+    pushed; return (nodes, scores) of the nodes with positive score
+    """
+    cdef int a, b, i
+    cdef double r, pushed, old, new
+    rank = {}
+    residual = {u: 1.0}
+    queue = deque([u])
+
+    while queue:
+        a = queue.popleft()
+        r = residual[a]
+        residual[a] = 0.0
+        rank[a] = rank.get(a, 0.0) + alpha * r
+        pushed = (1 - alpha) * r
+        for i in xrange(indptr[a], indptr[a+1]):
+            b = indices[i]
+            old = residual.get(b, 0.0)
+            new = old + pushed * probabilities[i]
+            residual[b] = new
+            threshold = tolerance * max(indptr[b+1] - indptr[b], 1)
+            if old <= threshold < new:
+                queue.append(b)
+
+    nodes = np.fromiter(rank.iterkeys(), dtype=np.int, count=len(rank))
+    scores = np.fromiter(rank.itervalues(), dtype=np.float, count=len(rank))
+    return nodes, scores
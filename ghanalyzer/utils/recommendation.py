@@ -1,6 +1,54 @@
-from itertools import islice
-from operator import itemgetter
+import numpy as np
 
-def recommend_by_rank(rank, n=None):
-    rank = sorted(rank.iteritems(), key=itemgetter(1), reverse=True)
-    return list(islice((x for x, _ in rank), n))
+
+def object_array(items):
+    array = np.empty((len(items),), dtype=object)
+    array[:] = items
+    return array
+
+def top_indices(scores, n=None, candidates=None):
+    """return the indices of the n highest scores by descending score,
+    only considering the indices where `candidates` (a boolean mask) is true
+    """
+    if candidates is not None:
+        indices = np.flatnonzero(candidates)
+        scores = scores[indices]
+    else:
+        indices = np.arange(scores.size)
+    if n is not None and n < scores.size:
+        if n <= 0:
+            return indices[:0]
+        top = np.argpartition(-scores, n - 1)[:n]
+    else:
+        top = np.arange(scores.size)
+    top = top[np.argsort(-scores[top], kind='mergesort')]
+    return indices[top]
+
+def recommend_by_scores(items, scores, n=None, candidates=None):
+    """recommend the items (an object array) with the n highest scores"""
+    return list(items[top_indices(scores, n, candidates)])
+
+def top_k_rows(matrix, k):
+    """select the k largest stored entries in each row of a sparse matrix
+
+    return (indices, scores) arrays of shape (row count, k), ordered by
+    descending score with ties broken by ascending column index;
+    rows with less than k entries are padded with index -1 and score 0
+    """
+    matrix = matrix.tocsr()
+    row_count = matrix.shape[0]
+    k = max(k, 0)
+    row = np.repeat(np.arange(row_count), np.diff(matrix.indptr))
+    # sort the entries of each row segment by descending score, then column
+    order = np.lexsort((matrix.indices, -matrix.data, row))
+    position = np.arange(order.size) - matrix.indptr[row]
+    selected = order[position < k]
+    row, col, data = row[selected], matrix.indices[selected], matrix.data[selected]
+    position = position[position < k]
+
+    indices = np.empty((row_count, k), dtype=np.int32)
+    indices.fill(-1)
+    scores = np.zeros((row_count, k))
+    indices[row, position] = col
+    scores[row, position] = data
+    return indices, scores
@@ -0,0 +1,117 @@
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+import numpy as np
+
+from ghanalyzer.algorithms import artifacts
+from ghanalyzer.algorithms.graphs import Bigraph
+from ghanalyzer.algorithms.similarities import JaccardSimilarity
+from ghanalyzer.algorithms.recommenders import (
+    UserCFRecommender,
+    ItemCFRecommender,
+    SupervisedRWRecommender,
+)
+from ghanalyzer.models import User, Repository
+from tests.utils import random_bigraph, get_users
+
+
+class FingerprintTest(unittest.TestCase):
+    def test_graphs(self):
+        graph = random_bigraph(40, 70, 500)
+        same = random_bigraph(40, 70, 500)
+        self.assertEqual(artifacts.get_graph_fingerprint(graph),
+            artifacts.get_graph_fingerprint(same))
+        same.remove_edge(*same.edges()[0])
+        self.assertNotEqual(artifacts.get_graph_fingerprint(graph),
+            artifacts.get_graph_fingerprint(same))
+        self.assertNotEqual(artifacts.get_graph_fingerprint(graph),
+            artifacts.get_graph_fingerprint(graph.to_directed()))
+
+    def test_processes(self):
+        script = 'from tests.utils import random_bigraph\n' \
+            'from ghanalyzer.algorithms.artifacts import get_graph_fingerprint\n' \
+            'print get_graph_fingerprint(random_bigraph(40, 70, 500))\n'
+        output = subprocess.check_output([sys.executable, '-c', script])
+        self.assertEqual(output.strip(),
+            artifacts.get_graph_fingerprint(random_bigraph(40, 70, 500)))
+
+
+class ArtifactRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.graph = random_bigraph(40, 70, 500)
+        self.users = get_users(self.graph)
+
+    def tearDown(self):
+        artifacts.configure_registry()
+        shutil.rmtree(self.path, True)
+
+    def recommend(self):
+        recommendations = []
+        for recommender in (UserCFRecommender(5), ItemCFRecommender(5)):
+            recommender.train(self.graph)
+            recommendations.append(recommender.recommend_many(self.users, 10))
+        return recommendations
+
+    def test_shared(self):
+        registry = artifacts.configure_registry()
+        expected = self.recommend()
+        misses = registry.misses
+        self.assertEqual(self.recommend(), expected)
+        self.assertEqual(registry.misses, misses)
+        self.assertGreater(registry.hits, 0)
+
+    def test_supervised_rw(self):
+        registry = artifacts.configure_registry()
+        UserCFRecommender(5).train(self.graph)
+        SupervisedRWRecommender(None, weight_key=['weight'],
+            feature_types=['behavior']).train(self.graph)
+        kinds = [key[1] for key in registry.artifacts]
+        self.assertEqual(kinds.count('bigraph'), 1)
+
+    def test_spill(self):
+        expected = self.recommend()
+        registry = artifacts.configure_registry(spill_path=self.path, memory_limit=0.001)
+        self.assertEqual(self.recommend(), expected)
+        self.assertTrue(os.listdir(self.path))
+        # artifacts over the memory limit were replaced by their files
+        self.assertLessEqual(sum(registry.sizes.itervalues()), 0.001 * 2**20)
+        self.assertGreater(len(registry.artifacts), len(registry.sizes))
+        registry.clear()
+        self.assertTrue(os.listdir(self.path))
+
+    def test_bounded(self):
+        expected = self.recommend()
+        registry = artifacts.configure_registry(max_count=2)
+        self.assertEqual(self.recommend(), expected)
+        self.assertEqual(len(registry.artifacts), 2)
+        self.assertEqual(len(registry.order), 2)
+        # without spill_path, artifacts over the memory limit are dropped
+        registry = artifacts.configure_registry(memory_limit=0.001)
+        self.assertEqual(self.recommend(), expected)
+        self.assertLessEqual(sum(registry.sizes.itervalues()), 0.001 * 2**20)
+        self.assertEqual(set(registry.artifacts), set(registry.sizes))
+
+    def test_persistent(self):
+        artifacts.configure_registry(spill_path=self.path)
+        expected = self.recommend()
+        # a new registry (as in another process) reads the saved artifacts
+        registry = artifacts.configure_registry(spill_path=self.path)
+        bigraph = Bigraph(self.graph, source_cls=User, target_cls=Repository)
+        self.assertEqual(bigraph.matrix.nnz, self.graph.number_of_edges())
+        self.assertEqual((registry.hits, registry.misses), (1, 0))
+        self.assertEqual(self.recommend(), expected)
+        # similarities are saved too
+        self.assertEqual(registry.misses, 0)
+        similarities = [x for x in registry.artifacts.itervalues()
+            if isinstance(x, JaccardSimilarity)]
+        self.assertTrue(similarities)
+        self.assertIsInstance(similarities[0].neighbors.indices, np.memmap)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+from argparse import Namespace
+
+from ghanalyzer.algorithms.recommenders import PersonalRankRecommender
+from ghanalyzer.commands.recommend import Command as RecommendCommand
+from tests.utils import random_bigraph, get_users
+
+
+class RecommendCommandTest(unittest.TestCase):
+    def test_push_error(self):
+        graph = random_bigraph(40, 60, 300, random_seed=1)
+        recommender = PersonalRankRecommender(0.15, 1000, 1e-14, engine='push',
+            tolerance=1e-8)
+        recommender.train(graph)
+        args = Namespace(random_seed=0, recommendation_count=5)
+        users = get_users(graph)
+        error = RecommendCommand()._measure_push_error(recommender, users, 5, args)
+        self.assertEqual(error['sample_size'], 5)
+        self.assertLess(error['l1'], 1e-4)
+        self.assertGreaterEqual(error['overlap'], 0.8)
+        error = RecommendCommand()._measure_push_error(recommender, [], 5, args)
+        self.assertEqual(error['sample_size'], 0)
+        self.assertIsNone(error['l1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ghanalyzer.algorithms.recommenders import RandomRecommender, UserCFRecommender
+from ghanalyzer.evaluation.experiments import RecommenderTest
+from tests.utils import random_bigraph
+
+
+class RecommenderTestTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = random_bigraph(50, 60, 400, random_seed=1)
+
+    def run_test(self, recommender, **kwargs):
+        test = RecommenderTest(recommender, self.graph, 0.8, 5, random_seed=3,
+            batch_size=4, **kwargs)
+        test.run()
+        return test
+
+    def test_workers(self):
+        for create in (RandomRecommender, lambda: UserCFRecommender(5)):
+            serial = self.run_test(create())
+            parallel = self.run_test(create(), workers=3)
+            self.assertEqual(serial.report['recommendation'],
+                parallel.report['recommendation'])
+            self.assertTrue(serial.report['recommendation'])
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.path, 'checkpoint')
+        self.graph = random_bigraph(60, 80, 500, random_seed=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def create_test(self, n_neighbors=10, **kwargs):
+        return RecommenderTest(UserCFRecommender(n_neighbors), self.graph, 0.8, 20,
+            random_seed=3, batch_size=8, **kwargs)
+
+    def interrupt(self, test, batch_count):
+        recommend_batch = test._recommend_batch
+        calls = []
+        def _recommend_batch(start, users):
+            calls.append(start)
+            if len(calls) > batch_count:
+                raise Interrupted()
+            return recommend_batch(start, users)
+        test._recommend_batch = _recommend_batch
+        self.assertRaises(Interrupted, test.run, checkpoint=self.checkpoint)
+
+    def test_resume(self):
+        expected = self.create_test()
+        expected.run()
+        expected = expected.report['recommendation']
+
+        self.interrupt(self.create_test(), 3)
+        # a batch cut off while it was written is dropped
+        with open(os.path.join(self.checkpoint, 'batches.pickle'), 'ab') as output:
+            output.write('\x80\x02(garbage')
+        test = self.create_test()
+        calls = []
+        recommend_batch = test._recommend_batch
+        test._recommend_batch = lambda start, users: calls.append(start) or \
+            recommend_batch(start, users)
+        test.run(checkpoint=self.checkpoint)
+        self.assertEqual(test.report['recommendation'], expected)
+        self.assertNotIn(0, calls)
+
+        test = self.create_test(workers=2)
+        test.run(checkpoint=self.checkpoint)
+        self.assertEqual(test.report['recommendation'], expected)
+
+    def test_parameters(self):
+        self.create_test().run(checkpoint=self.checkpoint)
+        self.assertRaises(ValueError, self.create_test(n_neighbors=5).run,
+            checkpoint=self.checkpoint)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import networkx as nx
+
+from ghanalyzer.algorithms.graphs import AdjacencyMatrix
+from ghanalyzer.algorithms.graphfeatures import UserFeature, RepositoryFeature
+from ghanalyzer.io import load_accounts, load_repositories
+from ghanalyzer.models import User, Repository, Organization
+
+
+class NodeFeatureTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.random = random.Random(0)
+        self.write_items('Account.jsonl', 80, UserFeature.keys, range(40))
+        self.write_items('AccountSummary.jsonl', 30, UserFeature.keys[:2], range(40))
+        self.write_items('Repository.jsonl', 80, RepositoryFeature.keys, range(100, 140))
+        self.write_items('RepositorySummary.jsonl', 30, RepositoryFeature.keys[:3],
+            range(100, 140))
+        self.graph = nx.DiGraph()
+        for i in xrange(150):
+            self.graph.add_edge(User(self.random.randrange(45)),
+                Repository(self.random.randrange(100, 145)))
+            if i % 10 == 0:
+                self.graph.add_edge(Organization(self.random.randrange(40)),
+                    User(self.random.randrange(45)))
+        # attributes of graph nodes override the crawled ones
+        for n in self.graph.nodes()[:10]:
+            self.graph.node[n].update(followers=99, size=7)
+        self.adj = AdjacencyMatrix(self.graph)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def write_items(self, filename, count, keys, ids):
+        with open(os.path.join(self.path, filename), 'w') as output:
+            for i in xrange(count):
+                item = {'id': self.random.choice(ids), 'name': 'x%d' % i, 'meta': {'a': i}}
+                for k in keys:
+                    if self.random.random() < 0.8:
+                        item[k] = self.random.choice([0, 1, 2, 3.5, True, False, None])
+                output.write(json.dumps(item) + '\n')
+
+    def get_expected(self, cls, keys, entities):
+        """features of the node of each edge, built from per-node dicts"""
+        matrix = self.adj.matrix
+        features = np.zeros((matrix.nnz, len(keys)))
+        for r, u in enumerate(self.adj.nodes):
+            for e in xrange(matrix.indptr[r], matrix.indptr[r + 1]):
+                v = self.adj.nodes[matrix.indices[e]]
+                node = u if isinstance(u, cls) else v if isinstance(v, cls) else None
+                if node is not None:
+                    item = dict(entities.get(node.id, {}))
+                    item.update(self.graph.node[node])
+                    features[e] = [float(item.get(k) or 0) for k in keys]
+        return features
+
+    def test_features(self):
+        for feature, cls, load in ((UserFeature, User, load_accounts),
+                (RepositoryFeature, Repository, load_repositories)):
+            expected = self.get_expected(cls, feature.keys, load(self.path))
+            actual = feature(self.adj, data_path=self.path, standardize=False).features
+            self.assertTrue(np.allclose(actual, expected))
+            expected = self.get_expected(cls, feature.keys, {})
+            self.assertTrue(np.allclose(feature(self.adj, standardize=False).features, expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
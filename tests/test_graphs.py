@@ -0,0 +1,143 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import networkx as nx
+
+from ghanalyzer.algorithms import artifacts
+from ghanalyzer.algorithms.graphs import Bigraph, BigraphSimilarity
+from ghanalyzer.algorithms.recommenders import QuasiItemCFRecommender
+from ghanalyzer.models import User, Repository, Organization
+from tests.utils import random_bigraph
+
+
+def reference_matrix(bigraph):
+    """(source, target) matrix built edge by edge"""
+    matrix = np.zeros((len(bigraph.sources), len(bigraph.targets)))
+    for source, i in bigraph.source_indices.iteritems():
+        for target, data in bigraph.graph[source].iteritems():
+            j = bigraph.target_indices.get(target)
+            if j is not None:
+                matrix[i, j] = data.get(bigraph.weight, 1)
+    return matrix
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix.toarray() if hasattr(matrix, 'toarray') else matrix, dtype=float)
+    norms = np.sqrt((matrix ** 2).sum(axis=1))
+    norms[norms == 0] = 1
+    return matrix / norms[:, np.newaxis]
+
+
+class BigraphTest(unittest.TestCase):
+    def create_graph(self, graph_class):
+        generator = random.Random(0)
+        graph = graph_class()
+        for i in xrange(400):
+            u = User(generator.randrange(50))
+            v = generator.choice([Repository(generator.randrange(60)),
+                User(generator.randrange(50)), Organization(3), 'lang%d' % (i % 4)])
+            graph.add_edge(u, v, w=generator.choice([0, 1, 2.5]))
+            if i % 5 == 0:
+                graph.add_edge(v, u)
+        return graph
+
+    def test_matrix(self):
+        for graph_class in (nx.Graph, nx.DiGraph):
+            graph = self.create_graph(graph_class)
+            for source_cls, target_cls, weight in ((User, Repository, None),
+                    (User, Repository, 'w'), (Repository, User, 'w'), (User, User, None)):
+                bigraph = Bigraph(graph, source_cls, target_cls, weight=weight)
+                expected = reference_matrix(bigraph)
+                self.assertTrue(np.array_equal(bigraph.matrix.toarray(), expected))
+                # zero weights are not stored
+                self.assertEqual(bigraph.matrix.nnz, np.count_nonzero(expected))
+                self.assertTrue(np.array_equal(bigraph.transpose_matrix.toarray(), expected.T))
+
+    def test_other_nodes(self):
+        graph = nx.Graph()
+        graph.add_edge(User(1), Repository(2))
+        graph.add_edge(User(1), 'other')
+        bigraph = Bigraph(graph, object, Repository)
+        self.assertTrue(np.array_equal(bigraph.matrix.toarray(), reference_matrix(bigraph)))
+
+
+class BigraphSimilarityTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.graph = random_bigraph(50, 80, 600, random_seed=1)
+        self.bigraph = Bigraph(self.graph, User, Repository)
+        artifacts.configure_registry()
+
+    def tearDown(self):
+        artifacts.configure_registry()
+        shutil.rmtree(self.path, True)
+
+    def get_expected(self, features, feature_type):
+        if feature_type == 'source':
+            source, target = features, self.bigraph.transpose_matrix.dot(features)
+        else:
+            source, target = self.bigraph.matrix.dot(features), features
+        source, target = normalize_rows(source), normalize_rows(target)
+        parts = {'ss': source.dot(source.T), 'st': source.dot(target.T),
+            'tt': target.dot(target.T)}
+        parts['ts'] = parts['st'].T
+        return parts
+
+    def test_parts(self):
+        dense = np.random.RandomState(0).rand(len(self.bigraph.targets), 7)
+        for features, feature_type in ((self.bigraph.transpose_matrix, 'target'),
+                (self.bigraph.matrix, 'source'), (dense, 'target')):
+            expected = self.get_expected(features, feature_type)
+            for kwargs in ({'block_size': 7}, {'memmap_path': self.path, 'block_size': 9}):
+                similarity = BigraphSimilarity(self.bigraph, features, feature_type, **kwargs)
+                for part in ('ss', 'st', 'ts', 'tt'):
+                    kernel = getattr(similarity, part)
+                    rows = range(kernel.shape[0])
+                    self.assertTrue(np.allclose(kernel.get_rows(rows), expected[part]))
+                    self.assertTrue(np.allclose(kernel.get_row(3), expected[part][3]))
+                # memory-mapped files are unlinked once they are mapped
+                self.assertEqual(os.listdir(self.path), [])
+
+    def test_top_k(self):
+        features = self.bigraph.transpose_matrix
+        expected = self.get_expected(features, 'target')
+        similarity = BigraphSimilarity(self.bigraph, features, 'target', n_neighbors=5,
+            block_size=4)
+        for part in ('ss', 'st', 'ts', 'tt'):
+            kernel = getattr(similarity, part)
+            for i in xrange(kernel.shape[0]):
+                row = kernel.get_row(i)
+                stored = np.flatnonzero(row)
+                self.assertLessEqual(stored.size, 5)
+                self.assertTrue(np.allclose(row[stored], expected[part][i, stored]))
+                kth = np.sort(expected[part][i])[-5]
+                self.assertTrue((expected[part][i, stored] >= kth - 1e-12).all())
+
+    def test_lazy_parts(self):
+        registry = artifacts.get_registry()
+        similarity = BigraphSimilarity(self.bigraph, self.bigraph.transpose_matrix, 'target',
+            name='contributor', n_neighbors=3)
+        def get_parts():
+            return sorted(key[2][-2] for key in registry.artifacts
+                if key[1] == 'similarity-top-k')
+        self.assertEqual(get_parts(), [])
+        similarity.ss.get_row(0)
+        self.assertEqual(get_parts(), ['ss'])
+        similarity.ts.get_row(0)
+        self.assertEqual(get_parts(), ['ss', 'ts'])
+
+    def test_recommenders(self):
+        recommendations = []
+        for kwargs in ({}, {'memmap_path': self.path}):
+            recommender = QuasiItemCFRecommender(None, **kwargs)
+            recommender.train(self.graph)
+            recommendations.append([recommender.recommend(u, 10)
+                for u in self.bigraph.sources])
+        self.assertEqual(recommendations[0], recommendations[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+
+from ghanalyzer.algorithms.features import load_follow_features
+from ghanalyzer.io import (
+    load_accounts,
+    load_graph,
+    load_node_attribute_columns,
+    load_node_attributes,
+    load_repositories,
+    load_repository_descriptions,
+    open_repositories,
+    read_node_attributes,
+)
+from ghanalyzer.models import User, Repository
+from ghanalyzer.utils.jsonline import JsonLineData, get_line_chunks
+
+
+def get_edges(graph):
+    if graph.is_directed():
+        return {(u, v): data for u, v, data in graph.edges_iter(data=True)}
+    return {frozenset((u, v)): data for u, v, data in graph.edges_iter(data=True)}
+
+
+class DataDirectoryTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.random = random.Random(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def write_items(self, filename, items, mode='w'):
+        with open(os.path.join(self.path, filename), mode) as output:
+            for item in items:
+                output.write(json.dumps(item) + '\n')
+
+    def write_stargazers(self, count, mode='w'):
+        items = []
+        for i in xrange(count):
+            item = {'repo': {'id': self.random.randint(1, 50)},
+                'user': {'id': self.random.randint(100, 140)}}
+            if i % 3:
+                item['starred_at'] = u'2014-0%d' % (i % 9 + 1)
+            if i % 4 == 0:
+                item['weight'] = self.random.choice([1, 2.5])
+            if i % 5 == 0:
+                item['empty'] = None
+            if i % 7 == 0:
+                item['nested'] = {'a': [1, 2]}
+            items.append(item)
+        items.append({'repo': None, 'user': {'id': 1}})
+        self.write_items('Stargazer.jsonl', items, mode)
+
+    def write_follows(self, count):
+        self.write_items('Follow.jsonl', ({'follower': {'id': 'u%d' % self.random.randint(0, 20)},
+            'followee': {'id': 'u%d' % self.random.randint(0, 20)}, 'mutual': True}
+            for _ in xrange(count)))
+
+
+class GraphCacheTest(DataDirectoryTest):
+    def assert_same_graph(self, expected, actual):
+        self.assertEqual(type(expected), type(actual))
+        self.assertEqual(set(expected.nodes()), set(actual.nodes()))
+        expected, actual = get_edges(expected), get_edges(actual)
+        self.assertEqual(expected, actual)
+        for key, data in expected.iteritems():
+            self.assertEqual([type(data[k]) for k in sorted(data)],
+                [type(actual[key][k]) for k in sorted(data)])
+
+    def test_cache(self):
+        self.write_stargazers(300)
+        self.write_follows(300)
+        for graph_type in ('stargazer', 'follow'):
+            expected = load_graph(self.path, graph_type, use_cache=False)
+            self.assert_same_graph(expected, load_graph(self.path, graph_type))
+            # the second load reads the cache built by the first one
+            self.assert_same_graph(expected, load_graph(self.path, graph_type))
+        self.assertTrue(os.path.isdir(os.path.join(self.path, '.cache')))
+
+    def test_changed_file(self):
+        self.write_stargazers(300)
+        load_graph(self.path, 'stargazer')
+        self.write_stargazers(100)
+        self.assert_same_graph(load_graph(self.path, 'stargazer', use_cache=False),
+            load_graph(self.path, 'stargazer'))
+        self.write_items('Stargazer.jsonl', [{'repo': {'id': 'x'}, 'user': {'id': 1}}], 'a')
+        self.assert_same_graph(load_graph(self.path, 'stargazer', use_cache=False),
+            load_graph(self.path, 'stargazer'))
+
+
+class JsonLineDataTest(DataDirectoryTest):
+    def setUp(self):
+        super(JsonLineDataTest, self).setUp()
+        self.write_items('Repository.jsonl', ({'id': i % 700, 'description': u'd\xe9%d' % i,
+            'fork': i % 3 == 0, 'values': [i] * self.random.randint(0, 30)}
+            for i in xrange(1000)))
+        self.filename = os.path.join(self.path, 'Repository.jsonl')
+        with JsonLineData(self.filename) as data:
+            self.items = list(data)
+
+    def test_chunks(self):
+        size = os.path.getsize(self.filename)
+        for chunk_size in (1, 77, 4096, 10**9):
+            chunks = get_line_chunks(self.filename, chunk_size)
+            self.assertEqual(chunks[0][0], 0)
+            self.assertEqual(chunks[-1][1], size)
+            self.assertTrue(all(a[1] == b[0] for a, b in zip(chunks, chunks[1:])))
+
+    def test_workers(self):
+        for chunk_size in (1, 77, 4096, 10**9):
+            with JsonLineData(self.filename, workers=3, chunk_size=chunk_size) as data:
+                self.assertEqual(list(data), self.items)
+            with JsonLineData(self.filename, workers=3, chunk_size=chunk_size,
+                    ordered=False) as data:
+                self.assertEqual(sorted(data), sorted(self.items))
+
+    def test_keys(self):
+        with JsonLineData(self.filename, keys=('id', 'fork'), workers=2, chunk_size=100) as data:
+            self.assertEqual(list(data), [{'id': x['id'], 'fork': x['fork']} for x in self.items])
+
+    def test_loaders(self):
+        shutil.copy(self.filename, os.path.join(self.path, 'RepositorySummary.jsonl'))
+        self.assertEqual(load_repositories(self.path, workers=4), load_repositories(self.path))
+        self.assertEqual(load_repository_descriptions(self.path, workers=4),
+            load_repository_descriptions(self.path))
+        self.write_stargazers(300)
+        self.assertEqual(get_edges(load_graph(self.path, 'stargazer', workers=3)),
+            get_edges(load_graph(self.path, 'stargazer', use_cache=False)))
+
+    def test_follow_features(self):
+        self.write_follows(300)
+        users = [User('u%d' % i) for i in xrange(25)]
+        expected = load_follow_features(self.path, users)
+        for actual, matrix in zip(load_follow_features(self.path, users, workers=3), expected):
+            self.assertEqual((actual != matrix).nnz, 0)
+        self.assertGreater(expected[0].nnz, 0)
+
+
+class IndexedItemsTest(DataDirectoryTest):
+    def setUp(self):
+        super(IndexedItemsTest, self).setUp()
+        for filename, count, tag in (('Repository.jsonl', 200, 'a'),
+                ('RepositorySummary.jsonl', 100, 'b'), ('Account.jsonl', 150, 'c'),
+                ('AccountSummary.jsonl', 0, 'd')):
+            items = []
+            for i in xrange(count):
+                item = {'id': self.random.randint(1, 60), 'value_' + tag: i, 'tag': tag}
+                if i % 13 == 0:
+                    del item['id']
+                items.append(item)
+            self.write_items(filename, items)
+
+    def test_mapping(self):
+        expected = load_repositories(self.path)
+        with open_repositories(self.path) as repos:
+            self.assertEqual(len(repos), len(expected))
+            self.assertEqual(dict((k, repos[k]) for k in repos), dict(expected))
+            self.assertNotIn(1000, repos)
+            self.assertIsNone(repos.get('x'))
+        # the index built by the first open is reused
+        with open_repositories(self.path) as repos:
+            self.assertEqual(dict(repos.items()), dict(expected))
+
+    def test_node_attributes(self):
+        self.write_stargazers(300)
+        indexed = load_graph(self.path, 'stargazer')
+        loaded = indexed.copy()
+        load_node_attributes(self.path, indexed)
+        load_node_attributes(self.path, loaded, indexed=False)
+        for n in indexed:
+            self.assertEqual(indexed.node[n], loaded.node[n])
+
+    def test_attribute_columns(self):
+        accounts = load_accounts(self.path)
+        nodes = [User(i) for i in xrange(70)] + [Repository(i) for i in xrange(70)]
+        attributes = load_node_attribute_columns(self.path, nodes)
+        filename = os.path.join(self.path, 'attributes.npz')
+        attributes.save(filename)
+        saved = read_node_attributes(filename)
+        for n in nodes:
+            self.assertEqual(attributes.get(n), saved.get(n))
+            if isinstance(n, User):
+                expected = {k: v for k, v in accounts.get(n.id, {}).iteritems()
+                    if k != 'id' and v is not None}
+                self.assertEqual(attributes.get(n), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
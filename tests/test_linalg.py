@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from ghanalyzer.utils.linalg import SOLVERS, RestartSolver
+
+
+def random_transition(size, random_seed):
+    random = np.random.RandomState(random_seed)
+    weights = (random.rand(size, size) < 0.2) * random.rand(size, size)
+    weights[np.arange(size), (np.arange(size) + 1) % size] = 1
+    # transposed: column j holds the transition probabilities from node j
+    return csr_matrix((weights / weights.sum(axis=1)[:, np.newaxis]).T)
+
+
+class RestartSolverTest(unittest.TestCase):
+    def setUp(self):
+        self.transition = random_transition(30, 0)
+        self.alpha = 0.15
+        self.b = np.zeros((30, 3))
+        self.b[[0, 5, 7], [0, 1, 2]] = self.alpha
+        matrix = np.eye(30) - (1 - self.alpha) * self.transition.toarray()
+        self.expected = np.linalg.solve(matrix, self.b)
+
+    def test_solvers(self):
+        for method in SOLVERS:
+            solver = RestartSolver(self.transition, self.alpha, method=method, tol=1e-12)
+            self.assertTrue(np.allclose(solver.solve(self.b), self.expected, atol=1e-8))
+            self.assertTrue(np.allclose(solver.solve(self.b[:, 0]), self.expected[:, 0],
+                atol=1e-8))
+
+    def test_fallback(self):
+        for method in ('gmres', 'bicgstab'):
+            solver = RestartSolver(self.transition, self.alpha, method=method, tol=1e-15,
+                maxiter=1)
+            self.assertTrue(np.allclose(solver.solve(self.b), self.expected, atol=1e-10))
+            self.assertIsNotNone(solver.factor)
+
+    def test_method(self):
+        self.assertRaises(ValueError, RestartSolver, self.transition, self.alpha, 'cg')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import math
+import random
+import unittest
+
+import numpy as np
+
+from ghanalyzer.evaluation import metrics
+from ghanalyzer.models import User, Repository
+
+
+def random_report(case_count=100, repo_count=80, duplicates=False, random_seed=0):
+    generator = random.Random(random_seed)
+    repos = [Repository(i) for i in xrange(repo_count)]
+    records = []
+    for u in xrange(case_count):
+        sample = generator.sample(repos, 30)
+        training = sample[:generator.randrange(10)]
+        groundtruth = sample[10:10 + generator.randrange(10)]
+        others = [r for r in repos if r not in training]
+        recommended = generator.sample(others, generator.randrange(30))
+        if duplicates and recommended:
+            recommended.append(recommended[0])
+        if u % 7 == 0:  # training repositories may be recommended too
+            recommended.extend(training[:2])
+        records.append({'user': User(u), 'training': training,
+            'groundtruth': groundtruth, 'recommended': recommended})
+    return {'repos': repos, 'recommendation': records}
+
+def reference_frequencies(report, cutoff):
+    """(tp, tn, fp, fn) of each record and cutoff, computed record by record"""
+    repo_map = {r.id: i for i, r in enumerate(report['repos'])}
+    frequencies = np.empty((len(report['recommendation']), len(cutoff), 4))
+    for i, x in enumerate(report['recommendation']):
+        candidates = np.ones((len(repo_map),), dtype=bool)
+        candidates[[repo_map[r.id] for r in x['training']]] = False
+        groundtruth = np.zeros((len(repo_map),), dtype=bool)
+        groundtruth[[repo_map[r.id] for r in x['groundtruth']]] = True
+        recommended = np.zeros((len(repo_map),), dtype=int)
+        recommended[[repo_map[r.id] for r in x['recommended']]] = \
+            np.arange(len(x['recommended'])) + 1
+        for j, k in enumerate(cutoff):
+            positive = recommended > 0
+            if k is not None:
+                positive &= recommended <= k
+            negative = candidates & ~positive
+            tp = np.count_nonzero(positive & groundtruth)
+            fn = np.count_nonzero(negative & groundtruth)
+            frequencies[i, j] = (tp, np.count_nonzero(negative) - fn,
+                np.count_nonzero(positive) - tp, fn)
+    return frequencies
+
+def reference_average_precision(record):
+    groundtruth = set(record['groundtruth'])
+    if not groundtruth:
+        return np.nan
+    total, hits = 0.0, 0
+    for k, r in enumerate(record['recommended']):
+        if r in groundtruth:
+            hits += 1
+            total += float(hits) / (k + 1)
+    return total / len(groundtruth)
+
+def reference_ndcg(record, cutoff):
+    groundtruth = set(record['groundtruth'])
+    if not groundtruth:
+        return np.nan
+    recommended = record['recommended'][:cutoff]
+    dcg = sum(1 / math.log(k + 2, 2) for k, r in enumerate(recommended) if r in groundtruth)
+    ideal_count = len(groundtruth) if cutoff is None else min(cutoff, len(groundtruth))
+    return dcg / sum(1 / math.log(k + 2, 2) for k in xrange(ideal_count))
+
+def reference_reciprocal_rank(record):
+    groundtruth = set(record['groundtruth'])
+    if not groundtruth:
+        return np.nan
+    for k, r in enumerate(record['recommended']):
+        if r in groundtruth:
+            return 1.0 / (k + 1)
+    return 0.0
+
+
+class FrequenciesTest(unittest.TestCase):
+    def test_cutoffs(self):
+        for duplicates in (False, True):
+            report = random_report(duplicates=duplicates)
+            cutoff = (1, 5, 10, None, 100, 0)
+            self.assertTrue(np.array_equal(metrics.get_frequencies(report, cutoff),
+                reference_frequencies(report, cutoff)))
+
+    def test_single_cutoff(self):
+        report = random_report()
+        for cutoff in (None, 5):
+            frequencies = metrics.get_frequencies(report, cutoff)
+            self.assertEqual(frequencies.shape, (100, 4))
+            self.assertTrue(np.array_equal(frequencies,
+                reference_frequencies(report, (cutoff,))[:, 0, :]))
+
+    def test_iterator(self):
+        report = random_report()
+        expected = metrics.get_frequencies(report, (3, None))
+        report['recommendation'] = iter(report['recommendation'])
+        self.assertTrue(np.array_equal(metrics.get_frequencies(report, (3, None)), expected))
+
+    def test_empty(self):
+        report = {'repos': [Repository(1)], 'recommendation': []}
+        self.assertEqual(metrics.get_frequencies(report, (1, 2)).shape, (0, 2, 4))
+
+
+class RankMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.report = random_report(duplicates=True)
+        self.records = self.report['recommendation']
+        self.matrices = metrics.ReportMatrices(self.report)
+
+    def assert_close(self, actual, expected):
+        self.assertTrue(np.allclose(actual, expected, equal_nan=True))
+
+    def test_average_precision(self):
+        self.assert_close(metrics.get_average_precision(self.matrices),
+            [reference_average_precision(x) for x in self.records])
+        self.assertAlmostEqual(metrics.get_mean_average_precision(self.report),
+            np.nanmean([reference_average_precision(x) for x in self.records]))
+
+    def test_ndcg(self):
+        for cutoff in (None, 1, 5):
+            self.assert_close(metrics.get_ndcg(self.matrices, cutoff),
+                [reference_ndcg(x, cutoff) for x in self.records])
+
+    def test_reciprocal_rank(self):
+        self.assert_close(metrics.get_reciprocal_rank(self.matrices),
+            [reference_reciprocal_rank(x) for x in self.records])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import gc
+import copy
+import pickle
+import cPickle
+import unittest
+
+import numpy as np
+
+from ghanalyzer import models
+from ghanalyzer.algorithms.graphs import get_entity_positions, lookup_entity_positions
+from ghanalyzer.models import Account, User, Repository
+
+
+class EntityTest(unittest.TestCase):
+    def test_interned(self):
+        self.assertIs(User(1), User(1))
+        self.assertIsNot(User(1), Repository(1))
+        self.assertIsNot(User(1), Account(1))
+        self.assertEqual(User(1), User(1L))
+        self.assertNotEqual(User(1), Account(1))
+        self.assertFalse(hasattr(User(1), '__dict__'))
+
+    def test_copy(self):
+        user = User(5)
+        for module in (pickle, cPickle):
+            for protocol in (0, 2):
+                loaded = module.loads(module.dumps([user, Repository('a')], protocol))
+                self.assertIs(loaded[0], user)
+        self.assertIs(copy.deepcopy(user), user)
+
+    def test_hash_and_order(self):
+        self.assertEqual({User(3): 1}[User(3)], 1)
+        self.assertEqual(sorted([User(3), User(1)]), [User(1), User(3)])
+
+    def test_release(self):
+        user = User(123456)
+        index = user._index
+        del user
+        gc.collect()
+        self.assertNotIn((User, 123456), models._entities)
+        self.assertIn(index, models._free_indices)
+        # new entities take their indices from the free list
+        free = set(models._free_indices)
+        self.assertIn(User(654321)._index, free)
+
+    def test_positions(self):
+        nodes = [User(i) for i in xrange(5)] + [Repository(i) for i in xrange(3)]
+        positions = get_entity_positions(nodes)
+        self.assertEqual(positions.size, max(n._index for n in nodes) + 1)
+        indices = np.array([n._index for n in nodes])
+        self.assertEqual(lookup_entity_positions(positions, indices).tolist(), range(8))
+        other = User(1000)
+        self.assertEqual(lookup_entity_positions(positions,
+            np.array([-1, other._index, positions.size + 10])).tolist(), [-1, -1, -1])
+        self.assertIsNone(get_entity_positions(nodes + ['a']))
+
+
+if __name__ == '__main__':
+    unittest.main()
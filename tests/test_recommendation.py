@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from ghanalyzer.utils.recommendation import (
+    object_array,
+    recommend_by_scores,
+    top_indices,
+    top_k_rows,
+)
+
+
+class TopIndicesTest(unittest.TestCase):
+    def test_order(self):
+        scores = np.array([1., 5, 3, 4, 3])
+        self.assertEqual(top_indices(scores).tolist(), [1, 3, 2, 4, 0])
+        self.assertEqual(top_indices(scores, 3).tolist(), [1, 3, 2])
+        self.assertEqual(top_indices(scores, 10).tolist(), [1, 3, 2, 4, 0])
+        self.assertEqual(top_indices(scores, 0).tolist(), [])
+
+    def test_candidates(self):
+        scores = np.array([1., 5, 3, 4])
+        candidates = np.array([True, False, True, True])
+        self.assertEqual(top_indices(scores, 2, candidates).tolist(), [3, 2])
+        self.assertEqual(top_indices(scores, None, candidates).tolist(), [3, 2, 0])
+
+    def test_random(self):
+        random = np.random.RandomState(0)
+        scores = random.rand(100)
+        candidates = random.rand(100) < 0.5
+        expected = sorted(np.flatnonzero(candidates), key=lambda i: -scores[i])
+        for n in (1, 10, 100):
+            self.assertEqual(top_indices(scores, n, candidates).tolist(), expected[:n])
+
+    def test_recommend(self):
+        items = object_array(['a', 'b', 'c', 'd'])
+        self.assertEqual(recommend_by_scores(items, np.array([1., 5, 3, 4]), 2), ['b', 'd'])
+
+
+class TopKRowsTest(unittest.TestCase):
+    def test_ties_by_column(self):
+        matrix = csr_matrix(np.array([
+            [0, 2, 1, 2, 0, 2],
+            [3, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0],
+            [1, 1, 1, 1, 1, 1],
+        ], dtype=float))
+        indices, scores = top_k_rows(matrix, 3)
+        self.assertEqual(indices.tolist(), [[1, 3, 5], [0, -1, -1], [-1, -1, -1], [0, 1, 2]])
+        self.assertEqual(scores.tolist(), [[2, 2, 2], [3, 0, 0], [0, 0, 0], [1, 1, 1]])
+
+    def test_unsorted_indices(self):
+        matrix = csr_matrix((np.array([1., 4, 4, 2]), np.array([3, 2, 0, 1]),
+            np.array([0, 4])), shape=(1, 4))
+        indices, scores = top_k_rows(matrix, 2)
+        self.assertEqual(indices.tolist(), [[0, 2]])
+        self.assertEqual(scores.tolist(), [[4, 4]])
+
+    def test_random(self):
+        random = np.random.RandomState(0)
+        matrix = csr_matrix(random.randint(0, 4, size=(30, 20)).astype(float))
+        for k in (0, 1, 5, 25):
+            indices, scores = top_k_rows(matrix, k)
+            self.assertEqual(indices.shape, (30, k))
+            for u in xrange(30):
+                row = matrix[u].toarray().ravel()
+                expected = sorted(np.flatnonzero(row), key=lambda c: (-row[c], c))[:k]
+                self.assertEqual(indices[u, :len(expected)].tolist(), expected)
+                self.assertTrue((indices[u, len(expected):] == -1).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
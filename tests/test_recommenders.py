@@ -0,0 +1,169 @@
+import unittest
+
+import numpy as np
+
+from ghanalyzer.algorithms.recommenders import (
+    UserCFRecommender,
+    ItemCFRecommender,
+    PersonalRankRecommender,
+    SupervisedRWRecommender,
+)
+from tests.utils import random_bigraph, get_users
+
+
+class CFRecommenderTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = random_bigraph(40, 60, 300, random_seed=1)
+        self.users = get_users(self.graph)
+
+    def check_ranks(self, recommender):
+        recommender.train(self.graph)
+        recommendations = recommender.recommend_many(self.users)
+        for user, recommended in zip(self.users, recommendations):
+            rank = recommender.get_rank(user)
+            expected = set(r for r, score in rank.iteritems()
+                if score > 0 and r not in self.graph[user])
+            self.assertEqual(set(recommended), expected)
+            scores = [rank[r] for r in recommended]
+            self.assertTrue(all(a >= b - 1e-12 for a, b in zip(scores, scores[1:])))
+        for user, recommended in zip(self.users, recommender.recommend_many(self.users, 5)):
+            self.assertEqual(recommended, recommender.recommend(user, 5))
+            self.assertLessEqual(len(recommended), 5)
+        self.assertEqual(recommender.recommend_indices(self.users[:3], 4).shape, (3, 4))
+
+    def test_user_cf(self):
+        for n_neighbors in (None, 3, 10):
+            self.check_ranks(UserCFRecommender(n_neighbors=n_neighbors))
+
+    def test_item_cf(self):
+        for n_neighbors in (None, 3, 10):
+            self.check_ranks(ItemCFRecommender(n_neighbors=n_neighbors))
+
+    def test_weighted_ratings(self):
+        for cls in (UserCFRecommender, ItemCFRecommender):
+            recommender = cls()
+            recommender.train(self.graph)
+            expected = recommender.recommend_many(self.users)
+            # doubling all the ratings keeps the order of the scores
+            recommender.ratings = recommender.ratings * 2
+            self.assertEqual(recommender.recommend_many(self.users), expected)
+
+    def test_retrain(self):
+        for cls in (UserCFRecommender, ItemCFRecommender):
+            recommender = cls()
+            smaller = random_bigraph(20, 30, 100, random_seed=3)
+            recommender.train(smaller)
+            recommender.recommend_many(get_users(smaller))
+            # n_neighbors=None keeps meaning all the neighbors after training
+            self.assertIsNone(recommender.n_neighbors)
+            self.check_ranks(recommender)
+
+
+class PersonalRankTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = random_bigraph(40, 60, 300, random_seed=1)
+        self.users = get_users(self.graph)
+
+    def test_block_ranks(self):
+        recommender = PersonalRankRecommender(0.15, 100, 1e-10)
+        recommender.train(self.graph)
+        ranks = recommender._get_ranks(self.users)
+        for i, user in enumerate(self.users):
+            self.assertTrue(np.allclose(ranks[:, i], recommender._get_rank(user), atol=1e-8))
+
+    def test_recommend_many(self):
+        recommender = PersonalRankRecommender(0.15, 100, 1e-10, memory_limit=0.01)
+        recommender.train(self.graph)
+        self.assertLess(recommender._get_block_size(), len(self.users))
+        recommendations = recommender.recommend_many(self.users, 10)
+        for user, recommended in zip(self.users, recommendations):
+            self.assertEqual(recommended, recommender.recommend(user, 10))
+            self.assertFalse(set(recommended) & set(self.graph[user]))
+
+    def test_solvers(self):
+        power = PersonalRankRecommender(0.15, 1000, 1e-14)
+        power.train(self.graph)
+        for engine in ('direct', 'gmres', 'bicgstab'):
+            recommender = PersonalRankRecommender(0.15, 1000, 1e-14, engine=engine)
+            recommender.train(self.graph)
+            ranks = recommender._get_ranks(self.users[:5])
+            for i, user in enumerate(self.users[:5]):
+                self.assertTrue(np.allclose(ranks[:, i], power._get_rank(user), atol=1e-6))
+
+    def test_push(self):
+        errors = []
+        for tolerance in (1e-3, 1e-5, 1e-8):
+            recommender = PersonalRankRecommender(0.15, 1000, 1e-14, engine='push',
+                tolerance=tolerance)
+            recommender.train(self.graph)
+            rank = recommender._get_push_rank(self.users[0])
+            self.assertTrue((rank.data >= 0).all())
+            self.assertLessEqual(rank.sum(), 1 + 1e-9)
+            errors.append(np.mean([recommender.get_push_error(x, 10)['l1']
+                for x in self.users[:10]]))
+            recommended = recommender.recommend(self.users[0], 5)
+            self.assertFalse(set(recommended) & set(self.graph[self.users[0]]))
+        self.assertEqual(errors, sorted(errors, reverse=True))
+        self.assertLess(errors[-1], 1e-4)
+
+
+class SupervisedRWTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = random_bigraph(30, 40, 200, random_seed=2)
+        random = np.random.RandomState(0)
+        for _, _, data in self.graph.edges_iter(data=True):
+            data['w'] = random.rand()
+        self.users = get_users(self.graph)
+        self.w = np.array([0.3, -0.5])
+
+    def create_recommender(self, engine='power'):
+        recommender = SupervisedRWRecommender('', max_steps=2000, alpha=0.3,
+            epsilon=1e-13, weight_key=['w'], engine=engine)
+        recommender.train(self.graph)
+        return recommender
+
+    def test_transition_derivative(self):
+        recommender = self.create_recommender()
+        psi = recommender._get_edge_feature(recommender.node_indices[self.users[0]])
+        A, dA = recommender._get_edge_strength(psi, self.w)
+        Q0 = recommender._get_transition_probability(A)
+        dQ = recommender._get_transition_probability_derivative(A, dA)
+        h = 1e-7
+        for m in xrange(recommender.M):
+            w = self.w.copy()
+            w[m] += h
+            Q1 = recommender._get_transition_probability(recommender._get_edge_strength(psi, w)[0])
+            expected = (1 - recommender.alpha) * (Q1.data - Q0.data) / h
+            self.assertTrue(np.allclose(dQ[:, m], expected, atol=1e-5))
+
+    def test_stationary_derivative(self):
+        for engine in ('power', 'direct', 'gmres'):
+            recommender = self.create_recommender(engine)
+            root = recommender.node_indices[self.users[0]]
+            psi = recommender._get_edge_feature(root)
+            A, dA = recommender._get_edge_strength(psi, self.w)
+            Q0 = recommender._get_transition_probability(A)
+            dQ = recommender._get_transition_probability_derivative(A, dA)
+            P, dP = recommender._get_stationary(Q0, root, dQ)
+            self.assertEqual(dP.shape, (recommender.N, recommender.M))
+            h = 1e-6
+            for m in xrange(recommender.M):
+                w = self.w.copy()
+                w[m] += h
+                A1, _ = recommender._get_edge_strength(psi, w)
+                P1 = recommender._get_stationary(
+                    recommender._get_transition_probability(A1), root)
+                self.assertTrue(np.allclose(dP[:, m], (P1 - P) / h, atol=1e-5), engine)
+
+    def test_select_samples(self):
+        recommender = self.create_recommender()
+        repos = set(recommender.node_indices[r] for r in recommender.repos)
+        for user in self.users[:10]:
+            positive, negative = recommender._select_samples(user)
+            self.assertEqual(len(positive), len(negative))
+            self.assertTrue(set(negative) <= repos)
+            self.assertFalse(set(positive) & set(negative))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ghanalyzer.algorithms.recommenders import UserCFRecommender
+from ghanalyzer.evaluation import metrics
+from ghanalyzer.evaluation.experiments import RecommenderTest
+from ghanalyzer.io import (
+    read_binary_report,
+    write_binary_report,
+    read_jsonl_report,
+    JsonLineReportWriter,
+)
+from ghanalyzer.models import User, Repository
+from tests.test_metrics import random_report
+from tests.utils import random_bigraph
+
+
+class BinaryReportTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.report = random_report(case_count=30, duplicates=True)
+        self.report.update({
+            'users': [x['user'] for x in self.report['recommendation']],
+            'name': 'UserCF',
+            'recommendation_length': 30,
+            'recommender_parameters': {'n_neighbors': 10},
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def write_read(self, report):
+        path = os.path.join(self.path, 'report')
+        write_binary_report(path, report)
+        return read_binary_report(path)
+
+    def test_records(self):
+        report = self.write_read(self.report)
+        self.assertEqual(report['name'], 'UserCF')
+        self.assertEqual(report['recommender_parameters'], {'n_neighbors': 10})
+        self.assertEqual(list(report['repos']), self.report['repos'])
+        self.assertEqual(list(report['users']), self.report['users'])
+        self.assertEqual(len(report['recommendation']), 30)
+        self.assertEqual(list(report['recommendation']), self.report['recommendation'])
+        self.assertEqual(report['recommendation'][-1], self.report['recommendation'][-1])
+        # the index arrays are memory-mapped instead of read into memory
+        self.assertIsInstance(report['recommendation'].fields['recommended'][1], np.memmap)
+
+    def test_metrics(self):
+        report = self.write_read(self.report)
+        cutoff = (1, 5, None)
+        self.assertTrue(np.array_equal(metrics.get_frequencies(report, cutoff),
+            metrics.get_frequencies(self.report, cutoff)))
+        self.assertTrue(np.allclose(metrics.get_average_precision(report),
+            metrics.get_average_precision(self.report), equal_nan=True))
+
+    def test_string_ids(self):
+        record = {'user': User(u'x'), 'training': [], 'groundtruth': [Repository(u'a')],
+            'recommended': [Repository(u'a')]}
+        report = self.write_read({'users': [], 'repos': [Repository(u'a')],
+            'recommendation': [record]})
+        self.assertEqual(report['recommendation'][0], record)
+
+
+class JsonLineReportTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'report.jsonl')
+        self.graph = random_bigraph(60, 80, 500, random_seed=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def create_test(self):
+        return RecommenderTest(UserCFRecommender(10), self.graph, 0.8, 20, random_seed=3)
+
+    def test_streaming(self):
+        expected = self.create_test()
+        expected.run()
+        test = self.create_test()
+        with JsonLineReportWriter(self.filename, flush_every=7) as writer:
+            test.run(writer=writer)
+            test.report['name'] = 'UserCF'
+            writer.write_header(test.report)
+        self.assertNotIn('recommendation', test.report)
+
+        report = read_jsonl_report(self.filename)
+        records = expected.report['recommendation']
+        self.assertEqual(report['name'], 'UserCF')
+        self.assertEqual(report['repos'], expected.report['repos'])
+        self.assertEqual(report['record_count'], len(records))
+        self.assertEqual(list(report['recommendation']), records)
+        self.assertTrue(np.array_equal(metrics.get_frequencies(report, (1, 5, None)),
+            metrics.get_frequencies(expected.report, (1, 5, None))))
+
+    def test_interrupted(self):
+        records = random_report(case_count=5)['recommendation']
+        with JsonLineReportWriter(self.filename, flush_every=1) as writer:
+            writer.write_header({'name': 'X'})
+            for record in records[:3]:
+                writer.write(record)
+            # the header and complete records are readable before closing
+            report = read_jsonl_report(self.filename)
+            self.assertEqual(report['name'], 'X')
+            self.assertEqual(list(report['recommendation']), records[:3])
+        with open(self.filename, 'a') as output:
+            output.write('{"user": ')
+        self.assertEqual(list(read_jsonl_report(self.filename)['recommendation']),
+            records[:3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,242 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+from ghanalyzer.algorithms import artifacts
+from ghanalyzer.algorithms.graphs import Bigraph
+from ghanalyzer.algorithms.recommenders import (
+    UserCFRecommender,
+    ItemCFRecommender,
+    QuasiUserCFRecommender,
+    QuasiItemCFRecommender,
+)
+from ghanalyzer.algorithms.similarities import (
+    JaccardSimilarity,
+    MinHashSimilarity,
+    CosineLSHIndex,
+)
+from ghanalyzer.algorithms.similarities.hyperplane import read_cosine_index, load_cosine_index
+from ghanalyzer.algorithms.similarities.minhash import (
+    MERSENNE_PRIME,
+    get_minhash_signatures,
+    _iter_bucket_pairs,
+)
+from ghanalyzer.evaluation.metrics import get_neighbor_recall
+from ghanalyzer.models import User, Repository
+from tests.utils import random_bigraph, get_users
+
+
+def random_features(size, dimension, density, random_seed):
+    random = np.random.RandomState(random_seed)
+    features = (random.rand(size, dimension) < density) * random.rand(size, dimension)
+    return csr_matrix(features)
+
+def exact_jaccard(features):
+    sets = [set(features[u].indices) for u in xrange(features.shape[0])]
+    similarities = np.zeros((len(sets), len(sets)))
+    for u, a in enumerate(sets):
+        for v, b in enumerate(sets):
+            if a & b:
+                similarities[u, v] = len(a & b) / float(len(a | b))
+    return similarities
+
+
+class JaccardSimilarityTest(unittest.TestCase):
+    def setUp(self):
+        self.features = random_features(60, 30, 0.1, 0)
+        self.exact = exact_jaccard(self.features)
+
+    def test_matrix(self):
+        for block_size in (1, 7, 1000):
+            similarity = JaccardSimilarity(self.features, block_size=block_size)
+            self.assertTrue(np.allclose(similarity.matrix.toarray(), self.exact))
+            self.assertEqual(similarity.matrix.nnz, np.count_nonzero(self.exact))
+
+    def test_min_overlap(self):
+        similarity = JaccardSimilarity(self.features, min_overlap=2)
+        binary = (self.features > 0).astype(float)
+        overlaps = binary.dot(binary.T).toarray()
+        expected = np.where(overlaps >= 2, self.exact, 0)
+        self.assertTrue(np.allclose(similarity.matrix.toarray(), expected))
+
+    def test_nearest(self):
+        similarity = JaccardSimilarity(self.features, block_size=7)
+        for u in xrange(self.features.shape[0]):
+            scores = [s for _, s in similarity.nearest(u, 5)]
+            expected = sorted(np.delete(self.exact[u], u), reverse=True)[:len(scores)]
+            self.assertTrue(np.allclose(scores, expected))
+            self.assertTrue(all(v != u for v, _ in similarity.nearest(u, 5)))
+
+    def test_neighbor_table(self):
+        full = JaccardSimilarity(self.features)
+        for k in (1, 3, 100):
+            similarity = JaccardSimilarity(self.features, n_neighbors=k, block_size=9)
+            self.assertIsNone(similarity.matrix)
+            for u in xrange(self.features.shape[0]):
+                self.assertEqual([(int(v), s) for v, s in similarity.nearest(u, k)],
+                    [(int(v), s) for v, s in full.nearest(u, k)])
+            rows = [3, 5]
+            self.assertTrue(np.allclose(similarity.nearest_matrix(rows, k).toarray(),
+                full.nearest_matrix(rows, k).toarray()))
+
+
+class MinHashSimilarityTest(unittest.TestCase):
+    def setUp(self):
+        self.features = random_features(120, 60, 0.1, 1)
+        self.exact = JaccardSimilarity(self.features)
+
+    def test_signatures(self):
+        features = self.features.tolil()
+        features[5] = 0
+        features = features.tocsr()
+        features.eliminate_zeros()
+        signatures = get_minhash_signatures(features, 8, random_seed=3, block_size=7)
+        random = np.random.RandomState(3)
+        a = random.randint(1, MERSENNE_PRIME, size=8).astype(np.int64)
+        b = random.randint(0, MERSENNE_PRIME, size=8).astype(np.int64)
+        for u in xrange(features.shape[0]):
+            columns = features[u].indices.astype(np.int64)
+            if columns.size:
+                expected = ((columns[:, np.newaxis] * a + b) % MERSENNE_PRIME).min(axis=0)
+            else:
+                expected = np.repeat(MERSENNE_PRIME, 8)
+            self.assertEqual(signatures[u].tolist(), expected.tolist())
+
+    def test_bucket_pairs(self):
+        buckets = np.array([3, 1, 3, 2, 3, 1, 7])
+        expected = [(0, 2), (0, 4), (1, 5), (2, 4)]
+        for block_size in (1, 2, 3, 100):
+            chunks = list(_iter_bucket_pairs(buckets, block_size))
+            # a chunk holds at most block_size pairs or the pairs of one row
+            self.assertTrue(all(len(first) <= max(block_size, 2) for first, _ in chunks))
+            pairs = sorted(tuple(sorted(pair)) for first, second in chunks
+                for pair in zip(first.tolist(), second.tolist()))
+            self.assertEqual(pairs, expected)
+
+    def test_all_candidates(self):
+        # with many bands of one hash, every overlapping pair is a candidate
+        for min_overlap in (None, 2):
+            exact = JaccardSimilarity(self.features, min_overlap=min_overlap)
+            approximate = MinHashSimilarity(self.features, min_overlap=min_overlap,
+                n_bands=200, n_rows=1, random_seed=0, block_size=17, pair_block_size=50)
+            self.assertEqual(approximate.matrix.nnz, exact.matrix.nnz)
+            self.assertTrue(np.allclose(approximate.matrix.toarray(), exact.matrix.toarray()))
+
+    def test_candidate_similarities(self):
+        approximate = MinHashSimilarity(self.features, n_neighbors=5, n_bands=2, n_rows=4,
+            random_seed=0)
+        for u in xrange(self.features.shape[0]):
+            for v, score in approximate.nearest(u, 5):
+                self.assertAlmostEqual(score, self.exact.matrix[u, v])
+
+    def test_recall(self):
+        bigraph = Bigraph(random_bigraph(60, 40, 600), User, Repository)
+        exact = JaccardSimilarity(bigraph.matrix, n_neighbors=5)
+        recalls = [get_neighbor_recall(MinHashSimilarity(bigraph.matrix, n_neighbors=5,
+            n_bands=n_bands, n_rows=n_rows, random_seed=0), exact, 5)
+            for n_bands, n_rows in ((2, 4), (20, 2), (300, 1))]
+        self.assertTrue(0 <= recalls[0] < recalls[1] <= recalls[2])
+        self.assertEqual(recalls[2], 1.0)
+
+    def test_recommenders(self):
+        graph = random_bigraph(60, 90, 800)
+        users = get_users(graph)
+        for cls in (UserCFRecommender, ItemCFRecommender):
+            for n_neighbors in (None, 5):
+                exact = cls(n_neighbors=n_neighbors)
+                exact.train(graph)
+                approximate = cls(n_neighbors=n_neighbors, similarity_type='minhash',
+                    n_bands=300, n_rows=1, random_seed=1)
+                approximate.train(graph)
+                self.assertEqual(exact.recommend_many(users, 10),
+                    approximate.recommend_many(users, 10))
+        self.assertRaises(ValueError, UserCFRecommender, similarity_type='cosine')
+
+
+class CosineLSHIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        random = np.random.RandomState(0)
+        # clustered rows, so that near neighbors exist
+        centers = random.normal(size=(20, 30))
+        self.dense = normalize(centers[random.randint(0, 20, 2000)] +
+            0.3 * random.normal(size=(2000, 30)))
+        self.sparse = normalize(random_features(300, 50, 0.1, 2))
+
+    def tearDown(self):
+        artifacts.configure_registry()
+        shutil.rmtree(self.path, True)
+
+    def test_query(self):
+        index = CosineLSHIndex(self.dense, n_tables=8, n_bits=12, random_seed=1)
+        recalls, candidates = [], []
+        for q in xrange(50):
+            vector = self.dense[q]
+            exact = np.argsort(-self.dense.dot(vector), kind='mergesort')[:10]
+            rows, scores = index.query(vector, 10)
+            self.assertTrue(np.allclose(scores, self.dense[rows].dot(vector)))
+            self.assertTrue((np.diff(scores) <= 1e-12).all())
+            recalls.append(len(set(rows) & set(exact)) / 10.0)
+            candidates.append(index.get_candidates(vector).size)
+        self.assertGreater(np.mean(recalls), 0.9)
+        self.assertLess(np.mean(candidates), 1000)
+        rows, _ = index.query(self.dense[0], 10, excluded=[0])
+        self.assertNotIn(0, rows)
+
+    def test_save(self):
+        for features, q in ((self.sparse, 3), (self.dense, 7)):
+            index = CosineLSHIndex(features, n_tables=10, n_bits=4, random_seed=0)
+            filename = os.path.join(self.path, 'index.npz')
+            index.save(filename)
+            expected = index.query(features[q], 5)
+            actual = read_cosine_index(filename).query(features[q], 5)
+            self.assertEqual(actual[0].tolist(), expected[0].tolist())
+            self.assertTrue(np.allclose(actual[1], expected[1]))
+
+    def test_load(self):
+        filename = os.path.join(self.path, 'index.npz')
+        index = load_cosine_index(filename, self.sparse, n_tables=3, n_bits=4, random_seed=2)
+        # any seed is accepted if none is asked for
+        loaded = load_cosine_index(filename, self.sparse, n_tables=3, n_bits=4)
+        self.assertTrue((loaded.planes == index.planes).all())
+        # other features are indexed again
+        loaded = load_cosine_index(filename, self.sparse[:200], n_tables=3, n_bits=4)
+        self.assertEqual(loaded.size, 200)
+
+    def test_recommenders(self):
+        graph = random_bigraph(60, 90, 800)
+        users = get_users(graph)
+        for cls in (QuasiUserCFRecommender, QuasiItemCFRecommender):
+            exact = cls(None)
+            exact.train(graph)
+            # with many tables of 1 bit, almost all repositories are candidates
+            approximate = cls(None, n_tables=30, n_bits=1, index_path=self.path)
+            approximate.train(graph)
+            for user in users:
+                scores = exact.get_scores(user)
+                indices = exact.bigraph.target_indices
+                self.assertTrue(np.allclose(
+                    [scores[indices[r]] for r in exact.recommend(user, 10)],
+                    [scores[indices[r]] for r in approximate.recommend(user, 10)]))
+
+    def test_index_files(self):
+        graph = random_bigraph(60, 90, 800)
+        for cls in (QuasiUserCFRecommender, QuasiItemCFRecommender):
+            cls(None, n_tables=3, n_bits=4, index_path=self.path).train(graph)
+        recommender = QuasiUserCFRecommender(None, n_tables=3, n_bits=4, random_seed=5,
+            index_path=self.path)
+        recommender.train(graph)
+        self.assertEqual(recommender.index.random_seed, 5)
+        # indexes of other similarities or parameters do not overwrite each other
+        filenames = sorted(os.listdir(self.path))
+        self.assertEqual(len(filenames), 3)
+        self.assertEqual(sum(x.startswith('QuasiUserCFRecommender-') for x in filenames), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,18 @@
+import random
+
+import networkx as nx
+
+from ghanalyzer.models import User, Repository
+
+
+def random_bigraph(user_count, repo_count, edge_count, random_seed=0):
+    """return a random undirected graph of users and repositories"""
+    generator = random.Random(random_seed)
+    graph = nx.Graph()
+    for _ in xrange(edge_count):
+        graph.add_edge(User(generator.randrange(user_count)),
+            Repository(generator.randrange(repo_count)), weight=1.0)
+    return graph
+
+def get_users(graph):
+    return [n for n in graph if isinstance(n, User)]